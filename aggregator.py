@@ -0,0 +1,330 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from stats import RunningMoments
+
+
+TICKET_FIELDS = [
+    "total_time_min",
+    "total_cost_eur",
+    "total_errors",
+    "total_hallucinations",
+    "num_documents_consulted",
+    "response_words",
+    "current_stress",
+    "time_write_response_min",
+]
+
+DOC_FIELDS = [
+    "complexity",
+    "num_pages",
+    "doc_words",
+    "read_doc_time_min",
+    "open_doc_time_min",
+    "navigation_time_min",
+    "wait_time_min",
+    "processing_time_min",
+    "errors",
+]
+
+SKETCH_FIELDS = ["total_time_min", "total_cost_eur"]
+
+# avg_doc_complexity è arrotondata a 2 decimali: un bin per centesimo
+COMPLEXITY_SCALE = 100
+COMPLEXITY_BINS = 10 * COMPLEXITY_SCALE + 1
+
+
+def complexity_bins(avg_complexity):
+    """Bin di complessità media (centesimi) di un array di ticket."""
+    return np.clip(np.rint(np.asarray(avg_complexity) * COMPLEXITY_SCALE).astype(np.int64),
+                   0, COMPLEXITY_BINS - 1)
+
+
+def _complexity_to_dict(counts, costs):
+    nonzero = np.flatnonzero(counts)
+    return {"index": nonzero.tolist(), "counts": counts[nonzero].tolist(), "costs": costs[nonzero].tolist()}
+
+
+def _complexity_from_dict(data):
+    counts = np.zeros(COMPLEXITY_BINS, dtype=np.int64)
+    costs = np.zeros(COMPLEXITY_BINS)
+    counts[data["index"]] = data["counts"]
+    costs[data["index"]] = data["costs"]
+    return counts, costs
+
+
+class QuantileSketch:
+    """
+    Sketch dei quantili a bucket logaritmici (DDSketch): ogni quantile è
+    stimato con errore relativo al più `alpha`. Lo stato è un istogramma a
+    dimensione fissa, quindi due sketch si uniscono sommando i conteggi.
+    Pensato per grandezze non negative come tempi e costi.
+    """
+
+    __slots__ = ("alpha", "min_value", "max_value", "counts", "zero_count")
+
+    def __init__(self, alpha=0.01, min_value=1e-2, max_value=1e7):
+        self.alpha = alpha
+        self.min_value = min_value
+        self.max_value = max_value
+        self.counts = np.zeros(self._index(np.array([max_value]))[0] + 1, dtype=np.int64)
+        self.zero_count = 0
+
+    @property
+    def gamma(self):
+        return (1 + self.alpha) / (1 - self.alpha)
+
+    def _index(self, values):
+        log_gamma = math.log(self.gamma)
+        return np.ceil((np.log(values) - math.log(self.min_value)) / log_gamma).astype(np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        small = values < self.min_value
+        self.zero_count += int(small.sum())
+        index = np.minimum(self._index(values[~small]), len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.zero_count += other.zero_count
+
+    @property
+    def count(self):
+        return int(self.counts.sum()) + self.zero_count
+
+    def quantile(self, q):
+        """Quantile q in [0, 1] (nan se lo sketch è vuoto)."""
+        total = self.count
+        if total == 0:
+            return float("nan")
+        rank = q * (total - 1)
+        if rank < self.zero_count:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), rank - self.zero_count, side="right"))
+        # punto medio (in senso relativo) del bucket
+        return self.min_value * self.gamma ** index * 2 / (1 + self.gamma)
+
+    def to_dict(self):
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "alpha": self.alpha,
+            "min_value": self.min_value,
+            "max_value": self.max_value,
+            "zero_count": self.zero_count,
+            "index": nonzero.tolist(),
+            "counts": self.counts[nonzero].tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["alpha"], data["min_value"], data["max_value"])
+        sketch.zero_count = data["zero_count"]
+        sketch.counts[data["index"]] = data["counts"]
+        return sketch
+
+
+class AgentAggregate:
+    """
+    Statistiche incrementali dei ticket di un tipo di agente: conteggi,
+    momenti (Welford) e min/max dei campi numerici, quantili di tempo e
+    costo per profilo, istogramma delle sorgenti dei documenti e conteggi e
+    costi per complessità media, in totale e per profilo (statistiche
+    sufficienti dei KPI economici, vedi kpi.economics_statistics).
+    """
+
+    def __init__(self):
+        self.tickets = 0
+        self.late = 0
+        self.profiles = {}
+        self.moments = {f: RunningMoments() for f in TICKET_FIELDS}
+        self.minimum = {f: math.inf for f in SKETCH_FIELDS}
+        self.maximum = {f: -math.inf for f in SKETCH_FIELDS}
+        self.sketches = {}
+        self.documents = 0
+        self.memory_overload = 0
+        self.doc_moments = {f: RunningMoments() for f in DOC_FIELDS}
+        self.sources = {}
+        self.complexity_counts = np.zeros(COMPLEXITY_BINS, dtype=np.int64)
+        self.complexity_costs = np.zeros(COMPLEXITY_BINS)
+        # profilo -> (conteggi, costi) per bin di complessità
+        self.profile_complexity = {}
+
+    def _profile_complexity(self, profile):
+        if profile not in self.profile_complexity:
+            self.profile_complexity[profile] = (np.zeros(COMPLEXITY_BINS, dtype=np.int64), np.zeros(COMPLEXITY_BINS))
+        return self.profile_complexity[profile]
+
+    def _profile_sketches(self, profile):
+        if profile not in self.sketches:
+            self.sketches[profile] = {f: QuantileSketch() for f in SKETCH_FIELDS}
+        return self.sketches[profile]
+
+    def update(self, tickets, documents):
+        """Aggiunge un blocco di ticket (tabelle colonnari tickets/documents)."""
+        n = len(tickets["ticket_id"])
+        if n == 0:
+            return
+        self.tickets += n
+        self.late += int(np.sum(tickets["is_late"]))
+        for field in TICKET_FIELDS:
+            if field in tickets:
+                self.moments[field].update(tickets[field])
+        for field in SKETCH_FIELDS:
+            self.minimum[field] = min(self.minimum[field], float(np.min(tickets[field])))
+            self.maximum[field] = max(self.maximum[field], float(np.max(tickets[field])))
+
+        bins = complexity_bins(tickets["avg_doc_complexity"])
+        costs = np.asarray(tickets["total_cost_eur"], dtype=float)
+        self.complexity_counts += np.bincount(bins, minlength=COMPLEXITY_BINS)
+        self.complexity_costs += np.bincount(bins, weights=costs, minlength=COMPLEXITY_BINS)
+
+        profiles, codes = np.unique(tickets["profile"], return_inverse=True)
+        for j, profile in enumerate(profiles.tolist()):
+            mask = codes == j
+            self.profiles[profile] = self.profiles.get(profile, 0) + int(mask.sum())
+            for field, sketch in self._profile_sketches(profile).items():
+                sketch.update(tickets[field][mask])
+            counts, cost_sums = self._profile_complexity(profile)
+            counts += np.bincount(bins[mask], minlength=COMPLEXITY_BINS)
+            cost_sums += np.bincount(bins[mask], weights=costs[mask], minlength=COMPLEXITY_BINS)
+
+        if len(documents.get("ticket_id", ())):
+            self.documents += len(documents["ticket_id"])
+            self.memory_overload += int(np.sum(documents["memory_overload"]))
+            for field in DOC_FIELDS:
+                self.doc_moments[field].update(documents[field])
+            sources, counts = np.unique(documents["document_source"], return_counts=True)
+            for source, count in zip(sources.tolist(), counts.tolist()):
+                self.sources[source] = self.sources.get(source, 0) + count
+
+    def merge(self, other):
+        self.tickets += other.tickets
+        self.late += other.late
+        for profile, count in other.profiles.items():
+            self.profiles[profile] = self.profiles.get(profile, 0) + count
+        for field in TICKET_FIELDS:
+            self.moments[field].merge(other.moments[field])
+        for field in SKETCH_FIELDS:
+            self.minimum[field] = min(self.minimum[field], other.minimum[field])
+            self.maximum[field] = max(self.maximum[field], other.maximum[field])
+        for profile, sketches in other.sketches.items():
+            for field, sketch in self._profile_sketches(profile).items():
+                sketch.merge(sketches[field])
+        self.documents += other.documents
+        self.memory_overload += other.memory_overload
+        for field in DOC_FIELDS:
+            self.doc_moments[field].merge(other.doc_moments[field])
+        for source, count in other.sources.items():
+            self.sources[source] = self.sources.get(source, 0) + count
+        self.complexity_counts += other.complexity_counts
+        self.complexity_costs += other.complexity_costs
+        for profile, (counts, costs) in other.profile_complexity.items():
+            own_counts, own_costs = self._profile_complexity(profile)
+            own_counts += counts
+            own_costs += costs
+
+    def quantile(self, field, q, profile=None):
+        """Quantile di tempo o costo, per un profilo o su tutti i ticket."""
+        if profile is not None:
+            return self.sketches[profile][field].quantile(q)
+        merged = QuantileSketch()
+        for sketches in self.sketches.values():
+            merged.merge(sketches[field])
+        return merged.quantile(q)
+
+    def to_dict(self):
+        return {
+            "tickets": self.tickets,
+            "late": self.late,
+            "profiles": self.profiles,
+            "moments": {f: m.to_dict() for f, m in self.moments.items()},
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "sketches": {p: {f: s.to_dict() for f, s in sk.items()} for p, sk in self.sketches.items()},
+            "documents": self.documents,
+            "memory_overload": self.memory_overload,
+            "doc_moments": {f: m.to_dict() for f, m in self.doc_moments.items()},
+            "sources": self.sources,
+            "complexity": _complexity_to_dict(self.complexity_counts, self.complexity_costs),
+            "profile_complexity": {
+                p: _complexity_to_dict(counts, costs) for p, (counts, costs) in self.profile_complexity.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        agg = cls()
+        agg.tickets = data["tickets"]
+        agg.late = data["late"]
+        agg.profiles = dict(data["profiles"])
+        agg.moments = {f: RunningMoments.from_dict(m) for f, m in data["moments"].items()}
+        agg.minimum = dict(data["minimum"])
+        agg.maximum = dict(data["maximum"])
+        agg.sketches = {
+            p: {f: QuantileSketch.from_dict(s) for f, s in sk.items()} for p, sk in data["sketches"].items()
+        }
+        agg.documents = data["documents"]
+        agg.memory_overload = data["memory_overload"]
+        agg.doc_moments = {f: RunningMoments.from_dict(m) for f, m in data["doc_moments"].items()}
+        agg.sources = dict(data["sources"])
+        agg.complexity_counts, agg.complexity_costs = _complexity_from_dict(data["complexity"])
+        # i riepiloghi salvati prima delle statistiche per profilo non le hanno
+        agg.profile_complexity = {
+            p: _complexity_from_dict(c) for p, c in data.get("profile_complexity", {}).items()
+        }
+        return agg
+
+
+class KpiAggregator:
+    """
+    Aggregatore dei KPI di un run, alimentato blocco per blocco da
+    simulate_tickets: un AgentAggregate per tipo di agente ("human", "ai").
+    Lo stato è unibile (merge) e si salva in JSON accanto ai risultati, così
+    il riepilogo non richiede di rileggere i ticket. results è la firma
+    (results_io.results_signature) dei file dei risultati descritti: chi
+    legge il riepilogo la confronta con quella dei file presenti.
+    """
+
+    AGENTS = ("human", "ai")
+
+    def __init__(self):
+        self.agents = {agent: AgentAggregate() for agent in self.AGENTS}
+        self.results = None
+
+    def update(self, agent, tickets, documents):
+        self.agents[agent].update(tickets, documents)
+
+    def merge(self, other):
+        for agent in self.AGENTS:
+            self.agents[agent].merge(other.agents[agent])
+        # l'unione descrive altri file: la firma va ricalcolata da chi li scrive
+        self.results = None
+
+    def to_dict(self):
+        data = {agent: agg.to_dict() for agent, agg in self.agents.items()}
+        if self.results is not None:
+            data["results"] = self.results
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregator = cls()
+        aggregator.agents = {agent: AgentAggregate.from_dict(data[agent]) for agent in cls.AGENTS}
+        aggregator.results = data.get("results")
+        return aggregator
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        # sostituzione atomica: il file resta sempre leggibile
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
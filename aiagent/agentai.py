@@ -1,12 +1,19 @@
 import numpy as np
 import yaml
 import random
+from cognitiveagent.agent import uniform_int, choose_sources, ragged_index, doc_draws
+from cognitiveagent.params import GENERAL_KEYS, compile_config
+from aiagent.backend import RAGBackend
 
 WORDS_PER_PAGE = 300
+HOURLY_RATE = 35  # ipotetico costo orario umano+AI
+LATE_FACTOR = 1.05  # rallentamento fine giornata (ridotto grazie all'AI)
 
 class RAGHumanAgent:
-    def __init__(self, profile, config, is_late=False, current_stress=0.0, avg_complexity=None):
+    def __init__(self, profile, config, is_late=False, current_stress=0.0, avg_complexity=None, rng=None):
         self.profile = profile
+        # generatore casuale: di default lo stato globale di np.random
+        self.rng = np.random if rng is None else rng
         self.config = config
         self.is_late = is_late
         self.current_stress = current_stress
@@ -34,8 +41,10 @@ class RAGHumanAgent:
         self.stress_tolerance = ai['stress_tolerance']
         self.retrieval_latency_sec = ai['retrieval_latency_sec']
         self.generation_latency_sec = ai['generation_latency_sec']
+        # backend condiviso opzionale (ai_agent.backend): latenze con contesa
+        self.backend = RAGBackend.from_config(config)
 
-        self.hourly_rate = 35  # ipotetico costo orario umano+AI
+        self.hourly_rate = HOURLY_RATE
 
         self.document_sources = list(config['document_sources'].keys())
         self.doc_source_probs = [
@@ -47,11 +56,11 @@ class RAGHumanAgent:
         self.wait_times = config.get('wait_times_sec', {})
 
         if self.is_late:
-            self.avg_nav_time_per_click_sec *= 1.05
-            self.avg_read_speed_words_per_sec /= 1.05
-            self.avg_cognitive_processing_sec *= 1.05
-            self.error_rate *= 1.05
-            self.avg_clicks_to_find_doc *= 1.05
+            self.avg_nav_time_per_click_sec *= LATE_FACTOR
+            self.avg_read_speed_words_per_sec /= LATE_FACTOR
+            self.avg_cognitive_processing_sec *= LATE_FACTOR
+            self.error_rate *= LATE_FACTOR
+            self.avg_clicks_to_find_doc *= LATE_FACTOR
 
     def simulate_search(self, response_words):
         total_wait_time_sec = 0
@@ -63,18 +72,18 @@ class RAGHumanAgent:
         hallucinations_total = 0
         documents_details = []
 
-        num_documents = np.random.randint(self.min_docs, self.max_docs + 1)
+        num_documents = self.rng.randint(self.min_docs, self.max_docs + 1)
 
         for i in range(num_documents):
             # scegli la sorgente
-            source = np.random.choice(self.document_sources, p=self.doc_source_probs)
+            source = self.rng.choice(self.document_sources, p=self.doc_source_probs)
             source_conf = self.doc_sources_config[source]
 
             # estrai complessità e dimensione, riduci la complessità grazie al RAG
             original_complexity = self.avg_complexity
             complexity = max(1, original_complexity * 0.7)  # RAG riduce la complessità percepita
 
-            num_pages = np.random.randint(
+            num_pages = self.rng.randint(
                 source_conf['pages_range'][0],
                 source_conf['pages_range'][1] + 1
             )
@@ -83,18 +92,18 @@ class RAGHumanAgent:
             wait_time_sec = 0
             if source in ["teams", "email"] and self.wait_times:
                 w = self.wait_times.get(source, {'min': 0, 'max': 0})
-                wait_time_sec = np.random.uniform(w['min'], w['max'])
+                wait_time_sec = self.rng.uniform(w['min'], w['max'])
 
             effective_error_rate = min(
                 self.error_rate + max(0, self.current_stress - self.stress_tolerance), 1.0
             )
             repeats = 1
-            if np.random.rand() < effective_error_rate:
+            if self.rng.rand() < effective_error_rate:
                 repeats += 1
             if self.confidence < 0.6:
                 repeats += 1
 
-            clicks = np.random.normal(self.avg_clicks_to_find_doc, 0.5)
+            clicks = self.rng.normal(self.avg_clicks_to_find_doc, 0.5)
             time_navigation = clicks * self.avg_nav_time_per_click_sec * repeats
             time_open_doc = self.avg_doc_open_time_sec * repeats
 
@@ -112,8 +121,12 @@ class RAGHumanAgent:
             time_processing = self.avg_cognitive_processing_sec * repeats * load_multiplier
 
             # Latenza AI
-            retrieval_time = self.retrieval_latency_sec
-            generation_time = self.generation_latency_sec
+            if self.backend is not None:
+                retrieval, generation = self.backend.sample(self.rng, 1)
+                retrieval_time, generation_time = float(retrieval[0]), float(generation[0])
+            else:
+                retrieval_time = self.retrieval_latency_sec
+                generation_time = self.generation_latency_sec
 
             total_wait_time_sec += wait_time_sec + retrieval_time + generation_time
             total_navigation_sec += time_navigation
@@ -121,7 +134,7 @@ class RAGHumanAgent:
             total_read_sec += time_read_doc
             total_processing_sec += time_processing
             errors_total += 1 if repeats > 1 else 0
-            hallucinations_total += 1 if np.random.rand() < self.hallucination_rate else 0
+            hallucinations_total += 1 if self.rng.rand() < self.hallucination_rate else 0
 
             documents_details.append({
                 "doc_number": i + 1,
@@ -172,6 +185,169 @@ class RAGHumanAgent:
 
         return result
 
+# --- Motore vettoriale (batch) ---
+
+AI_KEYS = [
+    'context_knowledge_factor',
+    'error_rate',
+    'hallucination_rate',
+    'short_term_memory_capacity',
+    'confidence',
+    'stress_tolerance',
+    'retrieval_latency_sec',
+    'generation_latency_sec',
+]
+
+
+def batch_params(config, is_late, current_stress, avg_complexity, response_words, variation=None):
+    """
+    Costruisce i parametri di simulate_batch, replicando quello che
+    RAGHumanAgent.__init__ fa ticket per ticket (il profilo non influisce
+    sull'agente AI). config è il dizionario YAML o una CompiledConfig.
+    """
+    cc = compile_config(config)
+    is_late = np.asarray(is_late, dtype=bool)
+    n = len(is_late)
+
+    general = variation['general'] if variation is not None else np.broadcast_to(cc.general, (n, len(GENERAL_KEYS)))
+    params = {key: general[:, j].copy() for j, key in enumerate(GENERAL_KEYS)}
+    params['min_docs'] = cc.min_docs
+    params['max_docs'] = cc.max_docs
+    for key in AI_KEYS:
+        params[key] = np.full(n, float(cc.ai_agent[key]))
+    params['hourly_rate'] = HOURLY_RATE
+    params['backend'] = RAGBackend.from_config(cc)
+
+    late = np.where(is_late, LATE_FACTOR, 1.0)
+    params['avg_nav_time_per_click_sec'] *= late
+    params['avg_read_speed_words_per_sec'] /= late
+    params['avg_cognitive_processing_sec'] *= late
+    params['error_rate'] *= late
+    params['avg_clicks_to_find_doc'] *= late
+
+    params['source_names'] = cc.source_names
+    params['source_probs'] = variation['source_probs'] if variation is not None else cc.source_probs
+    params['pages_range'] = cc.pages_range
+    params['wait_range'] = cc.wait_range
+    params['current_stress'] = np.asarray(current_stress, dtype=float)
+    params['avg_complexity'] = np.asarray(avg_complexity, dtype=float)
+    params['response_words'] = np.asarray(response_words, dtype=float)
+    return params
+
+
+def simulate_batch(params, n_tickets, rng=None, draws=None):
+    """
+    Versione vettoriale di RAGHumanAgent.simulate_search per n_tickets
+    ticket, con la stessa struttura di output del motore batch Human
+    (documenti in array piatti indicizzati da doc_offsets). draws
+    (opzionale) sono i numeri casuali comuni di common_draws; le
+    allucinazioni restano estratte da rng.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n = n_tickets
+
+    def per_ticket(key):
+        return np.broadcast_to(np.asarray(params[key], dtype=float), (n,))
+
+    u_count = draws['count'] if draws is not None else rng.random(n)
+    n_docs = uniform_int(u_count, params['min_docs'], params['max_docs'])
+    offsets, t, doc_pos = ragged_index(n_docs)
+    n_total = len(t)
+
+    def draw(key, normal=False):
+        return doc_draws(draws, key, rng, t, doc_pos, normal)
+
+    src = choose_sources(draw('source'), np.asarray(params['source_probs'], dtype=float), t)
+    pages_range = params['pages_range']
+    num_pages = uniform_int(draw('pages'), pages_range[src, 0], pages_range[src, 1])
+    doc_words = num_pages * WORDS_PER_PAGE
+    wait_range = params['wait_range']
+    wait_time_sec = wait_range[src, 0] + (wait_range[src, 1] - wait_range[src, 0]) * draw('wait')
+
+    effective_error_rate = np.minimum(
+        per_ticket('error_rate') + np.maximum(0, per_ticket('current_stress') - per_ticket('stress_tolerance')), 1.0
+    )
+    repeats = 1 + (draw('error') < effective_error_rate[t]) + (per_ticket('confidence') < 0.6)[t]
+
+    clicks = per_ticket('avg_clicks_to_find_doc')[t] + 0.5 * draw('clicks', normal=True)
+    time_navigation = clicks * per_ticket('avg_nav_time_per_click_sec')[t] * repeats
+    time_open_doc = per_ticket('avg_doc_open_time_sec')[t] * repeats
+
+    # RAG riduce la complessità percepita
+    original_complexity = per_ticket('avg_complexity')
+    ticket_complexity = np.maximum(1, original_complexity * 0.7)
+    complexity = ticket_complexity[t]
+    memory_overload = complexity * num_pages > per_ticket('short_term_memory_capacity')[t]
+    load_multiplier = (1.0 + complexity / 10.0) * np.where(memory_overload, 1.2, 1.0)
+
+    effective_read_speed = per_ticket('avg_read_speed_words_per_sec') * (1 + per_ticket('context_knowledge_factor'))
+    time_read_doc = doc_words / effective_read_speed[t] * repeats * load_multiplier
+    time_processing = per_ticket('avg_cognitive_processing_sec')[t] * repeats * load_multiplier
+    errors = (repeats > 1).astype(np.int64)
+
+    # Latenza AI: costante o, con un backend condiviso, con coda e code lunghe
+    backend = params.get('backend')
+    if backend is not None:
+        retrieval_time, generation_time = backend.sample(rng, n_total)
+    else:
+        retrieval_time = per_ticket('retrieval_latency_sec')[t]
+        generation_time = per_ticket('generation_latency_sec')[t]
+
+    hallucinated = (rng.random(n_total) < per_ticket('hallucination_rate')[t]).astype(np.int64)
+    # come nel loop scalare, il flag del documento segnala se il ticket ha
+    # già avuto almeno un'allucinazione fino a quel documento compreso
+    cumulative = np.cumsum(hallucinated)
+    ticket_base = np.concatenate(([0], cumulative))[offsets[:-1]]
+    hallucination = (cumulative - ticket_base[t] > 0).astype(np.int64)
+
+    def ticket_sum(values):
+        return np.bincount(t, weights=values, minlength=n)
+
+    time_write_response_sec = per_ticket('response_words') / per_ticket('avg_writing_speed_words_per_sec')
+    total_time_sec = (
+        ticket_sum(wait_time_sec + retrieval_time + generation_time)
+        + ticket_sum(time_navigation)
+        + ticket_sum(time_open_doc)
+        + ticket_sum(time_read_doc)
+        + ticket_sum(time_processing)
+        + time_write_response_sec
+    )
+    cost_eur = (total_time_sec / 3600) * per_ticket('hourly_rate')
+
+    tickets = {
+        "num_documents_consulted": n_docs,
+        "total_time_min": np.round(total_time_sec / 60, 2),
+        "total_cost_eur": np.round(cost_eur, 2),
+        "total_errors": ticket_sum(errors).astype(np.int64),
+        "total_hallucinations": ticket_sum(hallucinated).astype(np.int64),
+        "avg_doc_complexity": np.where(n_docs > 0, np.round(ticket_complexity, 2), 0),
+        "time_write_response_min": np.round(time_write_response_sec / 60, 2),
+    }
+    documents = {
+        "doc_number": doc_pos + 1,
+        "document_source": src.astype(np.int8),
+        "complexity": np.round(complexity, 2),
+        "original_complexity": np.round(original_complexity[t], 2),
+        "num_pages": num_pages,
+        "doc_words": doc_words,
+        "wait_time_min": np.round(wait_time_sec / 60, 2),
+        "navigation_time_min": np.round(time_navigation / 60, 2),
+        "open_doc_time_min": np.round(time_open_doc / 60, 2),
+        "read_doc_time_min": np.round(time_read_doc / 60, 2),
+        "processing_time_min": np.round(time_processing / 60, 2),
+        "retrieval_time_sec": retrieval_time,
+        "generation_time_sec": generation_time,
+        "errors": errors,
+        "hallucination": hallucination,
+        "memory_overload": memory_overload,
+    }
+    return {
+        "tickets": tickets,
+        "documents": documents,
+        "doc_offsets": offsets,
+        "source_names": list(params['source_names']),
+    }
+
 # Esempio d'uso:
 if __name__ == "__main__":
     with open("config-ai.yaml", "r", encoding="utf-8") as f:
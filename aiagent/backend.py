@@ -0,0 +1,336 @@
+import argparse
+import functools
+import json
+import math
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import yaml
+
+from cognitiveagent.params import compile_config
+from cognitiveagent.agent import WORDS_PER_PAGE
+
+
+# quantile 0.99 della normale standard
+Z99 = 2.3263478740408408
+
+
+def erlang_c(servers, offered_load):
+    """Probabilità di attesa di una coda M/M/c (formula di Erlang C)."""
+    if offered_load >= servers:
+        return 1.0
+    blocking = 1.0
+    for k in range(1, servers + 1):
+        blocking = offered_load * blocking / (k + offered_load * blocking)
+    return servers * blocking / (servers - offered_load * (1 - blocking))
+
+
+class ServiceModel:
+    """
+    Un servizio del backend RAG (retrieval o generazione): latenza di
+    servizio lognormale (mediana e p99), `concurrency` richieste (o batch) in
+    parallelo e batching fino a max_batch_size richieste, con un batch da k
+    richieste che dura (1 + batch_overhead * (k - 1)) volte una singola.
+    Con concurrency=None il servizio non ha limiti e non fa coda.
+    """
+
+    def __init__(self, median_sec, p99_sec=None, concurrency=None, max_batch_size=1, batch_overhead=0.0):
+        self.median_sec = float(median_sec)
+        self.sigma = math.log(p99_sec / median_sec) / Z99 if p99_sec and p99_sec > median_sec > 0 else 0.0
+        self.concurrency = concurrency
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.batch_overhead = float(batch_overhead)
+
+    @property
+    def mean_sec(self):
+        return self.median_sec * math.exp(self.sigma ** 2 / 2)
+
+    @property
+    def scv(self):
+        """Quadrato del coefficiente di variazione della latenza di servizio."""
+        return math.exp(self.sigma ** 2) - 1
+
+    def batch_latency(self, batch_size):
+        return self.mean_sec * (1 + self.batch_overhead * (batch_size - 1))
+
+    @property
+    def capacity(self):
+        """Richieste al secondo sostenibili (inf senza limite di concorrenza)."""
+        if not self.concurrency:
+            return math.inf
+        return self.concurrency * self.max_batch_size / self.batch_latency(self.max_batch_size)
+
+    def queue(self, arrival_rate):
+        """
+        Punto di lavoro con `arrival_rate` richieste al secondo: dimensione
+        media dei batch, utilizzo, probabilità di attesa e attesa media in
+        coda (approssimazione di Allen-Cunneen per code G/G/c, con i batch
+        come unità di servizio).
+        """
+        if not self.concurrency or arrival_rate <= 0:
+            return {"batch_size": 1.0, "utilization": 0.0, "p_wait": 0.0, "wait_sec": 0.0}
+        c = self.concurrency
+
+        def utilization(batch_size):
+            return arrival_rate * self.batch_latency(batch_size) / (batch_size * c)
+
+        def wait(batch_size):
+            if utilization(batch_size) >= 1:
+                return 1.0, math.inf
+            service = self.batch_latency(batch_size)
+            offered_load = arrival_rate / batch_size * service
+            p_wait = erlang_c(c, offered_load)
+            # arrivi circa di Poisson (molti agenti indipendenti): ca^2 = 1
+            return p_wait, p_wait / (c / service - arrival_rate / batch_size) * (1 + self.scv) / 2
+
+        def excess(batch_size):
+            # batching dinamico: quando un server si libera prende tutte le
+            # richieste in attesa (fino a max_batch_size), quindi il batch
+            # medio è k = 1 + Lq / c; excess è decrescente in k
+            return 1 + arrival_rate * wait(batch_size)[1] / c - batch_size
+
+        max_batch = float(self.max_batch_size)
+        if utilization(max_batch) >= 1:
+            return {"batch_size": max_batch, "utilization": utilization(max_batch), "p_wait": 1.0, "wait_sec": math.inf}
+        if excess(max_batch) >= 0:
+            batch_size = max_batch
+        elif excess(1.0) <= 0:
+            batch_size = 1.0
+        else:
+            low, high = 1.0, max_batch
+            for _ in range(60):
+                mid = (low + high) / 2
+                low, high = (mid, high) if excess(mid) > 0 else (low, mid)
+            batch_size = high
+        p_wait, wait_sec = wait(batch_size)
+        return {"batch_size": batch_size, "utilization": utilization(batch_size), "p_wait": p_wait,
+                "wait_sec": wait_sec}
+
+    def latency(self, point):
+        """Latenza media di una richiesta (attesa + servizio del batch)."""
+        return point["wait_sec"] + self.batch_latency(point["batch_size"])
+
+    def sample(self, rng, n, point):
+        """
+        Latenze di n richieste: servizio lognormale scalato per il batch più
+        un'attesa che, con probabilità p_wait, è esponenziale (come in M/M/c).
+        """
+        scale = self.median_sec * (1 + self.batch_overhead * (point["batch_size"] - 1))
+        latency = scale * np.exp(self.sigma * rng.standard_normal(n)) if self.sigma else np.full(n, scale)
+        if point["p_wait"] > 0:
+            waits = rng.exponential(point["wait_sec"] / point["p_wait"], n)
+            latency = latency + np.where(rng.random(n) < point["p_wait"], waits, 0.0)
+        return latency
+
+
+def estimate_think_time(config):
+    """
+    Tempo medio (s) che un agente AI passa tra due documenti senza usare il
+    backend (ricerca, apertura, lettura, ragionamento, attese e quota della
+    scrittura della risposta), dai valori medi della config. Serve a stimare
+    quante richieste al secondo genera ogni agente.
+    """
+    cc = compile_config(config)
+    ai = cc.ai_agent
+    nav_clicks, nav_sec, open_sec, read_speed, processing_sec, writing_speed = cc.general
+    probs = cc.source_probs / cc.source_probs.sum()
+    words = WORDS_PER_PAGE * float(np.sum(probs * cc.pages_range.mean(axis=1)))
+    wait = float(np.sum(probs * cc.wait_range.mean(axis=1)))
+    repeats = 1 + ai['error_rate'] + (1 if ai['confidence'] < 0.6 else 0)
+    avg_complexity = float(np.sum(cc.complexity_probs * cc.complexity_ranges.mean(axis=1))) if len(cc.complexity_probs) else 1.0
+    load = 1 + max(1, avg_complexity * 0.7) / 10
+    reading = words / (read_speed * (1 + ai['context_knowledge_factor']))
+    writing = 750 / writing_speed / ((cc.min_docs + cc.max_docs) / 2)
+    return float(wait + (nav_clicks * nav_sec + open_sec) * repeats + (reading + processing_sec) * repeats * load + writing)
+
+
+class RAGBackend:
+    """
+    Backend RAG condiviso da `concurrent_agents` agenti AI: ogni documento
+    consultato fa una richiesta di retrieval e una di generazione. Il punto
+    di lavoro è quello di un sistema chiuso (legge del tempo di risposta
+    interattivo): ogni agente, dopo think_time_sec di lavoro proprio, invia
+    una richiesta e ne attende la risposta, quindi più il backend è lento
+    meno richieste arrivano e la coda resta finita anche a saturazione.
+    """
+
+    def __init__(self, retrieval, generation, concurrent_agents=1, think_time_sec=None):
+        self.retrieval = retrieval
+        self.generation = generation
+        self.concurrent_agents = concurrent_agents
+        self.think_time_sec = think_time_sec
+        self._points = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Backend della sezione ai_agent.backend della config AI (dizionario
+        YAML o CompiledConfig); None se la sezione non c'è e le latenze
+        restano costanti. Le istanze sono riusate tra ticket con la stessa
+        config.
+        """
+        ai = config.ai_agent if hasattr(config, 'ai_agent') else config.get('ai_agent', {})
+        backend = ai.get('backend')
+        if not backend:
+            return None
+        think_time = backend.get('think_time_sec')
+        if think_time is None:
+            think_time = _cached_think_time(config)
+        return _cached_backend(json.dumps(backend, sort_keys=True), ai['retrieval_latency_sec'],
+                               ai['generation_latency_sec'], think_time)
+
+    def operating_point(self, think_time_sec=None):
+        """
+        Throughput (richieste/s per servizio), utilizzo, attese e latenze
+        medie con concurrent_agents agenti attivi.
+        """
+        think_time = self.think_time_sec if think_time_sec is None else think_time_sec
+        if think_time in self._points:
+            return self._points[think_time]
+        n = self.concurrent_agents
+
+        def response_time(rate):
+            return (self.retrieval.latency(self.retrieval.queue(rate))
+                    + self.generation.latency(self.generation.queue(rate)))
+
+        # λ (Z + R(λ)) = N: R cresce con λ, quindi basta una bisezione
+        high = min(self.retrieval.capacity, self.generation.capacity, n / think_time if think_time > 0 else math.inf)
+        if math.isinf(high):
+            high = n / (self.retrieval.mean_sec + self.generation.mean_sec)
+        low = 0.0
+        for _ in range(100):
+            rate = (low + high) / 2
+            if rate * (think_time + response_time(rate)) > n:
+                high = rate
+            else:
+                low = rate
+        rate = low
+        retrieval, generation = self.retrieval.queue(rate), self.generation.queue(rate)
+        point = {
+            "concurrent_agents": n,
+            "think_time_sec": think_time,
+            "requests_per_sec": rate,
+            "retrieval": dict(retrieval, latency_sec=self.retrieval.latency(retrieval)),
+            "generation": dict(generation, latency_sec=self.generation.latency(generation)),
+        }
+        self._points[think_time] = point
+        return point
+
+    def sample(self, rng, n):
+        """Latenze di retrieval e generazione (s) di n documenti."""
+        point = self.operating_point()
+        return (self.retrieval.sample(rng, n, point["retrieval"]),
+                self.generation.sample(rng, n, point["generation"]))
+
+    def with_agents(self, concurrent_agents):
+        return RAGBackend(self.retrieval, self.generation, concurrent_agents, self.think_time_sec)
+
+
+def _service_from_config(section, default_median):
+    section = dict(section or {})
+    return ServiceModel(
+        section.get('median_sec', default_median),
+        section.get('p99_sec'),
+        section.get('concurrency'),
+        section.get('max_batch_size', 1),
+        section.get('batch_overhead', 0.0),
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_backend(backend_json, retrieval_latency_sec, generation_latency_sec, think_time_sec):
+    backend = json.loads(backend_json)
+    return RAGBackend(
+        _service_from_config(backend.get('retrieval'), retrieval_latency_sec),
+        _service_from_config(backend.get('generation'), generation_latency_sec),
+        backend.get('concurrent_agents', 1),
+        think_time_sec,
+    )
+
+
+_think_times = {}
+
+
+def _cached_think_time(config):
+    # con il dizionario YAML (motore scalar, un agente per ticket) la stima
+    # si calcola una volta per config
+    if hasattr(config, 'ai_agent'):
+        return estimate_think_time(config)
+    key = json.dumps({k: config.get(k) for k in ('general_parameters', 'ai_agent', 'document_sources',
+                                                 'wait_times_sec', 'task', 'complexity_ranges')},
+                     sort_keys=True, default=str)
+    if key not in _think_times:
+        _think_times[key] = estimate_think_time(config)
+    return _think_times[key]
+
+
+# --- Calibrazione su un server locale di prova ---
+
+def measure(call, n_requests, concurrency=1):
+    """Latenze (s) di n_requests chiamate a `call`, con `concurrency` chiamate in parallelo."""
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        return time.perf_counter() - started
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return np.array(list(pool.map(timed, range(n_requests))))
+
+
+def fit_latency(samples):
+    """Mediana e p99 di latenze misurate, nel formato della sezione backend."""
+    samples = np.asarray(samples, dtype=float)
+    return {"median_sec": float(np.median(samples)), "p99_sec": float(np.percentile(samples, 99))}
+
+
+def calibrate(url, payload=None, n_requests=200, concurrency_levels=(1, 4, 16)):
+    """
+    Misura un endpoint HTTP (POST JSON) a diversi livelli di concorrenza.
+    La misura a concorrenza 1 dà la latenza di servizio; il livello oltre
+    cui il throughput smette di crescere indica la concorrenza del servizio.
+    """
+    data = json.dumps(payload or {}).encode("utf-8")
+
+    def call():
+        request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+    results = []
+    for concurrency in concurrency_levels:
+        started = time.perf_counter()
+        samples = measure(call, n_requests, concurrency)
+        elapsed = time.perf_counter() - started
+        results.append(dict(fit_latency(samples), concurrency=concurrency, requests_per_sec=n_requests / elapsed))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modello di capacità del backend RAG condiviso")
+    parser.add_argument("--config", default="config-ai.yaml")
+    parser.add_argument("--agents", nargs="+", type=int, default=[1, 10, 50, 100, 200],
+                        help="agenti AI attivi contemporaneamente")
+    parser.add_argument("--calibrate", metavar="URL", help="misura un server di prova invece di usare la config")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    args = parser.parse_args()
+
+    if args.calibrate:
+        for r in calibrate(args.calibrate, n_requests=args.requests, concurrency_levels=args.concurrency):
+            print(f"concorrenza {r['concurrency']:>4}: mediana {r['median_sec']:.3f} s, p99 {r['p99_sec']:.3f} s, "
+                  f"{r['requests_per_sec']:.1f} richieste/s")
+    else:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        backend = RAGBackend.from_config(config)
+        if backend is None:
+            raise SystemExit(f"{args.config}: manca la sezione ai_agent.backend")
+        print(f"Tempo tra due documenti per agente: {backend.think_time_sec:.1f} s")
+        print(f"{'agenti':>7}{'richieste/s':>13}{'util. retr.':>13}{'util. gen.':>12}"
+              f"{'latenza retr.':>15}{'latenza gen.':>14}{'batch gen.':>12}")
+        for n in args.agents:
+            p = backend.with_agents(n).operating_point()
+            print(f"{n:>7}{p['requests_per_sec']:>13.2f}{100 * p['retrieval']['utilization']:>12.1f}%"
+                  f"{100 * p['generation']['utilization']:>11.1f}%{p['retrieval']['latency_sec']:>13.2f} s"
+                  f"{p['generation']['latency_sec']:>12.2f} s{p['generation']['batch_size']:>12.1f}")
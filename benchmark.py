@@ -0,0 +1,284 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import yaml
+
+
+BASE_CONFIG_PATH = "config.yaml"
+AI_CONFIG_PATH = "config-ai.yaml"
+ECONOMICS_CONFIG_PATH = "config-economics-kpi.yaml"
+RESULTS_DIR = ".benchmarks"
+
+BENCH_SEED = 12345
+SIZES = [1_000, 100_000, 1_000_000]
+# i casi ticket per ticket oltre questa soglia richiedono decine di minuti:
+# si eseguono solo con --all
+SCALAR_MAX_TICKETS = 100_000
+
+
+def _load_yaml(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def _scalar_agent(agent_cls, n_tickets, seed):
+    from simulate import choose_profile, sample_complexity, vary_config
+
+    base_config = _load_yaml(BASE_CONFIG_PATH if agent_cls.__name__ == "HumanSearchAgent" else AI_CONFIG_PATH)
+    complexity_ranges = {k: tuple(v) for k, v in base_config['complexity_ranges'].items()}
+    rng = np.random.RandomState(seed)
+    # input dei ticket preparati prima della misura: si misura solo l'agente
+    tickets = []
+    for _ in range(n_tickets):
+        complexities = sample_complexity(base_config['task']['complexity_distribution'], 10, complexity_ranges, rng)
+        avg_complexity = np.mean(complexities)
+        tickets.append((
+            choose_profile(avg_complexity, base_config['profile_assignment']),
+            vary_config(base_config, rng), rng.random_sample() < 0.3, round(rng.uniform(0.0, 1.0), 2),
+            avg_complexity, rng.randint(500, 1001),
+        ))
+
+    def run():
+        for profile, config, is_late, stress, avg_complexity, words in tickets:
+            agent_cls(profile, config, is_late, stress, avg_complexity, rng).simulate_search(words)
+    return run
+
+
+def case_agent_human(n_tickets, seed, workdir):
+    from cognitiveagent.agent import HumanSearchAgent
+    return _scalar_agent(HumanSearchAgent, n_tickets, seed)
+
+
+def case_agent_ai(n_tickets, seed, workdir):
+    from aiagent.agentai import RAGHumanAgent
+    return _scalar_agent(RAGHumanAgent, n_tickets, seed)
+
+
+def _batch_agent(agent, n_tickets, seed):
+    from cognitiveagent.params import compile_config
+    from simulate import choose_profile_batch, sample_avg_complexity_batch
+
+    human = agent.__name__ == "cognitiveagent.agent"
+    cc = compile_config(_load_yaml(BASE_CONFIG_PATH if human else AI_CONFIG_PATH))
+    rng = np.random.default_rng(seed)
+    is_late = rng.random(n_tickets) < 0.3
+    stress = np.round(rng.random(n_tickets), 2)
+    words = rng.integers(500, 1001, n_tickets)
+    avg_complexity = sample_avg_complexity_batch(cc, n_tickets, rng)
+    if human:
+        profiles = choose_profile_batch(avg_complexity, cc)
+        params = agent.batch_params(cc, profiles, is_late, stress, avg_complexity, words, cc.perturb(rng, n_tickets))
+    else:
+        params = agent.batch_params(cc, is_late, stress, avg_complexity, words, cc.perturb(rng, n_tickets))
+    return lambda: agent.simulate_batch(params, n_tickets, rng)
+
+
+def case_agent_human_batch(n_tickets, seed, workdir):
+    from cognitiveagent import agent
+    return _batch_agent(agent, n_tickets, seed)
+
+
+def case_agent_ai_batch(n_tickets, seed, workdir):
+    from aiagent import agentai
+    return _batch_agent(agentai, n_tickets, seed)
+
+
+def _simulation(engine, n_tickets, seed, workdir):
+    from simulate import simulate_tickets
+
+    def run():
+        simulate_tickets(n_tickets, BASE_CONFIG_PATH, AI_CONFIG_PATH,
+                         os.path.join(workdir, "human"), os.path.join(workdir, "ai"),
+                         seed=seed, engine=engine, summary_file=os.path.join(workdir, "summary.json"))
+    return run
+
+
+def case_simulate_scalar(n_tickets, seed, workdir):
+    return _simulation("scalar", n_tickets, seed, workdir)
+
+
+def case_simulate_batch(n_tickets, seed, workdir):
+    return _simulation("batch", n_tickets, seed, workdir)
+
+
+def case_statistics(n_tickets, seed, workdir):
+    from kpi import load_economics, statistics_dict
+    from results_io import concat_columns
+    from cognitiveagent.params import compile_config
+    from simulate import TICKETS_PER_BLOCK, simulate_block_batch
+
+    base_cc = compile_config(_load_yaml(BASE_CONFIG_PATH))
+    ai_cc = compile_config(_load_yaml(AI_CONFIG_PATH))
+    entropy = np.random.SeedSequence(seed).entropy
+    blocks = [
+        simulate_block_batch(block, n_tickets, base_cc, ai_cc, entropy)[0]
+        for block in range((n_tickets + TICKETS_PER_BLOCK - 1) // TICKETS_PER_BLOCK)
+    ]
+    tickets = concat_columns([t for t, _ in blocks])
+    documents = concat_columns([d for _, d in blocks])
+    economics = load_economics(ECONOMICS_CONFIG_PATH)
+    return lambda: statistics_dict(tickets, documents, economics)
+
+
+# nome -> (costruttore del caso, motore ticket per ticket)
+CASES = {
+    "agent_human": (case_agent_human, True),
+    "agent_ai": (case_agent_ai, True),
+    "agent_human_batch": (case_agent_human_batch, False),
+    "agent_ai_batch": (case_agent_ai_batch, False),
+    "simulate_scalar": (case_simulate_scalar, True),
+    "simulate_batch": (case_simulate_batch, False),
+    "statistics": (case_statistics, False),
+}
+
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in KiB su Linux, in byte su macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(name, n_tickets, seed):
+    """
+    Esegue un caso nel processo corrente e ne restituisce le misure. Va
+    chiamato in un processo dedicato, altrimenti il picco di RSS include
+    quello dei casi precedenti.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        # la preparazione degli input non è misurata
+        run = CASES[name][0](n_tickets, seed, workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - started
+        output_bytes = _directory_bytes(workdir)
+    return {
+        "case": name,
+        "n_tickets": n_tickets,
+        "seconds": seconds,
+        "tickets_per_sec": n_tickets / seconds if seconds > 0 else float("inf"),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "output_bytes": output_bytes,
+    }
+
+
+def _run_isolated(name, n_tickets, seed):
+    completed = subprocess.run(
+        [sys.executable, __file__, "--run-case", name, str(n_tickets), "--seed", str(seed)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def config_hash():
+    """Hash delle config usate, per confrontare solo run con gli stessi input."""
+    digest = hashlib.sha256()
+    for path in (BASE_CONFIG_PATH, AI_CONFIG_PATH, ECONOMICS_CONFIG_PATH):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def latest_results(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json") and f != exclude)
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1]), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_results(results, previous=None):
+    baseline = {}
+    if previous and previous.get("config_hash") == config_hash():
+        baseline = {(r["case"], r["n_tickets"]): r for r in previous["results"]}
+    lines = [f"{'caso':<20}{'ticket':>10}{'tempo (s)':>12}{'ticket/s':>14}{'RSS (MB)':>11}{'output (MB)':>13}{'vs prec.':>10}"]
+    for r in results:
+        before = baseline.get((r["case"], r["n_tickets"]))
+        ratio = f"{r['tickets_per_sec'] / before['tickets_per_sec']:.2f}x" if before else "-"
+        lines.append(
+            f"{r['case']:<20}{r['n_tickets']:>10}{r['seconds']:>12.3f}{r['tickets_per_sec']:>14,.0f}"
+            f"{r['peak_rss_bytes'] / 2**20:>11.1f}{r['output_bytes'] / 2**20:>13.1f}{ratio:>10}"
+        )
+    return "\n".join(lines)
+
+
+def run_benchmarks(cases, sizes, seed=BENCH_SEED, include_slow=False):
+    """
+    Esegue ogni caso per ogni dimensione (un processo per misura), salva i
+    risultati in .benchmarks/<timestamp>.json e li confronta con l'ultimo
+    run salvato con le stesse config.
+    """
+    results = []
+    for name in cases:
+        for n_tickets in sizes:
+            if CASES[name][1] and n_tickets > SCALAR_MAX_TICKETS and not include_slow:
+                print(f"{name} @ {n_tickets}: saltato (usa --all)")
+                continue
+            print(f"{name} @ {n_tickets}...", flush=True)
+            results.append(_run_isolated(name, n_tickets, seed))
+
+    previous = latest_results()
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "config_hash": config_hash(),
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + format_results(results, previous))
+    print(f"\nRisultati salvati in {path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark di agenti, simulazione e statistiche")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--seed", type=int, default=BENCH_SEED)
+    parser.add_argument("--all", action="store_true",
+                        help=f"esegue i casi ticket per ticket anche oltre {SCALAR_MAX_TICKETS} ticket")
+    parser.add_argument("--run-case", nargs=2, metavar=("CASO", "N"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case[0], int(args.run_case[1]), args.seed)))
+    else:
+        run_benchmarks(args.cases, args.sizes, args.seed, args.all)
@@ -2,13 +2,16 @@ import numpy as np
 import yaml
 import json
 import random
+from cognitiveagent.params import GENERAL_KEYS, PROFILE_KEYS, compile_config
 
 
 WORDS_PER_PAGE = 300
 
 class HumanSearchAgent:
-    def __init__(self, profile, config, is_late=False, current_stress=0.0, avg_complexity=None):
+    def __init__(self, profile, config, is_late=False, current_stress=0.0, avg_complexity=None, rng=None):
         self.profile = profile
+        # generatore casuale: di default lo stato globale di np.random
+        self.rng = np.random if rng is None else rng
         self.config = config
         self.is_late = is_late
         self.current_stress = current_stress
@@ -65,17 +68,17 @@ class HumanSearchAgent:
         errors_total = 0
         documents_details = []
 
-        num_documents = np.random.randint(self.min_docs, self.max_docs + 1)
+        num_documents = self.rng.randint(self.min_docs, self.max_docs + 1)
 
         for i in range(num_documents):
             # scegli la sorgente
-            source = np.random.choice(self.document_sources, p=self.doc_source_probs)
+            source = self.rng.choice(self.document_sources, p=self.doc_source_probs)
             source_conf = self.doc_sources_config[source]
 
             # estrai complessità e dimensione
             complexity = self.avg_complexity
             
-            num_pages = np.random.randint(
+            num_pages = self.rng.randint(
                 source_conf['pages_range'][0],
                 source_conf['pages_range'][1] + 1
             )
@@ -84,18 +87,18 @@ class HumanSearchAgent:
             wait_time_sec = 0
             if source in ["teams", "email"]:
                 w = self.wait_times[source]
-                wait_time_sec = np.random.uniform(w['min'], w['max'])
+                wait_time_sec = self.rng.uniform(w['min'], w['max'])
 
             effective_error_rate = min(
                 self.error_rate + max(0, self.current_stress - self.stress_tolerance), 1.0
             )
             repeats = 1
-            if np.random.rand() < effective_error_rate:
+            if self.rng.rand() < effective_error_rate:
                 repeats += 1
             if self.confidence < 0.6:
                 repeats += 1
 
-            clicks = np.random.normal(self.avg_clicks_to_find_doc, 1)
+            clicks = self.rng.normal(self.avg_clicks_to_find_doc, 1)
             time_navigation = clicks * self.avg_nav_time_per_click_sec * repeats
             time_open_doc = self.avg_doc_open_time_sec * repeats
 
@@ -161,4 +164,208 @@ class HumanSearchAgent:
             "documents_details": documents_details
         }
 
-        return result
\ No newline at end of file
+        return result
+
+# --- Motore vettoriale (batch) ---
+
+def batch_params(config, profiles, is_late, current_stress, avg_complexity, response_words, variation=None):
+    """
+    Costruisce i parametri di simulate_batch, replicando quello che
+    HumanSearchAgent.__init__ fa ticket per ticket. config è il dizionario
+    YAML o una CompiledConfig; profiles, is_late, current_stress,
+    avg_complexity e response_words sono sequenze di lunghezza n_tickets.
+    variation è l'eventuale perturbazione di CompiledConfig.perturb.
+    """
+    cc = compile_config(config)
+    is_late = np.asarray(is_late, dtype=bool)
+    n = len(is_late)
+
+    general = variation['general'] if variation is not None else np.broadcast_to(cc.general, (n, len(GENERAL_KEYS)))
+    params = {key: general[:, j].copy() for j, key in enumerate(GENERAL_KEYS)}
+    params['min_docs'] = cc.min_docs
+    params['max_docs'] = cc.max_docs
+
+    codes = cc.profile_codes(profiles)
+    for key in PROFILE_KEYS:
+        params[key] = cc.profile_column(key, codes)
+
+    nav_f, read_f, processing_f, error_f, retries_f = cc.fatigue
+    params['avg_nav_time_per_click_sec'] *= np.where(is_late, nav_f, 1.0)
+    params['avg_read_speed_words_per_sec'] /= np.where(is_late, read_f, 1.0)
+    params['avg_cognitive_processing_sec'] *= np.where(is_late, processing_f, 1.0)
+    params['error_rate'] *= np.where(is_late, error_f, 1.0)
+    params['avg_clicks_to_find_doc'] *= np.where(is_late, retries_f, 1.0)
+
+    params['source_names'] = cc.source_names
+    params['source_probs'] = variation['source_probs'] if variation is not None else cc.source_probs
+    params['pages_range'] = cc.pages_range
+    params['wait_range'] = cc.wait_range
+    params['current_stress'] = np.asarray(current_stress, dtype=float)
+    params['avg_complexity'] = np.asarray(avg_complexity, dtype=float)
+    params['response_words'] = np.asarray(response_words, dtype=float)
+    return params
+
+
+def uniform_int(u, low, high):
+    """Intero uniforme in [low, high] ottenuto per inversione da u in [0, 1)."""
+    return low + (u * (high - low + 1)).astype(np.int64)
+
+
+def choose_sources(u, probs, ticket_idx):
+    """
+    Estrae la sorgente di ogni documento per inversione della CDF, come
+    np.random.choice. probs può essere (k,) oppure (n_tickets, k).
+    """
+    cdf = np.cumsum(probs, axis=-1)
+    if cdf.ndim == 1:
+        src = np.searchsorted(cdf, u * cdf[-1], side='right')
+    else:
+        cdf = cdf[ticket_idx]
+        src = (cdf <= (u * cdf[:, -1])[:, None]).sum(axis=1)
+    return np.minimum(src, probs.shape[-1] - 1)
+
+
+def ragged_index(n_docs):
+    """Offset, indice ticket e posizione (0-based) di ogni documento."""
+    offsets = np.zeros(len(n_docs) + 1, dtype=np.int64)
+    np.cumsum(n_docs, out=offsets[1:])
+    ticket_idx = np.repeat(np.arange(len(n_docs)), n_docs)
+    doc_pos = np.arange(offsets[-1]) - offsets[ticket_idx]
+    return offsets, ticket_idx, doc_pos
+
+
+def common_draws(rng, n_tickets, max_docs, u=None):
+    """
+    Numeri casuali comuni (common random numbers) per simulare gli stessi
+    ticket con più agenti: un'uniforme per il numero di documenti e, per ogni
+    posizione di documento fino a max_docs, le uniformi di sorgente, pagine,
+    attesa ed errore e la normale standard dei click. Passate a
+    simulate_batch tramite `draws`, fanno sì che i documenti i-esimi dei due
+    agenti condividano le stesse estrazioni.
+    u, se indicato, è una matrice (n_tickets, 1 + 4 * max_docs) di uniformi
+    già estratte (es. stratificate) da usare al posto di rng per numero di
+    documenti, sorgente, pagine, attesa ed errore; i click restano da rng.
+    """
+    shape = (n_tickets, max_docs)
+    if u is not None:
+        doc_u = u[:, 1:].reshape(n_tickets, 4, max_docs)
+        return {
+            'count': u[:, 0],
+            'source': doc_u[:, 0],
+            'pages': doc_u[:, 1],
+            'wait': doc_u[:, 2],
+            'error': doc_u[:, 3],
+            'clicks': rng.standard_normal(shape),
+        }
+    return {
+        'count': rng.random(n_tickets),
+        'source': rng.random(shape),
+        'pages': rng.random(shape),
+        'wait': rng.random(shape),
+        'error': rng.random(shape),
+        'clicks': rng.standard_normal(shape),
+    }
+
+
+def doc_draws(draws, key, rng, ticket_idx, doc_pos, normal=False):
+    """Estrazioni per documento: dai numeri comuni se presenti, altrimenti da rng."""
+    if draws is not None:
+        return draws[key][ticket_idx, doc_pos]
+    return rng.standard_normal(len(ticket_idx)) if normal else rng.random(len(ticket_idx))
+
+
+def simulate_batch(params, n_tickets, rng=None, draws=None):
+    """
+    Versione vettoriale di HumanSearchAgent.simulate_search: simula
+    n_tickets ticket in un colpo solo. params è il dizionario prodotto da
+    batch_params (valori per ticket o scalari). I documenti di tutti i
+    ticket stanno in array piatti; il ticket i occupa
+    doc_offsets[i]:doc_offsets[i + 1]. draws (opzionale) sono i numeri
+    casuali comuni di common_draws.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n = n_tickets
+
+    def per_ticket(key):
+        return np.broadcast_to(np.asarray(params[key], dtype=float), (n,))
+
+    # 1. numero di documenti per ticket e struttura ragged
+    u_count = draws['count'] if draws is not None else rng.random(n)
+    n_docs = uniform_int(u_count, params['min_docs'], params['max_docs'])
+    offsets, t, doc_pos = ragged_index(n_docs)
+    n_total = len(t)
+
+    def draw(key, normal=False):
+        return doc_draws(draws, key, rng, t, doc_pos, normal)
+
+    # 2. sorgente, pagine e attese di ogni documento
+    src = choose_sources(draw('source'), np.asarray(params['source_probs'], dtype=float), t)
+    pages_range = params['pages_range']
+    num_pages = uniform_int(draw('pages'), pages_range[src, 0], pages_range[src, 1])
+    doc_words = num_pages * WORDS_PER_PAGE
+    wait_range = params['wait_range']
+    wait_time_sec = wait_range[src, 0] + (wait_range[src, 1] - wait_range[src, 0]) * draw('wait')
+
+    # 3. errori e ripetizioni
+    effective_error_rate = np.minimum(
+        per_ticket('error_rate') + np.maximum(0, per_ticket('current_stress') - per_ticket('stress_tolerance')), 1.0
+    )
+    repeats = 1 + (draw('error') < effective_error_rate[t]) + (per_ticket('confidence') < 0.6)[t]
+
+    clicks = per_ticket('avg_clicks_to_find_doc')[t] + draw('clicks', normal=True)
+    time_navigation = clicks * per_ticket('avg_nav_time_per_click_sec')[t] * repeats
+    time_open_doc = per_ticket('avg_doc_open_time_sec')[t] * repeats
+
+    # 4. carico cognitivo e memory overload
+    complexity = per_ticket('avg_complexity')[t]
+    memory_overload = complexity * num_pages > per_ticket('short_term_memory_capacity')[t]
+    load_multiplier = (1.0 + complexity / 10.0) * np.where(memory_overload, 1.5, 1.0)
+
+    effective_read_speed = per_ticket('avg_read_speed_words_per_sec') * (1 + per_ticket('context_knowledge_factor'))
+    time_read_doc = doc_words / effective_read_speed[t] * repeats * load_multiplier
+    time_processing = per_ticket('avg_cognitive_processing_sec')[t] * repeats * load_multiplier
+    errors = (repeats > 1).astype(np.int64)
+
+    # 5. totali per ticket
+    def ticket_sum(values):
+        return np.bincount(t, weights=values, minlength=n)
+
+    time_write_response_sec = per_ticket('response_words') / per_ticket('avg_writing_speed_words_per_sec')
+    total_time_sec = (
+        ticket_sum(wait_time_sec)
+        + ticket_sum(time_navigation)
+        + ticket_sum(time_open_doc)
+        + ticket_sum(time_read_doc)
+        + ticket_sum(time_processing)
+        + time_write_response_sec
+    )
+    cost_eur = (total_time_sec / 3600) * per_ticket('hourly_rate')
+
+    tickets = {
+        "num_documents_consulted": n_docs,
+        "total_time_min": np.round(total_time_sec / 60, 2),
+        "total_cost_eur": np.round(cost_eur, 2),
+        "total_errors": np.bincount(t, weights=errors, minlength=n).astype(np.int64),
+        "avg_doc_complexity": np.where(n_docs > 0, np.round(per_ticket('avg_complexity'), 2), 0),
+        "time_write_response_min": np.round(time_write_response_sec / 60, 2),
+    }
+    documents = {
+        "doc_number": doc_pos + 1,
+        "document_source": src.astype(np.int8),
+        "complexity": np.round(complexity, 2),
+        "num_pages": num_pages,
+        "doc_words": doc_words,
+        "wait_time_min": np.round(wait_time_sec / 60, 2),
+        "navigation_time_min": np.round(time_navigation / 60, 2),
+        "open_doc_time_min": np.round(time_open_doc / 60, 2),
+        "read_doc_time_min": np.round(time_read_doc / 60, 2),
+        "processing_time_min": np.round(time_processing / 60, 2),
+        "errors": errors,
+        "memory_overload": memory_overload,
+    }
+    return {
+        "tickets": tickets,
+        "documents": documents,
+        "doc_offsets": offsets,
+        "source_names": list(params['source_names']),
+    }
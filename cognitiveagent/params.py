@@ -0,0 +1,141 @@
+import numpy as np
+
+
+GENERAL_KEYS = [
+    'avg_clicks_to_find_doc',
+    'avg_nav_time_per_click_sec',
+    'avg_doc_open_time_sec',
+    'avg_read_speed_words_per_sec',
+    'avg_cognitive_processing_sec',
+    'avg_writing_speed_words_per_sec',
+]
+
+# valori di ripiego usati da RAGHumanAgent per le chiavi opzionali
+GENERAL_DEFAULTS = {
+    'avg_nav_time_per_click_sec': 1,
+    'avg_doc_open_time_sec': 2,
+}
+
+PROFILE_KEYS = [
+    'hourly_rate',
+    'context_knowledge_factor',
+    'error_rate',
+    'short_term_memory_capacity',
+    'confidence',
+    'stress_tolerance',
+]
+
+FATIGUE_KEYS = [
+    'nav_speed_factor',
+    'read_speed_factor',
+    'processing_delay_factor',
+    'error_rate_factor',
+    'retries_factor',
+]
+
+# variazione ambientale di vary_config: ±5%
+VARIATION = 0.05
+
+
+def _frozen(values, dtype=float):
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+class CompiledConfig:
+    """
+    Rappresentazione immutabile e array-based di config.yaml / config-ai.yaml,
+    costruita una volta sola. Contiene le tabelle che i motori batch leggono
+    per ogni blocco di ticket (parametri generali, sorgenti, profili,
+    complessità) senza più copiare o rileggere il dizionario YAML.
+    """
+
+    __slots__ = (
+        'general', 'min_docs', 'max_docs', 'fatigue',
+        'source_names', 'source_probs', 'pages_range', 'wait_range',
+        'profile_names', 'profiles', 'ai_agent',
+        'complexity_levels', 'complexity_probs', 'complexity_ranges',
+        'junior_max', 'mid_max',
+    )
+
+    def __init__(self, config):
+        gen = config['general_parameters']
+        self.general = _frozen([gen[k] if k in gen else GENERAL_DEFAULTS[k] for k in GENERAL_KEYS])
+        self.min_docs = int(gen['min_documents_per_operation'])
+        self.max_docs = int(gen['max_documents_per_operation'])
+        # HumanSearchAgent legge la fatica da general_parameters
+        fatigue = gen.get('fatigue', {})
+        self.fatigue = _frozen([fatigue.get(k, 1.0) for k in FATIGUE_KEYS])
+
+        sources = config['document_sources']
+        self.source_names = tuple(sources.keys())
+        self.source_probs = _frozen([sources[s]['probability'] for s in self.source_names])
+        self.pages_range = _frozen([sources[s]['pages_range'] for s in self.source_names], np.int64)
+        wait_times = config.get('wait_times_sec', {})
+        wait = []
+        for src in self.source_names:
+            w = wait_times.get(src, {'min': 0, 'max': 0}) if src in ["teams", "email"] else {'min': 0, 'max': 0}
+            wait.append((w['min'], w['max']))
+        self.wait_range = _frozen(wait)
+
+        profiles = config.get('profiles', {})
+        self.profile_names = tuple(profiles.keys())
+        self.profiles = _frozen([[profiles[p][k] for k in PROFILE_KEYS] for p in self.profile_names])
+        self.ai_agent = dict(config.get('ai_agent', {}))
+
+        dist = config.get('task', {}).get('complexity_distribution', {})
+        self.complexity_levels = tuple(dist.keys())
+        probs = np.array(list(dist.values()), dtype=float)
+        self.complexity_probs = _frozen(probs / probs.sum() if len(probs) else probs)
+        ranges = config.get('complexity_ranges', {})
+        self.complexity_ranges = _frozen([ranges[level] for level in self.complexity_levels])
+
+        assignment = config.get('profile_assignment', {})
+        self.junior_max = float(assignment.get('junior_max', 0))
+        self.mid_max = float(assignment.get('mid_max', 0))
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f"CompiledConfig è immutabile: impossibile modificare {name}")
+        object.__setattr__(self, name, value)
+
+    def profile_codes(self, profiles):
+        """Indici in profile_names dei profili passati (array di stringhe)."""
+        uniq, inverse = np.unique(np.asarray(profiles), return_inverse=True)
+        return np.array([self.profile_names.index(p) for p in uniq], dtype=np.int64)[inverse]
+
+    def profile_column(self, key, codes):
+        return self.profiles[codes, PROFILE_KEYS.index(key)]
+
+    @property
+    def n_perturbed(self):
+        """Numero di moltiplicatori estratti da perturb per ogni ticket."""
+        return len(GENERAL_KEYS) + len(self.source_names)
+
+    def perturb(self, rng, n, u=None):
+        """
+        Variazione ambientale di n ticket, equivalente a vary_config ma
+        vettoriale: moltiplicatori uniformi in [0.95, 1.05] per i parametri
+        generali e per le probabilità delle sorgenti, poi rinormalizzate.
+        u, se indicato, è una matrice (n, n_perturbed) di uniformi in [0, 1)
+        già estratte (es. da un sampler stratificato).
+        Restituisce general (n, 6) e source_probs (n, k).
+        """
+        low, high = 1 - VARIATION, 1 + VARIATION
+        if u is None:
+            general = self.general * rng.uniform(low, high, (n, len(GENERAL_KEYS)))
+            source_probs = self.source_probs * rng.uniform(low, high, (n, len(self.source_names)))
+        else:
+            factors = low + (high - low) * u
+            general = self.general * factors[:, :len(GENERAL_KEYS)]
+            source_probs = self.source_probs * factors[:, len(GENERAL_KEYS):]
+        source_probs /= source_probs.sum(axis=1, keepdims=True)
+        return {'general': general, 'source_probs': source_probs}
+
+
+def compile_config(config):
+    """Restituisce config già compilata, oppure la compila dal dizionario YAML."""
+    if isinstance(config, CompiledConfig):
+        return config
+    return CompiledConfig(config)
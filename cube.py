@@ -0,0 +1,205 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from aggregator import SKETCH_FIELDS, QuantileSketch
+
+
+DIMENSIONS = ("agent", "profile", "is_late", "stress_band", "complexity_band", "document_source")
+
+# fasce: (nome, limite superiore escluso); l'ultima fascia non ha limite
+STRESS_BANDS = [("basso", 1 / 3), ("medio", 2 / 3), ("alto", math.inf)]
+COMPLEXITY_BANDS = [("bassa", 4.0), ("media", 8.0), ("alta", math.inf)]
+
+SUM_FIELDS = ["total_time_min", "total_cost_eur", "total_errors", "num_documents_consulted"]
+
+# livello della fonte per i ticket senza documenti
+NO_SOURCE = "nessuna"
+
+
+def band_codes(values, bands):
+    """Indice della fascia di ogni valore."""
+    limits = np.array([limit for _, limit in bands[:-1]])
+    return np.searchsorted(limits, np.asarray(values, dtype=float), side="right")
+
+
+class AggregateCube:
+    """
+    Cubo di aggregati dei ticket sulle dimensioni DIMENSIONS: per ogni cella
+    (una combinazione di livelli) numero di ticket, somme di SUM_FIELDS e
+    sketch dei quantili di tempo e costo. La fonte di un ticket è quella
+    più frequente tra i suoi documenti. Si costruisce una volta per set di
+    risultati, blocco per blocco come KpiAggregator (ed è unibile con
+    merge); ogni filtro si risolve sommando le celle selezionate, in un
+    tempo che non dipende dal numero di ticket.
+    """
+
+    def __init__(self):
+        self.levels = {
+            "agent": ["human", "ai"],
+            "profile": [],
+            "is_late": [False, True],
+            "stress_band": [name for name, _ in STRESS_BANDS],
+            "complexity_band": [name for name, _ in COMPLEXITY_BANDS],
+            "document_source": [NO_SOURCE],
+        }
+        self.n_bins = len(QuantileSketch().counts)
+        shape = self.shape
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.sums = {f: np.zeros(shape) for f in SUM_FIELDS}
+        self.sketches = {f: np.zeros(shape + (self.n_bins,), dtype=np.int64) for f in SKETCH_FIELDS}
+        self.zero_counts = {f: np.zeros(shape, dtype=np.int64) for f in SKETCH_FIELDS}
+
+    @property
+    def shape(self):
+        return tuple(len(self.levels[d]) for d in DIMENSIONS)
+
+    @property
+    def tickets(self):
+        return int(self.counts.sum())
+
+    def _arrays(self):
+        yield "counts", self.counts
+        for f in SUM_FIELDS:
+            yield f"sum__{f}", self.sums[f]
+        for f in SKETCH_FIELDS:
+            yield f"sketch__{f}", self.sketches[f]
+            yield f"zero__{f}", self.zero_counts[f]
+
+    def _add_level(self, dim, name):
+        """Aggiunge un livello a una dimensione (profili e fonti dipendono dalle config)."""
+        self.levels[dim].append(name)
+        axis = DIMENSIONS.index(dim)
+
+        def grow(array):
+            pad = [(0, 0)] * array.ndim
+            pad[axis] = (0, 1)
+            return np.pad(array, pad)
+
+        self.counts = grow(self.counts)
+        self.sums = {f: grow(a) for f, a in self.sums.items()}
+        self.sketches = {f: grow(a) for f, a in self.sketches.items()}
+        self.zero_counts = {f: grow(a) for f, a in self.zero_counts.items()}
+
+    def _codes(self, dim, values):
+        names, inverse = np.unique(np.asarray(values), return_inverse=True)
+        names = names.tolist()
+        for name in names:
+            if name not in self.levels[dim]:
+                self._add_level(dim, name)
+        lookup = np.array([self.levels[dim].index(name) for name in names], dtype=np.int64)
+        return lookup[inverse.ravel()] if len(names) else np.zeros(0, dtype=np.int64)
+
+    def _source_codes(self, tickets, documents):
+        """Fonte più frequente tra i documenti di ogni ticket (a parità, il primo livello)."""
+        n = len(tickets["ticket_id"])
+        if not len(documents.get("ticket_id", ())):
+            return np.zeros(n, dtype=np.int64)
+        sources = self._codes("document_source", documents["document_source"])
+        owner = np.searchsorted(np.asarray(tickets["ticket_id"]), np.asarray(documents["ticket_id"]))
+        n_levels = len(self.levels["document_source"])
+        per_ticket = np.bincount(owner * n_levels + sources, minlength=n * n_levels).reshape(n, n_levels)
+        # senza documenti tutte le colonne sono 0: argmax dà NO_SOURCE (livello 0)
+        return np.argmax(per_ticket, axis=1)
+
+    def update(self, agent, tickets, documents):
+        """Aggiunge un blocco di ticket di agent (tabelle colonnari tickets/documents)."""
+        n = len(tickets["ticket_id"])
+        if n == 0:
+            return
+        codes = [
+            self._codes("agent", [agent] * n),
+            self._codes("profile", tickets["profile"]),
+            np.asarray(tickets["is_late"], dtype=bool).astype(np.int64),
+            band_codes(tickets["current_stress"], STRESS_BANDS),
+            band_codes(tickets["avg_doc_complexity"], COMPLEXITY_BANDS),
+            self._source_codes(tickets, documents),
+        ]
+        # i codici vanno calcolati prima: _codes può allargare gli array
+        cell = np.ravel_multi_index(codes, self.shape)
+        np.add.at(self.counts.reshape(-1), cell, 1)
+        for f in SUM_FIELDS:
+            np.add.at(self.sums[f].reshape(-1), cell, np.asarray(tickets[f], dtype=float))
+        sketch = QuantileSketch()
+        for f in SKETCH_FIELDS:
+            values = np.asarray(tickets[f], dtype=float)
+            small = values < sketch.min_value
+            np.add.at(self.zero_counts[f].reshape(-1), cell[small], 1)
+            bins = np.minimum(sketch._index(values[~small]), self.n_bins - 1)
+            np.add.at(self.sketches[f].reshape(-1), cell[~small] * self.n_bins + bins, 1)
+
+    def merge(self, other):
+        for dim in DIMENSIONS:
+            for name in other.levels[dim]:
+                if name not in self.levels[dim]:
+                    self._add_level(dim, name)
+        index = np.ix_(*[[self.levels[d].index(name) for name in other.levels[d]] for d in DIMENSIONS])
+        self.counts[index] += other.counts
+        for f in SUM_FIELDS:
+            self.sums[f][index] += other.sums[f]
+        for f in SKETCH_FIELDS:
+            self.sketches[f][index] += other.sketches[f]
+            self.zero_counts[f][index] += other.zero_counts[f]
+
+    def _select(self, filters):
+        index = []
+        for dim in DIMENSIONS:
+            levels = self.levels[dim]
+            wanted = (filters or {}).get(dim)
+            if wanted:
+                index.append(np.array([levels.index(v) for v in wanted if v in levels], dtype=np.int64))
+            else:
+                index.append(np.arange(len(levels)))
+        return index
+
+    def _summary(self, index, quantiles):
+        cells = np.ix_(*index)
+        count = int(self.counts[cells].sum())
+        result = {"tickets": count}
+        for f in SUM_FIELDS:
+            total = float(self.sums[f][cells].sum())
+            result[f"sum_{f}"] = total
+            result[f"avg_{f}"] = total / count if count else float("nan")
+        for f in SKETCH_FIELDS:
+            sketch = QuantileSketch()
+            sketch.counts = self.sketches[f][cells].reshape(-1, self.n_bins).sum(axis=0)
+            sketch.zero_count = int(self.zero_counts[f][cells].sum())
+            for q in quantiles:
+                result[f"p{round(100 * q)}_{f}"] = sketch.quantile(q)
+        return result
+
+    def query(self, filters=None, group_by=None, quantiles=(0.5, 0.9)):
+        """
+        Aggregati dei ticket che soddisfano filters ({dimensione: [livelli]};
+        una dimensione assente o vuota non filtra). Con group_by restituisce
+        {livello: aggregati} per i livelli selezionati di quella dimensione.
+        """
+        index = self._select(filters)
+        if group_by is None:
+            return self._summary(index, quantiles)
+        axis = DIMENSIONS.index(group_by)
+        groups = {}
+        for i in index[axis]:
+            sub = list(index)
+            sub[axis] = np.array([i])
+            groups[self.levels[group_by][i]] = self._summary(sub, quantiles)
+        return groups
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, levels=json.dumps(self.levels), **dict(self._arrays()))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        cube = cls()
+        with np.load(path, allow_pickle=False) as data:
+            cube.levels = json.loads(str(data["levels"]))
+            cube.counts = data["counts"]
+            cube.sums = {f: data[f"sum__{f}"] for f in SUM_FIELDS}
+            cube.sketches = {f: data[f"sketch__{f}"] for f in SKETCH_FIELDS}
+            cube.zero_counts = {f: data[f"zero__{f}"] for f in SKETCH_FIELDS}
+        return cube
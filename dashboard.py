@@ -1,308 +1,465 @@
 import gradio as gr
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import glob
+import hashlib
 import json
+import os
+import shutil
+import threading
+import time
 import yaml
+import kpi
+from datetime import datetime
+from results_io import chunk_indices, concat_columns, load_tables, read_chunk, read_columnar_chunks
+from results_io import results_fingerprint, results_signature
+from aggregator import KpiAggregator
+from cube import AggregateCube, DIMENSIONS, COMPLEXITY_BANDS, STRESS_BANDS
+from result_cache import ResultCache
+from simulate import STOP_FILE
+
+# --- Caricamento dati in background ---
+# directory colonnari scritte da simulate.py (accetta anche .jsonl/.json)
+DATA_PATH_HUMAN = "./simulation_results-human"
+DATA_PATH_AI = "./simulation_results-ai"
+# riepilogo incrementale salvato da simulate.py (se presente e relativo a
+# questi risultati evita di ricalcolare le statistiche dai ticket)
+SUMMARY_PATH = "./simulation_summary.json"
+# snapshot binari (npz non compressi, uno per output) delle tabelle dei
+# ticket: si ricaricano molto più in fretta dei chunk compressi
+SNAPSHOT_DIR = "./.dashboard_snapshot"
+# figure serializzate e HTML delle statistiche, condivisi tra le sessioni
+VIEW_CACHE_DIR = "./.dashboard_cache"
+# da incrementare quando cambia il modo di disegnare figure o statistiche
+VIEW_CACHE_VERSION = 1
+# intervallo minimo tra due controlli dei file dei risultati
+FINGERPRINT_TTL = 2.0
+# intervallo predefinito (secondi) tra due aggiornamenti del monitoraggio live
+LIVE_REFRESH_SEC = 5.0
+
+AGENT_LABELS = {"human": "Human", "ai": "AI"}
+
+def load_cube(paths, fingerprint):
+    """
+    AggregateCube dei risultati: dallo snapshot con la stessa impronta,
+    altrimenti costruito leggendo i chunk un blocco alla volta (e salvato).
+    """
+    snapshot = os.path.join(SNAPSHOT_DIR, f"cube-{fingerprint[:16]}.npz")
+    if os.path.exists(snapshot):
+        return AggregateCube.load(snapshot)
+    cube = AggregateCube()
+    for agent, path in paths.items():
+        if os.path.isdir(path):
+            for tickets, documents in zip(read_columnar_chunks(path, "tickets"), read_columnar_chunks(path, "documents")):
+                cube.update(agent, tickets, documents)
+        else:
+            cube.update(agent, *load_tables(path))
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for old in glob.glob(os.path.join(SNAPSHOT_DIR, "cube-*.npz")):
+        os.remove(old)
+    cube.save(snapshot)
+    return cube
+
+def load_ticket_table(path):
+    """
+    Tabella dei ticket di un output: dallo snapshot se ha la stessa impronta
+    dei file dei risultati, altrimenti dai risultati (e salva lo snapshot).
+    """
+    name = os.path.basename(os.path.normpath(path))
+    snapshot = os.path.join(SNAPSHOT_DIR, f"{name}-{results_fingerprint(path)[:16]}.npz")
+    if os.path.exists(snapshot):
+        with np.load(snapshot, allow_pickle=False) as data:
+            return {k: data[k] for k in data.files}
+    if os.path.isdir(path):
+        tickets = concat_columns(read_columnar_chunks(path, "tickets"))
+    else:
+        tickets = load_tables(path)[0]
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for old in glob.glob(os.path.join(SNAPSHOT_DIR, f"{name}-*.npz")):
+        os.remove(old)
+    tmp_path = snapshot + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **tickets)
+    os.replace(tmp_path, snapshot)
+    return tickets
+
+class DashboardData:
+    """
+    Dati della dashboard, caricati in un thread in background: la UI parte
+    subito e ogni funzione attende solo i dati che le servono. Il riepilogo
+    arriva per primo (solo se la sua firma corrisponde ai file dei
+    risultati), poi i ticket di Human e AI; i documenti servono solo senza
+    riepilogo e si leggono alla prima richiesta. Se i risultati
+    mancano, error contiene il messaggio da mostrare.
+    """
 
-# --- Caricamento dati una sola volta ---
-DATA_PATH_HUMAN = "./simulation_results-human.json"
-DATA_PATH_AI = "./simulation_results-ai.json"
-
-with open(DATA_PATH_HUMAN, "r", encoding="utf-8") as f:
-    DATA_HUMAN = json.load(f)
-with open(DATA_PATH_AI, "r", encoding="utf-8") as f:
-    DATA_AI = json.load(f)
-
-DF_HUMAN = pd.DataFrame([d for d in DATA_HUMAN if isinstance(d, dict)])
-DF_HUMAN["agent_type"] = "Human"
-DF_AI = pd.DataFrame([d for d in DATA_AI if isinstance(d, dict)])
-DF_AI["agent_type"] = "AI"
-
-DF_ALL = pd.concat([DF_HUMAN, DF_AI], ignore_index=True)
+    def __init__(self, paths, summary_path, fingerprint=None):
+        self.paths = paths
+        self.summary_path = summary_path
+        self.fingerprint = fingerprint
+        self.summary = None
+        self.frames = {}
+        self.error = None
+        self._documents = {}
+        self._economics = None
+        self._cube = None
+        self._lock = threading.Lock()
+        self._cube_lock = threading.Lock()
+        self._summary_ready = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load, name="dashboard-data", daemon=True)
+            self._thread.start()
+        return self
+
+    def _load(self):
+        try:
+            if os.path.exists(self.summary_path):
+                summary = KpiAggregator.load(self.summary_path)
+                # un riepilogo di un altro run (o senza firma) non descrive questi
+                # risultati: statistiche e scale si ricalcolano dai ticket
+                if summary.results == results_signature(*self.paths.values()):
+                    self.summary = summary
+            self._summary_ready.set()
+            for agent, path in self.paths.items():
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"risultati non trovati: {path} (eseguire prima simulate.py)")
+                df = pd.DataFrame(load_ticket_table(path))
+                df["agent_type"] = AGENT_LABELS[agent]
+                self.frames[agent] = df
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            self._summary_ready.set()
+            self._ready.set()
+        if self.error is None:
+            # il cubo serve solo ai filtri: si prepara dopo i dati dei grafici
+            self.cube()
+
+    def wait_summary(self):
+        self._summary_ready.wait()
+        return self.summary
+
+    def tickets(self, agent):
+        """DataFrame dei ticket di agent ("human"/"ai"), None se non disponibili."""
+        self._ready.wait()
+        return self.frames.get(agent)
+
+    def documents(self, agent):
+        with self._lock:
+            if agent not in self._documents:
+                self._documents[agent] = pd.DataFrame(load_tables(self.paths[agent])[1])
+            return self._documents[agent]
+
+    def ymax(self, field):
+        """Massimo di un campo sui ticket Human (scala comune dei grafici)."""
+        summary = self.wait_summary()
+        if summary is not None:
+            return summary.agents["human"].maximum[field]
+        df = self.tickets("human")
+        return df[field].max() if df is not None else None
+
+    def economics_statistics(self):
+        """Statistiche sufficienti dei KPI economici (dal riepilogo se presente)."""
+        with self._lock:
+            if self._economics is None:
+                summary = self.wait_summary()
+                if summary is not None:
+                    self._economics = kpi.economics_statistics(summary)
+                elif self.tickets("human") is not None:
+                    self._economics = kpi.economics_statistics_from_tickets(
+                        {agent: self.tickets(agent) for agent in self.paths})
+            return self._economics
+
+    def cube(self):
+        """AggregateCube dei risultati (None se non disponibili)."""
+        self._ready.wait()
+        if self.error is not None:
+            return None
+        with self._cube_lock:
+            if self._cube is None:
+                self._cube = load_cube(self.paths, self.fingerprint or results_fingerprint(*self.paths.values()))
+            return self._cube
+
+_fingerprints = {}
+
+def fingerprint(*paths):
+    """results_fingerprint, ricalcolata al più ogni FINGERPRINT_TTL secondi."""
+    now = time.monotonic()
+    cached = _fingerprints.get(paths)
+    if cached is None or now - cached[0] >= FINGERPRINT_TTL:
+        cached = (now, results_fingerprint(*paths))
+        _fingerprints[paths] = cached
+    return cached[1]
+
+def results_paths():
+    return DATA_PATH_HUMAN, DATA_PATH_AI, SUMMARY_PATH
+
+DATA = DashboardData({"human": DATA_PATH_HUMAN, "ai": DATA_PATH_AI}, SUMMARY_PATH,
+                     fingerprint(*results_paths())).start()
+_data_lock = threading.Lock()
+
+def current_data():
+    """DashboardData dei risultati attuali: se i file sono cambiati li ricarica in background."""
+    global DATA
+    current = fingerprint(*results_paths())
+    with _data_lock:
+        if DATA.fingerprint != current:
+            DATA = DashboardData({"human": DATA_PATH_HUMAN, "ai": DATA_PATH_AI}, SUMMARY_PATH, current).start()
+        return DATA
+
+class ViewCache:
+    """
+    Cache delle viste della dashboard (figure Plotly e HTML delle
+    statistiche) condivisa tra le sessioni, con chiave l'impronta dei
+    risultati e della config economica. Ogni vista è calcolata una sola volta
+    anche con più visitatori contemporanei (un lock per vista) e viene
+    salvata anche su disco, così sopravvive ai riavvii. Una chiave nuova
+    invalida le viste calcolate con quelle vecchie.
+    """
 
-# Calcola i massimi una sola volta
-YMAX_TIME = DF_HUMAN["total_time_min"].max()
-YMAX_COST = DF_HUMAN["total_cost_eur"].max()
+    def __init__(self, directory=VIEW_CACHE_DIR):
+        self.directory = directory
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key, name):
+        return os.path.join(self.directory, key[:32], hashlib.sha256(name.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def _load(self, key, name):
+        try:
+            with open(self._path(key, name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return pio.from_json(data["figure"]) if "figure" in data else data["html"]
+
+    def _save(self, key, name, value):
+        path = self._path(key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # le viste di impronte precedenti non servono più
+        for old in glob.glob(os.path.join(self.directory, "*")):
+            if old != os.path.dirname(path):
+                shutil.rmtree(old, ignore_errors=True)
+        data = {"figure": value.to_json()} if isinstance(value, go.Figure) else {"html": value}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def get(self, name, key, compute, store=lambda value: True):
+        """Vista name per la chiave key: dalla memoria, dal disco o calcolata con compute()."""
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            cached = self._values.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            value = self._load(key, name)
+            if value is None:
+                value = compute()
+                if value is None or not store(value):
+                    return value
+                self._save(key, name, value)
+            self._values[name] = (key, value)
+            return value
+
+VIEWS = ViewCache()
+
+def cached_view(name, compute):
+    """
+    Vista name calcolata da compute(data) sui dati attuali, in cache finché
+    non cambiano i risultati, la config economica o i parametri dei grafici.
+    """
+    data = current_data()
+    key = "-".join([
+        str(VIEW_CACHE_VERSION), data.fingerprint, fingerprint(kpi.ECONOMICS_PATH),
+        str(BOX_MAX_POINTS), str(BOX_MAX_OUTLIERS),
+    ])
+    key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    # senza dati (risultati mancanti) il messaggio di errore non va in cache
+    return VIEWS.get(name, key, lambda: compute(data), store=lambda value: data.error is None)
+
+PROFILE_ORDER = ["junior", "mid", "senior"]
+PROFILE_COLORS = dict(zip(PROFILE_ORDER, px.colors.qualitative.Plotly))
+# punti mostrati per grafico (campione stratificato per profilo, 0 = nessuno)
+# e outlier per profilo: il payload non dipende dal numero di ticket
+BOX_MAX_POINTS = 1000
+BOX_MAX_OUTLIERS = 200
+
+def box_statistics(values):
+    """
+    Statistiche di un box plot calcolate lato server: quartili (interpolazione
+    lineare, come Plotly), baffi a 1.5 IQR, media e outlier ordinati.
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {
+        "n": len(values),
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lowerfence": inside[0],
+        "upperfence": inside[-1],
+        "mean": values.mean(),
+        "outliers": values[(values < inside[0]) | (values > inside[-1])],
+    }
 
-def plot_cost_per_profile():
-    df = DF_HUMAN
-    tickets = df[df["profile"].isin(["junior", "mid", "senior"]) & df["total_cost_eur"].notnull()]
+def thin_sorted(values, max_count):
+    """Al più max_count valori di un array ordinato, equispaziati e con gli estremi."""
+    if len(values) <= max_count:
+        return values
+    return values[np.unique(np.linspace(0, len(values) - 1, max_count).round().astype(int))]
+
+def stratified_sample(df, field, max_points, seed=0):
+    """Campione di al più max_points valori, ripartiti tra i profili in proporzione ai ticket."""
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for profile, values in df.groupby("profile", observed=True)[field]:
+        k = min(len(values), max(1, round(max_points * len(values) / len(df))))
+        samples[profile] = rng.choice(values.to_numpy(), k, replace=False)
+    return samples
+
+def profile_box_figure(data, agent, field, title, y_label, max_points=BOX_MAX_POINTS, max_outliers=BOX_MAX_OUTLIERS):
+    """
+    Box plot di field per profilo con statistiche precalcolate: si inviano
+    al browser solo quartili, baffi, media, al più max_outliers outlier per
+    profilo e un campione stratificato di max_points punti.
+    """
+    df = data.tickets(agent)
+    if df is None:
+        return None
+    tickets = df[df["profile"].isin(PROFILE_ORDER) & df[field].notnull()]
     if tickets.empty:
         return "Nessun ticket valido trovato nei dati."
-    fig = px.box(
-        tickets,
-        x="profile",
-        y="total_cost_eur",
-        color="profile",
-        points="all",
-        title="Distribuzione costo totale per ticket per profilo",
-        labels={
-            "profile": "Profilo",
-            "total_cost_eur": "Costo totale ticket (€)"
-        },
-        category_orders={"profile": ["junior", "mid", "senior"]},
-        range_y=[0, YMAX_COST],
-        template="plotly_dark"
+    samples = stratified_sample(tickets, field, max_points) if max_points else {}
+
+    fig = go.Figure()
+    for profile in PROFILE_ORDER:
+        values = tickets.loc[tickets["profile"] == profile, field]
+        if values.empty:
+            continue
+        s = box_statistics(values)
+        color = PROFILE_COLORS[profile]
+        fig.add_trace(go.Box(
+            name=profile, x=[profile], q1=[s["q1"]], median=[s["median"]], q3=[s["q3"]],
+            lowerfence=[s["lowerfence"]], upperfence=[s["upperfence"]], mean=[s["mean"]],
+            marker_color=color, legendgroup=profile, boxpoints=False,
+            hovertemplate=f"{profile} ({s['n']:,} ticket)<extra></extra>",
+        ))
+        if profile in samples:
+            # box invisibile: serve solo a disporre i punti del campione con jitter
+            fig.add_trace(go.Box(
+                x=[profile] * len(samples[profile]), y=samples[profile], name=profile, legendgroup=profile,
+                boxpoints="all", jitter=0.4, pointpos=0, fillcolor="rgba(0,0,0,0)", line_width=0,
+                marker=dict(color=color, size=3, opacity=0.5), showlegend=False, hoveron="points",
+            ))
+        outliers = thin_sorted(s["outliers"], max_outliers)
+        if len(outliers):
+            fig.add_trace(go.Scatter(
+                x=[profile] * len(outliers), y=outliers, mode="markers", name=f"{profile} outlier",
+                legendgroup=profile, showlegend=False, marker=dict(color=color, size=5, symbol="circle-open"),
+            ))
+    return box_layout(fig, title, y_label, data.ymax(field))
+
+def box_layout(fig, title, y_label, ymax):
+    fig.update_layout(
+        title=title,
+        xaxis=dict(title="Profilo", categoryorder="array", categoryarray=PROFILE_ORDER),
+        yaxis=dict(title=y_label, range=[0, ymax]),
+        legend_title_text="Profilo",
+        template="plotly_dark",
     )
     return fig
 
+def sketch_box_figure(agg, field, title, y_label, ymax):
+    """
+    Box plot di field per profilo dagli sketch di un AgentAggregate:
+    quartili approssimati, baffi a 1.5 IQR limitati a minimo e massimo, senza
+    punti. Il costo non dipende dal numero di ticket, quindi si può
+    ridisegnare a ogni aggiornamento di un run in corso.
+    """
+    fig = go.Figure()
+    for profile in PROFILE_ORDER:
+        if profile not in agg.sketches:
+            continue
+        sketch = agg.sketches[profile][field]
+        q1, median, q3 = (sketch.quantile(q) for q in (0.25, 0.5, 0.75))
+        fig.add_trace(go.Box(
+            name=profile, x=[profile], q1=[q1], median=[median], q3=[q3],
+            lowerfence=[max(q1 - 1.5 * (q3 - q1), agg.minimum[field])],
+            upperfence=[min(q3 + 1.5 * (q3 - q1), agg.maximum[field])],
+            marker_color=PROFILE_COLORS[profile], boxpoints=False,
+        ))
+    return box_layout(fig, title, y_label, ymax)
+
+def cached_box_figure(agent, field, title, y_label):
+    return cached_view(f"box:{agent}:{field}:{title}",
+                       lambda data: profile_box_figure(data, agent, field, title, y_label))
+
+def plot_cost_per_profile():
+    return cached_box_figure("human", "total_cost_eur", "Distribuzione costo totale per ticket per profilo",
+                             "Costo totale ticket (€)")
+
 def plot_cost_per_profile_ai():
-    df = DF_AI
-    tickets = df[df["profile"].isin(["junior", "mid", "senior"]) & df["total_cost_eur"].notnull()]
-    if tickets.empty:
-        return "Nessun ticket valido trovato nei dati."
-    fig = px.box(
-        tickets,
-        x="profile",
-        y="total_cost_eur",
-        color="profile",
-        points="all",
-        title="Distribuzione costo totale per ticket per profilo (AI)",
-        labels={
-            "profile": "Profilo",
-            "total_cost_eur": "Costo totale ticket (€)"
-        },
-        category_orders={"profile": ["junior", "mid", "senior"]},
-        range_y=[0, YMAX_COST],
-        template="plotly_dark"
-    )
-    return fig
+    return cached_box_figure("ai", "total_cost_eur", "Distribuzione costo totale per ticket per profilo (AI)",
+                             "Costo totale ticket (€)")
 
 def boxplot_time_vs_complexity_per_profile():
-    df = DF_HUMAN
-    tickets = df[df["profile"].isin(["junior", "mid", "senior"]) & df["total_time_min"].notnull()]
-    if tickets.empty:
-        return "Nessun ticket valido trovato nei dati."
-    fig = px.box(
-        tickets,
-        x="profile",
-        y="total_time_min",
-        color="profile",
-        points="all",
-        title="Distribuzione tempo di chiusura per ticket per profilo",
-        labels={
-            "profile": "Profilo",
-            "total_time_min": "Tempo chiusura ticket (min)"
-        },
-        category_orders={"profile": ["junior", "mid", "senior"]},
-        range_y=[0, YMAX_TIME],
-        template="plotly_dark"
-    )
-    return fig
+    return cached_box_figure("human", "total_time_min", "Distribuzione tempo di chiusura per ticket per profilo",
+                             "Tempo chiusura ticket (min)")
 
 def boxplot_time_vs_complexity_per_profile_ai():
-    df = DF_AI
-    tickets = df[df["profile"].isin(["junior", "mid", "senior"]) & df["total_time_min"].notnull()]
-    if tickets.empty:
-        return "Nessun ticket valido trovato nei dati."
-    fig = px.box(
-        tickets,
-        x="profile",
-        y="total_time_min",
-        color="profile",
-        points="all",
-        title="Distribuzione tempo di chiusura per ticket per profilo (AI)",
-        labels={
-            "profile": "Profilo",
-            "total_time_min": "Tempo chiusura ticket (min)"
-        },
-        category_orders={"profile": ["junior", "mid", "senior"]},
-        range_y=[0, YMAX_TIME],
-        template="plotly_dark"
-    )
-    return fig
+    return cached_box_figure("ai", "total_time_min",
+                             "Distribuzione tempo di chiusura per ticket per profilo (AI)",
+                             "Tempo chiusura ticket (min)")
 
 def boxplot_cost_vs_complexity_per_profile():
-    df = DF_HUMAN
-    tickets = df[df["profile"].isin(["junior", "mid", "senior"]) & df["total_cost_eur"].notnull()]
-    if tickets.empty:
-        return "Nessun ticket valido trovato nei dati."
-    fig = px.box(
-        tickets,
-        x="profile",
-        y="total_cost_eur",
-        color="profile",
-        points="all",
-        title="Distribuzione costo totale per ticket per profilo",
-        labels={
-            "profile": "Profilo",
-            "total_cost_eur": "Costo totale ticket (€)"
-        },
-        category_orders={"profile": ["junior", "mid", "senior"]},
-        range_y=[0, YMAX_COST],
-        template="plotly_dark"
-    )
-    return fig
+    return cached_box_figure("human", "total_cost_eur", "Distribuzione costo totale per ticket per profilo",
+                             "Costo totale ticket (€)")
 
 def boxplot_cost_vs_complexity_per_profile_ai():
-    df = DF_AI
-    tickets = df[df["profile"].isin(["junior", "mid", "senior"]) & df["total_cost_eur"].notnull()]
-    if tickets.empty:
-        return "Nessun ticket valido trovato nei dati."
-    fig = px.box(
-        tickets,
-        x="profile",
-        y="total_cost_eur",
-        color="profile",
-        points="all",
-        title="Distribuzione costo totale per ticket per profilo (AI)",
-        labels={
-            "profile": "Profilo",
-            "total_cost_eur": "Costo totale ticket (€)"
-        },
-        category_orders={"profile": ["junior", "mid", "senior"]},
-        range_y=[0, YMAX_COST],
-        template="plotly_dark"
-    )
-    return fig
+    return cached_box_figure("ai", "total_cost_eur", "Distribuzione costo totale per ticket per profilo (AI)",
+                             "Costo totale ticket (€)")
 
-def get_ticket_revenue(avg_complexity, ticket_revenue_cfg):
-    for level, info in ticket_revenue_cfg.items():
-        min_r, max_r = info['range']
-        if min_r <= avg_complexity <= max_r:
-            return info['revenue']
-    return 0  # fallback
-
-def compute_statistics_dict(df, data, label=""):
-    # Carica dati economici dal config YAML
-    with open("config-economics-kpi.yaml", "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    economics = config["economics"]
-    ticket_revenue_cfg = economics["ticket_revenue"]
-    investment = economics["investment"]
-    equity = economics["equity"]
-    discount_rate = economics["discount_rate"]
-    periods = economics["periods"]  # es: 5
-    taxes = economics["taxes"]
-
-    # Calcola il revenue per ogni ticket in base alla sua complessità media
-    revenues = []
-    for _, row in df.iterrows():
-        avg_complexity = row.get("avg_doc_complexity", 0)
-        revenue = get_ticket_revenue(avg_complexity, ticket_revenue_cfg)
-        revenues.append(revenue)
-    df["revenue"] = revenues
-
-    # --- Calcoli annualizzati ---
-    total_tickets = len(df)
-    total_revenue = df["revenue"].sum()
-    total_cost = df["total_cost_eur"].sum()
-    operating_income = total_revenue - total_cost
-    net_income = operating_income * (1 - taxes)
-
-    # Annualizza i valori
-    tickets_per_year = total_tickets / periods
-    revenue_per_year = total_revenue / periods
-    cost_per_year = total_cost / periods
-    operating_income_per_year = operating_income / periods
-    net_income_per_year = net_income / periods
-
-    # KPI annualizzati
-    roi = (net_income_per_year / investment) * 100 if investment else 0
-    ros = (operating_income_per_year / revenue_per_year) * 100 if revenue_per_year else 0
-    roe = (net_income_per_year / equity) * 100 if equity else 0
-
-    # NPV su 5 anni (già corretto)
-    cash_flow = net_income_per_year
-    npv = -investment
-    for t in range(1, periods + 1):
-        npv += cash_flow / ((1 + discount_rate) ** t)
-
-    # Statistiche base ticket
-    total_tickets = len(df)
-    tickets_per_profile = df["profile"].value_counts().to_dict()
-    avg_time = df["total_time_min"].mean()
-    min_time = df["total_time_min"].min()
-    max_time = df["total_time_min"].max()
-    avg_cost = df["total_cost_eur"].mean()
-    min_cost = df["total_cost_eur"].min()
-    max_cost = df["total_cost_eur"].max()
-    avg_errors = df["total_errors"].mean()
-    late_pct = 100 * df["is_late"].sum() / total_tickets if total_tickets else 0
-    avg_docs = df["num_documents_consulted"].mean()
-    avg_words = df["response_words"].mean()
-    avg_stress = df["current_stress"].mean()
-    avg_write_time = df["time_write_response_min"].mean()
-
-    # Statistiche documenti
-    docs = []
-    for t in data:
-        docs.extend(t.get("documents_details", []))
-    df_docs = pd.DataFrame(docs)
-    if not df_docs.empty:
-        avg_doc_complexity = df_docs["complexity"].mean()
-        avg_doc_pages = df_docs["num_pages"].mean()
-        avg_doc_words = df_docs["doc_words"].mean()
-        avg_doc_read = df_docs["read_doc_time_min"].mean()
-        avg_doc_open = df_docs["open_doc_time_min"].mean()
-        avg_doc_nav = df_docs["navigation_time_min"].mean()
-        avg_doc_wait = df_docs["wait_time_min"].mean()
-        avg_doc_proc = df_docs["processing_time_min"].mean()
-        avg_doc_errors = df_docs["errors"].mean()
-        pct_doc_memover = 100 * df_docs["memory_overload"].sum() / len(df_docs)
-        doc_sources = df_docs["document_source"].value_counts(normalize=True).to_dict()
-    else:
-        avg_doc_complexity = avg_doc_pages = avg_doc_words = avg_doc_read = avg_doc_open = avg_doc_nav = avg_doc_wait = avg_doc_proc = avg_doc_errors = pct_doc_memover = 0
-        doc_sources = {}
-
-    # --- KPI ECONOMICI ---
-    total_cost = df["total_cost_eur"].sum()
-    operating_income = total_revenue - total_cost
-    net_income = operating_income * (1 - taxes)
-    roi = (net_income / investment) * 100 if investment else 0
-    ros = (operating_income / total_revenue) * 100 if total_revenue else 0
-    roe = (net_income / equity) * 100 if equity else 0
-    cash_flow = net_income / periods if periods else 0
-    npv = -investment
-    for t in range(1, periods + 1):
-        npv += cash_flow / ((1 + discount_rate) ** t)
-
-    # Ritorna dizionari per ogni sezione
-    return {
-        "kpi": {
-            f"Ricavi totali (5 anni){label}": f"€{total_revenue:,.2f}",
-            f"Ricavi medi annui{label}": f"€{revenue_per_year:,.2f}",
-            f"Costi totali (5 anni){label}": f"€{total_cost:,.2f}",
-            f"Costi medi annui{label}": f"€{cost_per_year:,.2f}",
-            f"Utile operativo medio annuo{label}": f"€{operating_income_per_year:,.2f}",
-            f"Utile netto medio annuo{label}": f"€{net_income_per_year:,.2f}",
-            f"ROI annuo{label}": f"{roi:.2f} %",
-            f"ROS annuo{label}": f"{ros:.2f} %",
-            f"ROE annuo{label}": f"{roe:.2f} %",
-            f"NPV (5 anni){label}": f"€{npv:,.2f}"
-        },
-        "generali": {
-            "Ticket totali": total_tickets,
-            "Ticket per profilo": tickets_per_profile,
-            "Tempo chiusura ticket (media/min/max)": f"{avg_time:.2f} / {min_time:.2f} / {max_time:.2f} min",
-            "Costo per ticket (media/min/max)": f"€{avg_cost:.2f} / €{min_cost:.2f} / €{max_cost:.2f}",
-            "Errori medi per ticket": f"{avg_errors:.2f}",
-            "Ticket in ritardo (%)": f"{late_pct:.1f}",
-            "Documenti consultati medi": f"{avg_docs:.2f}",
-            "Parole medie risposta": f"{avg_words:.2f}",
-            "Stress medio": f"{avg_stress:.2f}",
-            "Tempo medio scrittura risposta": f"{avg_write_time:.2f} min"
-        },
-        "documenti": {
-            "Documenti totali": len(df_docs),
-            "Complessità media": f"{avg_doc_complexity:.2f}",
-            "Pagine medie": f"{avg_doc_pages:.2f}",
-            "Parole medie": f"{avg_doc_words:.2f}",
-            "Tempo medio lettura": f"{avg_doc_read:.2f} min",
-            "Tempo medio apertura": f"{avg_doc_open:.2f} min",
-            "Tempo medio navigazione": f"{avg_doc_nav:.2f} min",
-            "Tempo medio attesa": f"{avg_doc_wait:.2f} min",
-            "Tempo medio processing": f"{avg_doc_proc:.2f} min",
-            "Errori medi per documento": f"{avg_doc_errors:.2f}",
-            "% memory overload": f"{pct_doc_memover:.1f}%",
-            "Fonti documenti": doc_sources
-        }
-    }
+def compute_statistics_dict(df, df_docs, label=""):
+    return kpi.statistics_dict(df, df_docs, kpi.load_economics(), label)
+
+def compute_statistics_from_summary(agg, label=""):
+    """
+    Stesso risultato di compute_statistics_dict, calcolato dal riepilogo
+    (AgentAggregate) invece che dai ticket.
+    """
+    return kpi.statistics_from_aggregate(agg, kpi.load_economics(), label)
+
+def status_html(message):
+    return f'<div style="padding:18px;color:#ffd600;">{message}</div>'
 
 def pretty_stats():
-    stats_human = compute_statistics_dict(DF_HUMAN, DATA_HUMAN, "")
-    stats_ai = compute_statistics_dict(DF_AI, DATA_AI, " (AI)")
+    return cached_view("stats", stats_html)
+
+def stats_html(data):
+    summary = data.wait_summary()
+    if summary is not None:
+        stats_human = compute_statistics_from_summary(summary.agents["human"], "")
+        stats_ai = compute_statistics_from_summary(summary.agents["ai"], " (AI)")
+    elif data.tickets("human") is not None:
+        stats_human = compute_statistics_dict(data.tickets("human"), data.documents("human"), "")
+        stats_ai = compute_statistics_dict(data.tickets("ai"), data.documents("ai"), " (AI)")
+    else:
+        return status_html(f"Dati non disponibili: {data.error}")
+    return render_stats(stats_human, stats_ai)
 
+def render_stats(stats_human, stats_ai):
     # Accoppia le Statistiche Generali per chiave base
     generali_pairs = []
     for k in stats_human['generali']:
@@ -409,8 +566,266 @@ def pretty_stats():
     """
     return html
 
+def what_if_table(investment, equity, discount_rate, periods, taxes, *band_revenues):
+    """KPI economici per agente e profilo con i parametri degli slider, senza rileggere i ticket."""
+    economics = dict(kpi.load_economics())
+    economics.update(investment=investment, equity=equity, discount_rate=discount_rate,
+                     periods=int(periods), taxes=taxes)
+    economics["ticket_revenue"] = {
+        band: dict(info, revenue=revenue)
+        for (band, info), revenue in zip(economics["ticket_revenue"].items(), band_revenues)
+    }
+    stats = current_data().economics_statistics()
+    if stats is None:
+        return pd.DataFrame()
+    rows = []
+    for (agent, profile), k in kpi.what_if_kpis(stats, economics).items():
+        rows.append({
+            "Agente": AGENT_LABELS.get(agent, agent),
+            "Profilo": profile,
+            "Ricavi totali (€)": round(k["total_revenue"], 2),
+            "Costi totali (€)": round(k["total_cost"], 2),
+            "Utile netto annuo (€)": round(k["net_income_per_year"], 2),
+            "ROI (%)": round(k["roi"], 2),
+            "ROS (%)": round(k["ros"], 2),
+            "ROE (%)": round(k["roe"], 2),
+            "NPV (€)": round(k["npv"], 2),
+        })
+    return pd.DataFrame(rows)
+
+CUBE_LABELS = {
+    "agent": "Agente",
+    "profile": "Profilo",
+    "is_late": "In ritardo",
+    "stress_band": "Fascia di stress",
+    "complexity_band": "Fascia di complessità",
+    "document_source": "Fonte prevalente",
+}
+LATE_LABELS = {False: "no", True: "sì"}
+
+def cube_choices(base_config_path="config.yaml"):
+    """Livelli dei filtri come (etichetta, valore); le fonti vengono dalla config."""
+    with open(base_config_path, "r", encoding="utf-8") as f:
+        sources = list(yaml.safe_load(f)["document_sources"])
+    return {
+        "agent": [(AGENT_LABELS[a], a) for a in AGENT_LABELS],
+        "profile": [(p, p) for p in PROFILE_ORDER],
+        "is_late": [(LATE_LABELS[v], str(v).lower()) for v in (False, True)],
+        "stress_band": [(name, name) for name, _ in STRESS_BANDS],
+        "complexity_band": [(name, name) for name, _ in COMPLEXITY_BANDS],
+        "document_source": [(source, source) for source in sources],
+    }
+
+def cube_table(live, group_by, *selections):
+    """
+    Tabella degli aggregati per group_by con i filtri selezionati, dal cubo
+    dei risultati oppure, con live, da quello del run seguito da LIVE.
+    """
+    if live:
+        cube, query, source = LIVE.cube, LIVE.query, "letti dal run in corso"
+        if not cube.tickets:
+            return pd.DataFrame(), "In attesa dei primi chunk del run in corso..."
+    else:
+        cube = current_data().cube()
+        if cube is None:
+            return pd.DataFrame(), f"Dati non disponibili: {current_data().error}"
+        query, source = cube.query, "nel cubo"
+    filters = {dim: list(values) for dim, values in zip(DIMENSIONS, selections) if values}
+    if "is_late" in filters:
+        filters["is_late"] = [value == "true" for value in filters["is_late"]]
+    started = time.perf_counter()
+    if group_by:
+        groups = query(filters, group_by=group_by)
+    else:
+        # "Raggruppa per" vuoto: una sola riga con il totale della selezione
+        groups = {"totale": query(filters)}
+    elapsed = 1000 * (time.perf_counter() - started)
+    rows = []
+    for level, g in groups.items():
+        label = AGENT_LABELS.get(level, level) if group_by == "agent" else LATE_LABELS.get(level, level)
+        rows.append({
+            CUBE_LABELS[group_by] if group_by else "Selezione": label,
+            "Ticket": g["tickets"],
+            "Costo medio (€)": round(g["avg_total_cost_eur"], 2),
+            "Costo p50 / p90 (€)": f"{g['p50_total_cost_eur']:.2f} / {g['p90_total_cost_eur']:.2f}",
+            "Tempo medio (min)": round(g["avg_total_time_min"], 2),
+            "Tempo p50 / p90 (min)": f"{g['p50_total_time_min']:.2f} / {g['p90_total_time_min']:.2f}",
+            "Errori medi": round(g["avg_total_errors"], 2),
+            "Documenti medi": round(g["avg_num_documents_consulted"], 2),
+        })
+    return pd.DataFrame(rows), f"{cube.tickets:,} ticket {source}, query in {elapsed:.1f} ms"
+
+def cached_scenarios():
+    """Tabella dei run nella cache dei risultati, dal più usato di recente."""
+    rows = []
+    for entry in ResultCache().entries():
+        delta = entry.get("deltas", {})
+        rows.append({
+            "Scenario": entry["key"][:12],
+            "Config": f"{entry['base_config']} + {entry['ai_config']}",
+            "Seed": entry["seed"],
+            "Ticket": entry["n_tickets"],
+            "Motore": entry["engine"] + (" paired" if entry.get("paired") else "")
+                      + (f" {entry['sampler']}" if entry.get("sampler", "random") != "random" else ""),
+            "Δ costo medio (€)": round(delta["total_cost_eur"]["mean"], 2) if "total_cost_eur" in delta else None,
+            "Δ tempo medio (min)": round(delta["total_time_min"]["mean"], 2) if "total_time_min" in delta else None,
+            "Dimensione (MB)": round(entry["size_bytes"] / 1024 ** 2, 1),
+            "Ultimo uso": datetime.fromtimestamp(entry["last_used"]).strftime("%Y-%m-%d %H:%M"),
+        })
+    return pd.DataFrame(rows)
+
+class LiveMonitor:
+    """
+    Segue un run di simulate.py in corso. I chunk colonnari sono i lotti
+    append-only del run: a ogni poll si leggono solo quelli comparsi dopo il
+    poll precedente (e completi per ticket e documenti), aggiungendoli a un
+    KpiAggregator e a un AggregateCube, senza rileggere i ticket già visti.
+    Mentre si segue il run, il cubo risponde ai filtri di "Esplora per
+    dimensioni" (cube_table). Se spariscono chunk già letti è partito un
+    nuovo run e si ricomincia.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.seen = {agent: set() for agent in self.paths}
+        self.aggregator = KpiAggregator()
+        self.cube = AggregateCube()
+        self.last_change = None
+
+    def poll(self):
+        """Aggiunge i chunk nuovi e restituisce il numero di ticket aggiunti."""
+        with self._lock:
+            ready = {}
+            for agent, path in self.paths.items():
+                if not os.path.isdir(path):
+                    ready[agent] = set()
+                    continue
+                ready[agent] = set(chunk_indices(path, "tickets")) & set(chunk_indices(path, "documents"))
+            if any(not self.seen[agent] <= ready[agent] for agent in self.paths):
+                self.reset()
+            added = 0
+            for agent, path in self.paths.items():
+                for index in sorted(ready[agent] - self.seen[agent]):
+                    tickets = read_chunk(path, "tickets", index)
+                    documents = read_chunk(path, "documents", index)
+                    self.aggregator.update(agent, tickets, documents)
+                    self.cube.update(agent, tickets, documents)
+                    self.seen[agent].add(index)
+                    added += len(tickets["ticket_id"])
+            if added:
+                self.last_change = time.monotonic()
+            return added
+
+    def query(self, filters=None, group_by=None):
+        """AggregateCube.query sul cubo del run, senza interferire con un poll in corso."""
+        with self._lock:
+            return self.cube.query(filters, group_by=group_by)
+
+LIVE = LiveMonitor({"human": DATA_PATH_HUMAN, "ai": DATA_PATH_AI})
+
+def live_status(added):
+    agents = LIVE.aggregator.agents
+    if not agents["human"].tickets:
+        return f"In attesa dei primi chunk in {DATA_PATH_HUMAN} e {DATA_PATH_AI}..."
+    idle = time.monotonic() - LIVE.last_change
+    lines = [f"**{agents['human'].tickets:,}** ticket Human e **{agents['ai'].tickets:,}** AI letti "
+             f"({added:,} nuovi in questo aggiornamento, ultimo chunk {idle:.0f} s fa)"]
+    if os.path.exists(STOP_FILE):
+        lines.append("Stop richiesto: il run si ferma alla fine del blocco in corso.")
+    return "\n\n".join(lines)
+
+def live_update():
+    """Legge i chunk nuovi; statistiche e grafici si ridisegnano solo se ci sono ticket nuovi."""
+    added = LIVE.poll()
+    agents = LIVE.aggregator.agents
+    if not added or not agents["human"].tickets:
+        return live_status(added), gr.skip(), gr.skip(), gr.skip()
+    stats = render_stats(compute_statistics_from_summary(agents["human"], ""),
+                         compute_statistics_from_summary(agents["ai"], " (AI)"))
+    ymax = agents["human"].maximum["total_cost_eur"]
+    figures = [
+        sketch_box_figure(agents[agent], "total_cost_eur",
+                          f"Costo totale per ticket per profilo ({AGENT_LABELS[agent]}, run in corso)",
+                          "Costo totale ticket (€)", ymax)
+        for agent in ("human", "ai")
+    ]
+    return live_status(added), stats, *figures
+
+def stop_simulation():
+    """Chiede a simulate.py di fermarsi a fine blocco (salvando il checkpoint)."""
+    with open(STOP_FILE, "w", encoding="utf-8") as f:
+        f.write(datetime.now().isoformat(timespec="seconds"))
+    return live_status(0)
+
 with gr.Blocks() as demo:
-    gr.HTML(pretty_stats())
+    # la pagina è servita subito; statistiche e grafici arrivano man mano che i dati sono pronti
+    out_stats = gr.HTML(status_html("Caricamento dei risultati..."))
+    demo.load(pretty_stats, inputs=None, outputs=out_stats)
+
+    with gr.Accordion("Analisi what-if dei KPI economici", open=False):
+        economics = kpi.load_economics()
+        with gr.Row():
+            what_if_inputs = [
+                gr.Slider(0, max(1_000_000, 2 * economics["investment"]), value=economics["investment"],
+                          step=1000, label="Investimento (€)"),
+                gr.Slider(0, max(1_000_000, 2 * economics["equity"]), value=economics["equity"],
+                          step=1000, label="Capitale proprio (€)"),
+                gr.Slider(0, 0.3, value=economics["discount_rate"], step=0.005, label="Tasso di sconto"),
+                gr.Slider(1, 20, value=economics["periods"], step=1, label="Periodi (anni)"),
+                gr.Slider(0, 0.6, value=economics["taxes"], step=0.01, label="Aliquota fiscale"),
+            ]
+        with gr.Row():
+            what_if_inputs += [
+                gr.Slider(0, max(2000, 2 * info["revenue"]), value=info["revenue"], step=5,
+                          label=f"Ricavo ticket {band} (complessità {info['range'][0]}-{info['range'][1]}, €)")
+                for band, info in economics["ticket_revenue"].items()
+            ]
+        out_what_if = gr.Dataframe(label="KPI per agente e profilo")
+        for slider in what_if_inputs:
+            slider.change(what_if_table, inputs=what_if_inputs, outputs=out_what_if)
+        demo.load(what_if_table, inputs=what_if_inputs, outputs=out_what_if)
+
+    with gr.Accordion("Esplora per dimensioni", open=False):
+        choices = cube_choices()
+        with gr.Row():
+            cube_group_by = gr.Dropdown([(CUBE_LABELS[d], d) for d in DIMENSIONS], value="profile",
+                                        label="Raggruppa per")
+            cube_filters = [gr.CheckboxGroup(choices[d], label=CUBE_LABELS[d]) for d in DIMENSIONS]
+        out_cube_info = gr.Markdown()
+        out_cube = gr.Dataframe(label="Aggregati (tutti i livelli se nessun filtro è selezionato)")
+
+    with gr.Accordion("Scenari in cache", open=False):
+        out_cached = gr.Dataframe(label="Run in .result_cache (simulate.py --seed ...)")
+        gr.Button("Aggiorna").click(cached_scenarios, inputs=None, outputs=out_cached)
+        demo.load(cached_scenarios, inputs=None, outputs=out_cached)
+
+    with gr.Accordion("Monitoraggio live di un run in corso", open=False):
+        live_timer = gr.Timer(LIVE_REFRESH_SEC, active=False)
+        with gr.Row():
+            live_follow = gr.Checkbox(False, label="Segui il run")
+            live_interval = gr.Slider(1, 60, value=LIVE_REFRESH_SEC, step=1, label="Aggiornamento (s)")
+            live_stop = gr.Button("Ferma la simulazione", variant="stop")
+        out_live_status = gr.Markdown()
+        out_live_stats = gr.HTML()
+        with gr.Row():
+            out_live_human = gr.Plot(label="Costo per profilo (Human, live)")
+            out_live_ai = gr.Plot(label="Costo per profilo (AI, live)")
+        live_outputs = [out_live_status, out_live_stats, out_live_human, out_live_ai]
+        live_follow.change(lambda follow: gr.Timer(active=follow), inputs=live_follow, outputs=live_timer)
+        live_interval.change(lambda seconds: gr.Timer(value=seconds), inputs=live_interval, outputs=live_timer)
+        live_stop.click(stop_simulation, inputs=None, outputs=out_live_status)
+
+    # i filtri interrogano il cubo del run in corso mentre lo si segue, altrimenti quello dei risultati
+    cube_inputs = [live_follow, cube_group_by] + cube_filters
+    for widget in [live_follow, cube_group_by] + cube_filters:
+        widget.change(cube_table, inputs=cube_inputs, outputs=[out_cube, out_cube_info])
+    live_timer.tick(live_update, inputs=None, outputs=live_outputs).then(
+        cube_table, inputs=cube_inputs, outputs=[out_cube, out_cube_info])
+    demo.load(cube_table, inputs=cube_inputs, outputs=[out_cube, out_cube_info])
 
     gr.Markdown("## Distribuzione tempo di chiusura per ticket per profilo")
     with gr.Row():
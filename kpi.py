@@ -0,0 +1,293 @@
+import os
+
+import numpy as np
+import yaml
+
+from aggregator import COMPLEXITY_BINS, COMPLEXITY_SCALE, complexity_bins
+
+
+ECONOMICS_PATH = "config-economics-kpi.yaml"
+
+_economics_cache = {}
+
+
+def load_economics(path=ECONOMICS_PATH):
+    """
+    Sezione economics di config-economics-kpi.yaml. Il file viene riletto
+    solo se è cambiato (mtime), non a ogni calcolo delle statistiche.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _economics_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, yaml.safe_load(f)["economics"])
+        _economics_cache[path] = cached
+    return cached[1]
+
+
+def ticket_revenue(avg_complexity, ticket_revenue_cfg):
+    """
+    Ricavo per ticket in base alla complessità media, per un array di
+    complessità: ogni valore cade nella fascia [min, max] che lo contiene,
+    0 se non è coperto da nessuna fascia (le fasce non si sovrappongono).
+    """
+    bands = sorted(ticket_revenue_cfg.values(), key=lambda info: info['range'][0])
+    low = np.array([info['range'][0] for info in bands], dtype=float)
+    high = np.array([info['range'][1] for info in bands], dtype=float)
+    revenue = np.array([info['revenue'] for info in bands], dtype=float)
+
+    avg_complexity = np.asarray(avg_complexity, dtype=float)
+    band = np.searchsorted(low, avg_complexity, side="right") - 1
+    inside = (band >= 0) & (avg_complexity <= high[np.maximum(band, 0)])
+    return np.where(inside, revenue[np.maximum(band, 0)], 0.0)
+
+
+def economic_kpis(total_revenue, total_cost, economics):
+    """
+    KPI economici da ricavi e costi totali sui `periods` periodi. Accetta
+    scalari o array (un valore per scenario) e restituisce array della
+    stessa forma.
+    """
+    investment = economics["investment"]
+    equity = economics["equity"]
+    discount_rate = economics["discount_rate"]
+    periods = economics["periods"]
+    taxes = economics["taxes"]
+
+    total_revenue = np.asarray(total_revenue, dtype=float)
+    total_cost = np.asarray(total_cost, dtype=float)
+    operating_income = total_revenue - total_cost
+    net_income = operating_income * (1 - taxes)
+
+    # NPV: flusso costante per periodo attualizzato
+    discount = np.sum(1 / (1 + discount_rate) ** np.arange(1, periods + 1))
+    cash_flow = net_income / periods if periods else np.zeros_like(net_income)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ros = np.where(total_revenue != 0, operating_income / total_revenue * 100, 0.0)
+    return {
+        "total_revenue": total_revenue,
+        "total_cost": total_cost,
+        "revenue_per_year": total_revenue / periods,
+        "cost_per_year": total_cost / periods,
+        "operating_income_per_year": operating_income / periods,
+        "net_income_per_year": net_income / periods,
+        "roi": net_income / investment * 100 if investment else np.zeros_like(net_income),
+        "ros": ros,
+        "roe": net_income / equity * 100 if equity else np.zeros_like(net_income),
+        "npv": -investment + cash_flow * discount,
+    }
+
+
+ALL_PROFILES = "tutti"
+
+
+def economics_statistics(aggregator):
+    """
+    Statistiche sufficienti dei KPI economici da un KpiAggregator: per
+    agente e profilo (più ALL_PROFILES), ticket e somma dei costi per bin di
+    complessità media. I ricavi dipendono dai ticket solo attraverso questi
+    conteggi, quindi what_if_kpis non rilegge mai i ticket.
+    """
+    groups, counts, costs = [], [], []
+    for agent, agg in aggregator.agents.items():
+        groups.append((agent, ALL_PROFILES))
+        counts.append(agg.complexity_counts)
+        costs.append(agg.complexity_costs)
+        for profile in sorted(agg.profile_complexity):
+            groups.append((agent, profile))
+            counts.append(agg.profile_complexity[profile][0])
+            costs.append(agg.profile_complexity[profile][1])
+    return {
+        "groups": groups,
+        "counts": np.array(counts, dtype=float),
+        "total_costs": np.array(costs).sum(axis=1),
+    }
+
+
+def economics_statistics_from_tickets(tables):
+    """Come economics_statistics, dalle tabelle dei ticket per agente ({"human": tickets, ...})."""
+    groups, counts, costs = [], [], []
+    for agent, tickets in tables.items():
+        bins = complexity_bins(tickets["avg_doc_complexity"])
+        cost = np.asarray(tickets["total_cost_eur"], dtype=float)
+        profile = np.asarray(tickets["profile"])
+        for name in [ALL_PROFILES] + sorted(set(profile.tolist())):
+            mask = np.ones(len(bins), dtype=bool) if name == ALL_PROFILES else profile == name
+            groups.append((agent, name))
+            counts.append(np.bincount(bins[mask], minlength=COMPLEXITY_BINS))
+            costs.append(float(cost[mask].sum()))
+    return {"groups": groups, "counts": np.array(counts, dtype=float), "total_costs": np.array(costs)}
+
+
+def what_if_kpis(stats, economics):
+    """
+    KPI economici di tutti i gruppi di economics_statistics per una sezione
+    economics qualsiasi: un prodotto matrice-vettore sui bin di complessità,
+    pochi microsecondi. Restituisce {(agente, profilo): {kpi: valore}}.
+    """
+    revenue_per_bin = ticket_revenue(np.arange(COMPLEXITY_BINS) / COMPLEXITY_SCALE, economics["ticket_revenue"])
+    kpis = economic_kpis(stats["counts"] @ revenue_per_bin, stats["total_costs"], economics)
+    return {
+        group: {key: float(values[i]) for key, values in kpis.items()}
+        for i, group in enumerate(stats["groups"])
+    }
+
+
+def _counts_desc(values):
+    names, counts = np.unique(np.asarray(values), return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    names = names.tolist()
+    return {names[i]: int(counts[i]) for i in order}
+
+
+def ticket_statistics(tickets):
+    """Statistiche dei ticket da una tabella colonnare (dict di array o DataFrame)."""
+    total_tickets = len(tickets["total_cost_eur"])
+    time = np.asarray(tickets["total_time_min"], dtype=float)
+    cost = np.asarray(tickets["total_cost_eur"], dtype=float)
+
+    def mean(key):
+        return float(np.mean(tickets[key])) if total_tickets else float("nan")
+
+    return {
+        "total_tickets": total_tickets,
+        "tickets_per_profile": _counts_desc(tickets["profile"]),
+        "avg_time": mean("total_time_min"),
+        "min_time": float(time.min()) if total_tickets else float("nan"),
+        "max_time": float(time.max()) if total_tickets else float("nan"),
+        "avg_cost": mean("total_cost_eur"),
+        "min_cost": float(cost.min()) if total_tickets else float("nan"),
+        "max_cost": float(cost.max()) if total_tickets else float("nan"),
+        "avg_errors": mean("total_errors"),
+        "late_pct": 100 * float(np.sum(tickets["is_late"])) / total_tickets if total_tickets else 0,
+        "avg_docs": mean("num_documents_consulted"),
+        "avg_words": mean("response_words"),
+        "avg_stress": mean("current_stress"),
+        "avg_write_time": mean("time_write_response_min"),
+    }
+
+
+def document_statistics(documents):
+    """Statistiche dei documenti dalla tabella documents già piatta."""
+    n_docs = len(documents["complexity"]) if "complexity" in documents else 0
+    if not n_docs:
+        return {"n_docs": 0, "avg_doc_complexity": 0, "avg_doc_pages": 0, "avg_doc_words": 0,
+                "avg_doc_read": 0, "avg_doc_open": 0, "avg_doc_nav": 0, "avg_doc_wait": 0,
+                "avg_doc_proc": 0, "avg_doc_errors": 0, "pct_doc_memover": 0, "doc_sources": {}}
+    sources = _counts_desc(documents["document_source"])
+    return {
+        "n_docs": n_docs,
+        "avg_doc_complexity": float(np.mean(documents["complexity"])),
+        "avg_doc_pages": float(np.mean(documents["num_pages"])),
+        "avg_doc_words": float(np.mean(documents["doc_words"])),
+        "avg_doc_read": float(np.mean(documents["read_doc_time_min"])),
+        "avg_doc_open": float(np.mean(documents["open_doc_time_min"])),
+        "avg_doc_nav": float(np.mean(documents["navigation_time_min"])),
+        "avg_doc_wait": float(np.mean(documents["wait_time_min"])),
+        "avg_doc_proc": float(np.mean(documents["processing_time_min"])),
+        "avg_doc_errors": float(np.mean(documents["errors"])),
+        "pct_doc_memover": 100 * float(np.sum(documents["memory_overload"])) / n_docs,
+        "doc_sources": {k: v / n_docs for k, v in sources.items()},
+    }
+
+
+def statistics_dict(tickets, documents, economics=None, label=""):
+    """Statistiche e KPI economici (come dizionari formattati) dai ticket."""
+    economics = load_economics() if economics is None else economics
+    revenue = ticket_revenue(tickets["avg_doc_complexity"], economics["ticket_revenue"])
+    ticket_values = ticket_statistics(tickets)
+    kpis = economic_kpis(revenue.sum(), np.sum(tickets["total_cost_eur"]), economics)
+    return format_statistics(ticket_values, document_statistics(documents), kpis, label)
+
+
+def statistics_from_aggregate(agg, economics=None, label=""):
+    """Come statistics_dict, ma da un aggregator.AgentAggregate."""
+    economics = load_economics() if economics is None else economics
+    bins = np.flatnonzero(agg.complexity_counts)
+    revenue = ticket_revenue(bins / COMPLEXITY_SCALE, economics["ticket_revenue"])
+    m = agg.moments
+    d = agg.doc_moments
+    kpis = economic_kpis(
+        np.sum(agg.complexity_counts[bins] * revenue),
+        m["total_cost_eur"].mean * m["total_cost_eur"].count,
+        economics,
+    )
+    ticket_values = {
+        "total_tickets": agg.tickets,
+        "tickets_per_profile": dict(sorted(agg.profiles.items(), key=lambda kv: -kv[1])),
+        "avg_time": m["total_time_min"].mean,
+        "min_time": agg.minimum["total_time_min"],
+        "max_time": agg.maximum["total_time_min"],
+        "avg_cost": m["total_cost_eur"].mean,
+        "min_cost": agg.minimum["total_cost_eur"],
+        "max_cost": agg.maximum["total_cost_eur"],
+        "avg_errors": m["total_errors"].mean,
+        "late_pct": 100 * agg.late / agg.tickets if agg.tickets else 0,
+        "avg_docs": m["num_documents_consulted"].mean,
+        "avg_words": m["response_words"].mean,
+        "avg_stress": m["current_stress"].mean,
+        "avg_write_time": m["time_write_response_min"].mean,
+    }
+    n_docs = agg.documents
+    doc_values = {
+        "n_docs": n_docs,
+        "avg_doc_complexity": d["complexity"].mean,
+        "avg_doc_pages": d["num_pages"].mean,
+        "avg_doc_words": d["doc_words"].mean,
+        "avg_doc_read": d["read_doc_time_min"].mean,
+        "avg_doc_open": d["open_doc_time_min"].mean,
+        "avg_doc_nav": d["navigation_time_min"].mean,
+        "avg_doc_wait": d["wait_time_min"].mean,
+        "avg_doc_proc": d["processing_time_min"].mean,
+        "avg_doc_errors": d["errors"].mean,
+        "pct_doc_memover": 100 * agg.memory_overload / n_docs if n_docs else 0,
+        "doc_sources": {
+            k: v / n_docs for k, v in sorted(agg.sources.items(), key=lambda kv: -kv[1])
+        } if n_docs else {},
+    }
+    return format_statistics(ticket_values, doc_values, kpis, label)
+
+
+def format_statistics(t, d, kpis, label=""):
+    """Dizionari per sezione (kpi, generali, documenti) mostrati dalla dashboard."""
+    k = {key: float(value) for key, value in kpis.items()}
+    return {
+        "kpi": {
+            f"Ricavi totali (5 anni){label}": f"€{k['total_revenue']:,.2f}",
+            f"Ricavi medi annui{label}": f"€{k['revenue_per_year']:,.2f}",
+            f"Costi totali (5 anni){label}": f"€{k['total_cost']:,.2f}",
+            f"Costi medi annui{label}": f"€{k['cost_per_year']:,.2f}",
+            f"Utile operativo medio annuo{label}": f"€{k['operating_income_per_year']:,.2f}",
+            f"Utile netto medio annuo{label}": f"€{k['net_income_per_year']:,.2f}",
+            f"ROI annuo{label}": f"{k['roi']:.2f} %",
+            f"ROS annuo{label}": f"{k['ros']:.2f} %",
+            f"ROE annuo{label}": f"{k['roe']:.2f} %",
+            f"NPV (5 anni){label}": f"€{k['npv']:,.2f}"
+        },
+        "generali": {
+            "Ticket totali": t["total_tickets"],
+            "Ticket per profilo": t["tickets_per_profile"],
+            "Tempo chiusura ticket (media/min/max)": f"{t['avg_time']:.2f} / {t['min_time']:.2f} / {t['max_time']:.2f} min",
+            "Costo per ticket (media/min/max)": f"€{t['avg_cost']:.2f} / €{t['min_cost']:.2f} / €{t['max_cost']:.2f}",
+            "Errori medi per ticket": f"{t['avg_errors']:.2f}",
+            "Ticket in ritardo (%)": f"{t['late_pct']:.1f}",
+            "Documenti consultati medi": f"{t['avg_docs']:.2f}",
+            "Parole medie risposta": f"{t['avg_words']:.2f}",
+            "Stress medio": f"{t['avg_stress']:.2f}",
+            "Tempo medio scrittura risposta": f"{t['avg_write_time']:.2f} min"
+        },
+        "documenti": {
+            "Documenti totali": d["n_docs"],
+            "Complessità media": f"{d['avg_doc_complexity']:.2f}",
+            "Pagine medie": f"{d['avg_doc_pages']:.2f}",
+            "Parole medie": f"{d['avg_doc_words']:.2f}",
+            "Tempo medio lettura": f"{d['avg_doc_read']:.2f} min",
+            "Tempo medio apertura": f"{d['avg_doc_open']:.2f} min",
+            "Tempo medio navigazione": f"{d['avg_doc_nav']:.2f} min",
+            "Tempo medio attesa": f"{d['avg_doc_wait']:.2f} min",
+            "Tempo medio processing": f"{d['avg_doc_proc']:.2f} min",
+            "Errori medi per documento": f"{d['avg_doc_errors']:.2f}",
+            "% memory overload": f"{d['pct_doc_memover']:.1f}%",
+            "Fonti documenti": d["doc_sources"]
+        }
+    }
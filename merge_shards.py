@@ -0,0 +1,137 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+
+from aggregator import KpiAggregator
+from results_io import chunk_files, results_signature
+from simulate import SHARDS_DIR, save_json
+from stats import RunningMoments
+
+
+# campi che devono coincidere tra gli shard di uno stesso run
+RUN_FIELDS = ("seed", "entropy", "config_hash", "n_tickets", "block_size", "engine", "paired", "sampler")
+
+
+def load_manifests(shard_dirs):
+    manifests = []
+    for directory in shard_dirs:
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["directory"] = directory
+        manifests.append(manifest)
+    return manifests
+
+
+def check_manifests(manifests):
+    """
+    Verifica che gli shard vengano dallo stesso run (stesse config, seed e
+    parametri) e ne coprano tutti i blocchi, ciascuno una sola volta.
+    Restituisce i manifest ordinati per primo blocco.
+    """
+    if not manifests:
+        raise ValueError("nessuno shard da unire")
+    reference = manifests[0]
+    for manifest in manifests[1:]:
+        for field in RUN_FIELDS:
+            if manifest[field] != reference[field]:
+                raise ValueError(f"shard incompatibili: {field} diverso in {manifest['directory']} "
+                                 f"({manifest[field]!r} invece di {reference[field]!r})")
+    manifests = sorted(manifests, key=lambda m: m["blocks"][0])
+    n_blocks = (reference["n_tickets"] + reference["block_size"] - 1) // reference["block_size"]
+    expected = 0
+    for manifest in manifests:
+        first, end = manifest["blocks"]
+        if first != expected:
+            problem = "mancano" if first > expected else "sovrapposti"
+            raise ValueError(f"blocchi {problem} tra {expected} e {first} ({manifest['directory']})")
+        expected = end
+    if expected != n_blocks:
+        raise ValueError(f"mancano i blocchi da {expected} a {n_blocks}")
+    return manifests
+
+
+def merge_summaries(manifests):
+    """Unisce i riepiloghi KPI e le statistiche delle differenze senza leggere i ticket."""
+    aggregator = KpiAggregator()
+    deltas = {}
+    for manifest in manifests:
+        aggregator.merge(KpiAggregator.load(os.path.join(manifest["directory"], "summary.json")))
+        for key, data in manifest["deltas"].items():
+            deltas.setdefault(key, RunningMoments()).merge(RunningMoments.from_dict(data))
+    return aggregator, deltas
+
+
+def merge_results(manifests, agent, output):
+    """
+    Copia i chunk di `agent` degli shard nell'output del run completo. I
+    chunk colonnari sono numerati per blocco, quindi basta copiarli; i file
+    JSON Lines si concatenano in ordine di blocco.
+    """
+    sources = [os.path.join(m["directory"], os.path.basename(m["outputs"][agent])) for m in manifests]
+    if output.endswith(".jsonl"):
+        with open(output, "wb") as out:
+            for source in sources:
+                with open(source, "rb") as f:
+                    shutil.copyfileobj(f, out)
+        return
+    os.makedirs(output, exist_ok=True)
+    for path, _, _ in chunk_files(output):
+        os.remove(path)
+    for source in sources:
+        for path, _, _ in chunk_files(source):
+            shutil.copy2(path, os.path.join(output, os.path.basename(path)))
+
+
+def merge_shards(shard_dirs, output_file_human=None, output_file_ai=None, summary_file="simulation_summary.json",
+                 manifest_file=None):
+    """
+    Unisce gli shard di un run (directory con manifest.json e summary.json):
+    riepilogo KPI sempre, ticket di Human e AI solo se sono indicati i
+    percorsi di output. Restituisce il manifest del run unito.
+    """
+    manifests = check_manifests(load_manifests(shard_dirs))
+    aggregator, deltas = merge_summaries(manifests)
+    if output_file_human:
+        merge_results(manifests, "human", output_file_human)
+    if output_file_ai:
+        merge_results(manifests, "ai", output_file_ai)
+    if output_file_human and output_file_ai:
+        aggregator.results = results_signature(output_file_human, output_file_ai)
+    aggregator.save(summary_file)
+
+    merged = {field: manifests[0][field] for field in RUN_FIELDS}
+    merged.update({
+        "shard": [0, 1],
+        "blocks": [manifests[0]["blocks"][0], manifests[-1]["blocks"][1]],
+        "tickets": [manifests[0]["tickets"][0], manifests[-1]["tickets"][1]],
+        "outputs": {"human": output_file_human, "ai": output_file_ai, "summary": summary_file},
+        "deltas": {key: moments.to_dict() for key, moments in deltas.items()},
+        "merged_from": [m["directory"] for m in manifests],
+    })
+    if manifest_file:
+        save_json(merged, manifest_file)
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Unisce gli shard prodotti da simulate.py --shard")
+    parser.add_argument("shards", nargs="*", help=f"directory degli shard (predefinito: {SHARDS_DIR}/shard-*)")
+    parser.add_argument("--summary-only", action="store_true",
+                        help="unisce solo i riepiloghi KPI, senza copiare i ticket")
+    parser.add_argument("--human", default="simulation_results-human")
+    parser.add_argument("--ai", default="simulation_results-ai")
+    parser.add_argument("--summary", default="simulation_summary.json")
+    args = parser.parse_args()
+
+    shard_dirs = args.shards or sorted(glob.glob(os.path.join(SHARDS_DIR, "shard-*")))
+    merged = merge_shards(shard_dirs,
+                          None if args.summary_only else args.human,
+                          None if args.summary_only else args.ai,
+                          args.summary, manifest_file=os.path.splitext(args.summary)[0] + "-manifest.json")
+    print(f"Uniti {len(shard_dirs)} shard: ticket {merged['tickets'][0]}-{merged['tickets'][1]}, "
+          f"riepilogo in {args.summary}")
+    for key, data in merged["deltas"].items():
+        s = RunningMoments.from_dict(data).summary()
+        print(f"Differenza media Human - AI {key}: {s['mean']:.3f} (IC 95% {s['ci_low']:.3f} - {s['ci_high']:.3f})")
@@ -0,0 +1,123 @@
+import cProfile
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Strumentazione opzionale della simulazione: tempo (wall clock) e numero
+    di chiamate per ogni stage. Da disabilitato `stage` non misura nulla,
+    così il costo sul percorso critico resta trascurabile. I tempi raccolti
+    nei worker si uniscono a quelli del processo principale con merge.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.seconds = {}
+        self.calls = {}
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds, calls=1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def merge(self, other):
+        """Unisce un altro StageTimer o il suo to_dict()."""
+        data = other.to_dict() if isinstance(other, StageTimer) else other
+        for name, (seconds, calls) in data.items():
+            self.add(name, seconds, calls)
+
+    def to_dict(self):
+        return {name: (self.seconds[name], self.calls[name]) for name in self.seconds}
+
+    def report(self):
+        """Tabella testuale degli stage, ordinati per tempo totale."""
+        total = sum(self.seconds.values()) or 1.0
+        lines = [f"{'stage':<28}{'tempo (s)':>12}{'%':>8}{'chiamate':>12}{'µs/chiamata':>14}"]
+        for name, seconds in sorted(self.seconds.items(), key=lambda kv: -kv[1]):
+            calls = self.calls[name]
+            lines.append(
+                f"{name:<28}{seconds:>12.3f}{100 * seconds / total:>8.1f}{calls:>12}{1e6 * seconds / calls:>14.1f}"
+            )
+        return "\n".join(lines)
+
+
+# timer disabilitato di default
+NULL_TIMER = StageTimer(enabled=False)
+
+
+class ThroughputReporter:
+    """
+    Stampa periodicamente (ogni `interval` secondi) ticket simulati,
+    throughput e tempo stimato alla fine, al posto di una riga per ticket.
+    """
+
+    def __init__(self, total, interval=5.0, print_fn=print):
+        self.total = total
+        self.interval = interval
+        self.print_fn = print_fn
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last = self.started
+
+    def update(self, n):
+        self.done += n
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.print_fn(self._line(now))
+
+    def _line(self, now):
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"{self.done}/{self.total} ticket, {rate:,.0f} ticket/s"
+        if rate > 0 and self.total:
+            line += f", ETA {(self.total - self.done) / rate:,.0f} s"
+        return line
+
+    def finish(self):
+        now = time.perf_counter()
+        self.print_fn(self._line(now) + f", totale {now - self.started:,.1f} s")
+
+
+@contextmanager
+def profiled(output_path=None):
+    """
+    Esegue il blocco sotto cProfile (o pyinstrument, se installato e il file
+    di output finisce in .html) e ne salva il dump in output_path. Con
+    output_path=None non fa nulla.
+    """
+    if output_path is None:
+        yield
+        return
+    if output_path.endswith(".html"):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("pyinstrument non installato: usa un output .prof per cProfile")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_path)
@@ -0,0 +1,205 @@
+import argparse
+import heapq
+import math
+
+import numpy as np
+import yaml
+
+from cognitiveagent.params import compile_config
+from simulate import PROFILES, TICKETS_PER_BLOCK, iter_blocks
+
+
+# stream casuale degli arrivi: distinto da quelli dei blocchi (spawn_key=(block,))
+ARRIVALS_SPAWN_KEY = (2 ** 32,)
+
+DEFAULT_QUEUE = {
+    "arrival_rate_per_hour": 8,
+    "hours_per_day": 8,
+}
+
+
+def poisson_arrivals(rng, rate_per_hour, n_tickets):
+    """Istanti di arrivo (minuti di tempo lavorativo) di un processo di Poisson."""
+    return np.cumsum(rng.exponential(60.0 / rate_per_hour, n_tickets))
+
+
+def simulate_queue(arrivals, service, servers):
+    """
+    Coda FIFO con `servers` agenti identici: ogni ticket, in ordine di
+    arrivo, va all'agente che si libera per primo. Gli istanti in cui gli
+    agenti tornano liberi sono in un heap, quindi ogni ticket costa
+    O(log servers). Restituisce gli istanti di inizio e fine servizio.
+    """
+    if servers <= 0:
+        raise ValueError("servono almeno un agente per profilo con ticket da servire")
+    start = np.empty(len(arrivals))
+    finish = np.empty(len(arrivals))
+    free_at = [0.0] * servers
+    heapreplace = heapq.heapreplace
+    for i, (arrival, duration) in enumerate(zip(arrivals.tolist(), service.tolist())):
+        # free_at[0] è l'agente che si libera per primo
+        begin = arrival if arrival > free_at[0] else free_at[0]
+        end = begin + duration
+        heapreplace(free_at, end)
+        start[i] = begin
+        finish[i] = end
+    return start, finish
+
+
+def queue_statistics(arrivals, start, finish, servers, horizon):
+    """
+    Throughput, attese, utilizzo e backlog di una coda osservata fino a
+    `horizon` minuti. Il backlog è il numero di ticket arrivati e non ancora
+    presi in carico.
+    """
+    wait = start - arrivals
+    n = len(arrivals)
+    busy = np.clip(finish, 0, horizon) - np.clip(start, 0, horizon)
+    completed = int(np.sum(finish <= horizon))
+    return {
+        "tickets": n,
+        "servers": servers,
+        "completed": completed,
+        "throughput_per_hour": 60 * completed / horizon if horizon > 0 else 0.0,
+        "avg_wait_min": float(wait.mean()) if n else 0.0,
+        "p50_wait_min": float(np.percentile(wait, 50)) if n else 0.0,
+        "p95_wait_min": float(np.percentile(wait, 95)) if n else 0.0,
+        "max_wait_min": float(wait.max()) if n else 0.0,
+        "avg_service_min": float(np.mean(finish - start)) if n else 0.0,
+        "utilization": float(busy.sum() / (servers * horizon)) if horizon > 0 else 0.0,
+        # legge di Little: backlog medio = attesa totale / durata
+        "avg_backlog": float(np.sum(np.clip(start, 0, horizon) - np.clip(arrivals, 0, horizon)) / horizon)
+        if horizon > 0 else 0.0,
+        "max_backlog": int(backlog_series(arrivals, start, np.concatenate([arrivals, start])).max()) if n else 0,
+        "final_backlog": int(np.sum((arrivals <= horizon) & (start > horizon))),
+    }
+
+
+def unserved_statistics(arrivals, horizon):
+    """
+    Statistiche di un profilo senza agenti: nessun ticket viene preso in
+    carico, quindi l'attesa è illimitata e il backlog cresce con gli arrivi.
+    """
+    n = len(arrivals)
+    wait = math.inf if n else 0.0
+    return {
+        "tickets": n,
+        "servers": 0,
+        "completed": 0,
+        "throughput_per_hour": 0.0,
+        "avg_wait_min": wait,
+        "p50_wait_min": wait,
+        "p95_wait_min": wait,
+        "max_wait_min": wait,
+        "avg_service_min": 0.0,
+        "utilization": 0.0,
+        "avg_backlog": float(np.sum(horizon - np.clip(arrivals, 0, horizon)) / horizon) if horizon > 0 else 0.0,
+        "max_backlog": n,
+        "final_backlog": n,
+    }
+
+
+def backlog_series(arrivals, start, times):
+    """Ticket in attesa (arrivati e non ancora iniziati) agli istanti `times`."""
+    return (np.searchsorted(np.sort(arrivals), times, side="right")
+            - np.searchsorted(np.sort(start), times, side="right"))
+
+
+def ticket_service_times(n_tickets, base_config, ai_config, seed, workers=1, block_size=TICKETS_PER_BLOCK):
+    """
+    Profilo e tempo di servizio (minuti) di n_tickets ticket per Human e AI,
+    dal motore batch con numeri casuali comuni: gli stessi ticket sono
+    serviti dalle due organizzazioni.
+    """
+    base_cc, ai_cc = compile_config(base_config), compile_config(ai_config)
+    entropy = np.random.SeedSequence(seed).entropy
+    n_blocks = (n_tickets + block_size - 1) // block_size
+    tasks = [
+        ("batch", (block, n_tickets, base_cc, ai_cc, entropy, block_size), {"paired": True}, False)
+        for block in range(n_blocks)
+    ]
+    profiles, service = [], {"human": [], "ai": []}
+    for (results_human, results_ai), _ in iter_blocks(tasks, workers):
+        profiles.append(results_human[0]["profile"])
+        service["human"].append(results_human[0]["total_time_min"])
+        service["ai"].append(results_ai[0]["total_time_min"])
+    return np.concatenate(profiles), {agent: np.concatenate(v) for agent, v in service.items()}, entropy
+
+
+def simulate_organization(base_config, ai_config, days, seed=None, headcounts=None, arrival_rate_per_hour=None,
+                          workers=1):
+    """
+    Simula `days` giorni lavorativi di arrivi di ticket serviti dal pool di
+    agenti dell'organizzazione (organizations.profiles di config.yaml, o
+    headcounts), una volta con tempi Human e una con tempi AI sugli stessi
+    arrivi. Ogni ticket va al pool del profilo scelto dalla sua complessità.
+    Restituisce le statistiche per agente e profilo.
+    """
+    queue = dict(DEFAULT_QUEUE, **base_config.get("queue", {}))
+    rate = arrival_rate_per_hour or queue["arrival_rate_per_hour"]
+    horizon = days * queue["hours_per_day"] * 60
+    headcounts = dict(base_config["organizations"]["profiles"], **(headcounts or {}))
+
+    # ticket attesi nell'orizzonte più un margine, poi si tagliano gli arrivi oltre
+    n_tickets = int(rate * horizon / 60 + 6 * np.sqrt(rate * horizon / 60) + 10)
+    profiles, service, entropy = ticket_service_times(n_tickets, base_config, ai_config, seed, workers)
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=ARRIVALS_SPAWN_KEY))
+    arrivals = poisson_arrivals(rng, rate, n_tickets)
+    inside = arrivals <= horizon
+    arrivals, profiles = arrivals[inside], profiles[inside]
+
+    results = {}
+    for agent in ("human", "ai"):
+        times = service[agent][inside]
+        results[agent] = {}
+        for profile in PROFILES:
+            mask = profiles == profile
+            servers = headcounts.get(profile, 0)
+            if servers <= 0:
+                results[agent][profile] = unserved_statistics(arrivals[mask], horizon)
+                continue
+            start, finish = simulate_queue(arrivals[mask], times[mask], servers)
+            results[agent][profile] = queue_statistics(arrivals[mask], start, finish, servers, horizon)
+    return {"horizon_min": horizon, "arrival_rate_per_hour": rate, "headcounts": headcounts, "agents": results}
+
+
+def format_report(report):
+    lines = [f"Arrivi: {report['arrival_rate_per_hour']} ticket/ora, orizzonte {report['horizon_min'] / 60:,.0f} ore"]
+    header = (f"{'agente':<7}{'profilo':<8}{'agenti':>7}{'ticket':>9}{'ticket/ora':>11}{'utilizzo':>10}"
+              f"{'attesa media':>14}{'attesa p95':>12}{'backlog medio':>15}{'backlog max':>13}{'backlog fine':>14}")
+    lines.append(header)
+    unserved = []
+    for agent, profiles in report["agents"].items():
+        for profile, s in profiles.items():
+            lines.append(
+                f"{agent:<7}{profile:<8}{s['servers']:>7}{s['tickets']:>9}{s['throughput_per_hour']:>11.2f}"
+                f"{100 * s['utilization']:>9.1f}%{s['avg_wait_min']:>11.1f} min{s['p95_wait_min']:>8.1f} min"
+                f"{s['avg_backlog']:>15.1f}{s['max_backlog']:>13}{s['final_backlog']:>14}"
+            )
+            if s["servers"] == 0 and s["tickets"]:
+                unserved.append(f"{agent}/{profile}")
+    if unserved:
+        lines.append(f"Profili senza agenti (backlog illimitato): {', '.join(unserved)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulazione a eventi discreti delle code di ticket")
+    parser.add_argument("--days", type=float, default=250, help="giorni lavorativi simulati")
+    parser.add_argument("--rate", type=float, default=None, help="ticket in arrivo per ora lavorativa")
+    parser.add_argument("--headcount", nargs="+", default=[], metavar="PROFILO=N",
+                        help="sostituisce organizations.profiles, es. junior=60")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        base_config = yaml.safe_load(f)
+    with open("config-ai.yaml", "r", encoding="utf-8") as f:
+        ai_config = yaml.safe_load(f)
+    headcounts = {p: int(n) for p, n in (item.split("=") for item in args.headcount)}
+    if any(n < 0 for n in headcounts.values()):
+        parser.error("--headcount: il numero di agenti non può essere negativo")
+    report = simulate_organization(base_config, ai_config, args.days, seed=args.seed, headcounts=headcounts,
+                                   arrival_rate_per_hour=args.rate, workers=args.workers)
+    print(format_report(report))
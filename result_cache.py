@@ -0,0 +1,195 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import yaml
+
+from results_io import chunk_files, output_format
+
+
+CACHE_DIR = ".result_cache"
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+# sorgenti che determinano i risultati: se cambiano, cambia la versione del codice
+MODEL_SOURCES = [
+    "simulate.py", "results_io.py", "aggregator.py", "stats.py", "sampling.py",
+    "cognitiveagent/*.py", "aiagent/*.py",
+]
+
+_code_version = None
+
+
+def code_version():
+    """Hash dei sorgenti del modello (calcolato una volta per processo)."""
+    global _code_version
+    if _code_version is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for pattern in MODEL_SOURCES:
+            for path in sorted(glob.glob(os.path.join(root, pattern))):
+                digest.update(os.path.relpath(path, root).encode("utf-8"))
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def normalized_config(path):
+    """Contenuto di una config YAML indipendente da commenti, spazi e ordine delle chiavi."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.dumps(yaml.safe_load(f), sort_keys=True, default=str)
+
+
+def result_key(base_config_path, ai_config_path, seed, n_tickets, **options):
+    """
+    Chiave di un run: config normalizzate, versione del codice, seed,
+    numero di ticket e opzioni che cambiano i risultati o il loro formato
+    (motore, sampler, JSON Lines o chunk colonnari...).
+    """
+    payload = json.dumps({
+        "base": normalized_config(base_config_path),
+        "ai": normalized_config(ai_config_path),
+        "code": code_version(),
+        "seed": seed,
+        "n_tickets": n_tickets,
+        "options": options,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _directory_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def _link_or_copy(source, destination):
+    """Hard link quando possibile: i chunk non vengono mai modificati sul posto."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _export(source, destination):
+    """Copia un output (directory di chunk .npz o file JSON Lines) in destination."""
+    if os.path.isdir(source):
+        os.makedirs(destination, exist_ok=True)
+        for old, _, _ in chunk_files(destination):
+            os.remove(old)
+        for path, _, _ in chunk_files(source):
+            _link_or_copy(path, os.path.join(destination, os.path.basename(path)))
+    else:
+        # JsonlWriter riscrive il file sul posto: sempre una copia, mai un link
+        shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    """
+    Archivio dei risultati indirizzato per contenuto: una directory per run,
+    con nome la chiave di result_key, che contiene i ticket di Human e AI,
+    il riepilogo KPI e entry.json (parametri, statistiche delle differenze,
+    dimensione, ultimo uso). Oltre max_bytes vengono eliminati i run usati
+    meno di recente (LRU).
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, *parts):
+        return os.path.join(self.directory, key, *parts)
+
+    def _read_entry(self, key):
+        try:
+            with open(self._path(key, "entry.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, key, entry):
+        path = self._path(key, "entry.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def get(self, key, output_file_human, output_file_ai, summary_file=None):
+        """
+        Se il run è in cache ne copia i risultati nei percorsi indicati e
+        restituisce la sua entry (aggiornandone l'ultimo uso), altrimenti None.
+        """
+        entry = self._read_entry(key)
+        if entry is None:
+            return None
+        for agent, destination in (("human", output_file_human), ("ai", output_file_ai)):
+            # un'entry in un altro formato (es. salvata prima che il formato entrasse
+            # nella chiave) è un miss: si ri-simula invece di esportare il formato sbagliato
+            if output_format(entry["outputs"][agent]) != output_format(destination):
+                return None
+        _export(self._path(key, entry["outputs"]["human"]), output_file_human)
+        _export(self._path(key, entry["outputs"]["ai"]), output_file_ai)
+        if summary_file:
+            shutil.copyfile(self._path(key, "summary.json"), summary_file)
+        entry["last_used"] = time.time()
+        self._write_entry(key, entry)
+        return entry
+
+    def put(self, key, output_file_human, output_file_ai, aggregator, entry):
+        """
+        Aggiunge un run: i file vengono preparati in una directory temporanea
+        e resi visibili con un rename, così un'entry è sempre completa.
+        """
+        if os.path.exists(self._path(key)):
+            return
+        tmp_dir = self._path(key + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        outputs = {}
+        for agent, source in (("human", output_file_human), ("ai", output_file_ai)):
+            outputs[agent] = agent + (".jsonl" if output_format(source) == "jsonl" else "")
+            _export(source, os.path.join(tmp_dir, outputs[agent]))
+        aggregator.save(os.path.join(tmp_dir, "summary.json"))
+        now = time.time()
+        entry = dict(entry, key=key, outputs=outputs, created=now, last_used=now,
+                     size_bytes=_directory_size(tmp_dir))
+        with open(os.path.join(tmp_dir, "entry.json"), "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        try:
+            os.rename(tmp_dir, self._path(key))
+        except OSError:
+            # un altro processo ha salvato lo stesso run nel frattempo
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+
+    def entries(self):
+        """Entry dei run in cache, dalla più recente per ultimo uso."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            entry = self._read_entry(name)
+            if entry is not None:
+                entries.append(entry)
+        return sorted(entries, key=lambda e: -e["last_used"])
+
+    def evict(self, keep=None):
+        """Elimina i run usati meno di recente finché la cache supera max_bytes."""
+        entries = self.entries()
+        total = sum(e["size_bytes"] for e in entries)
+        for entry in reversed(entries):
+            if total <= self.max_bytes:
+                break
+            if entry["key"] == keep:
+                continue
+            shutil.rmtree(self._path(entry["key"]), ignore_errors=True)
+            total -= entry["size_bytes"]
+
+    def clear(self):
+        for entry in self.entries():
+            shutil.rmtree(self._path(entry["key"]), ignore_errors=True)
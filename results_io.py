@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+
+def records_to_columns(records, first_ticket_id=0):
+    """
+    Converte una lista di risultati (dict per ticket con documents_details
+    annidati) nelle due tabelle colonnari tickets e documents, collegate
+    dalla colonna ticket_id.
+    """
+    if records and "ticket_id" in records[0]:
+        ticket_ids = np.asarray([r["ticket_id"] for r in records], dtype=np.int64)
+    else:
+        ticket_ids = np.arange(first_ticket_id, first_ticket_id + len(records), dtype=np.int64)
+    ticket_keys = [k for k in (records[0] if records else {}) if k not in ("ticket_id", "documents_details")]
+    tickets = {"ticket_id": ticket_ids}
+    for key in ticket_keys:
+        tickets[key] = np.asarray([r[key] for r in records])
+
+    docs = [d for r in records for d in r.get("documents_details", [])]
+    documents = {"ticket_id": np.repeat(ticket_ids, [len(r.get("documents_details", [])) for r in records])}
+    for key in (docs[0] if docs else {}):
+        documents[key] = np.asarray([d[key] for d in docs])
+    return tickets, documents
+
+
+def batch_to_columns(out, first_ticket_id, profiles, extra):
+    """
+    Converte l'output di un motore simulate_batch nelle tabelle tickets e
+    documents. profiles e le colonne in extra (is_late, current_stress, ...)
+    sono quelle condivise a livello di ticket.
+    """
+    n_docs = out["tickets"]["num_documents_consulted"]
+    ticket_ids = np.arange(first_ticket_id, first_ticket_id + len(n_docs), dtype=np.int64)
+    tickets = {"ticket_id": ticket_ids, "profile": np.asarray(profiles)}
+    tickets.update(out["tickets"])
+    tickets.update(extra)
+
+    documents = {"ticket_id": np.repeat(ticket_ids, n_docs)}
+    documents.update(out["documents"])
+    documents["document_source"] = np.asarray(out["source_names"])[out["documents"]["document_source"]]
+    return tickets, documents
+
+
+def columns_to_records(tickets, documents):
+    """Operazione inversa di records_to_columns."""
+    doc_keys = [k for k in documents if k != "ticket_id"]
+    doc_ticket_ids = documents["ticket_id"]
+    doc_columns = [documents[k].tolist() for k in doc_keys]
+    starts = np.searchsorted(doc_ticket_ids, tickets["ticket_id"], side="left")
+    ends = np.searchsorted(doc_ticket_ids, tickets["ticket_id"], side="right")
+    ticket_columns = {k: v.tolist() for k, v in tickets.items()}
+
+    records = []
+    for i in range(len(tickets["ticket_id"])):
+        record = {k: v[i] for k, v in ticket_columns.items()}
+        record["documents_details"] = [
+            dict(zip(doc_keys, values))
+            for values in zip(*(col[starts[i]:ends[i]] for col in doc_columns))
+        ]
+        records.append(record)
+    return records
+
+
+class JsonlWriter:
+    """
+    Scrive i risultati dei ticket in formato JSON Lines (un ticket per riga),
+    a blocchi di al massimo chunk_size ticket. Ogni blocco viene scritto e
+    sincronizzato su disco appena è pieno: la memoria usata non dipende dal
+    numero di ticket e un run interrotto lascia su disco i blocchi completati.
+    Con state (da checkpoint()) riprende il file di un run interrotto,
+    scartando quanto scritto dopo il checkpoint.
+    """
+
+    def __init__(self, path, chunk_size=1000, state=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.n_written = 0
+        self._buffer = []
+        if state is None:
+            self._file = open(path, "w", encoding="utf-8")
+        else:
+            self._file = open(path, "r+", encoding="utf-8")
+            self._file.truncate(state["offset"])
+            self._file.seek(state["offset"])
+            self.n_written = state["n_written"]
+
+    def write(self, tickets, documents):
+        for record in columns_to_records(tickets, documents):
+            self._buffer.append(record)
+            if len(self._buffer) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write("".join(
+                json.dumps(record, ensure_ascii=False) + "\n" for record in self._buffer
+            ))
+            self.n_written += len(self._buffer)
+            self._buffer = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def checkpoint(self):
+        """Scrive il buffer e restituisce lo stato da cui riprendere."""
+        self.flush()
+        return {"n_written": self.n_written, "offset": self._file.tell()}
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_jsonl(path):
+    """
+    Itera i ticket di un file JSON Lines. Un'ultima riga troncata (run
+    interrotto durante la scrittura) viene ignorata.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            if line.strip():
+                yield json.loads(line)
+
+
+# nomi dei chunk scritti da ColumnarWriter: gli altri file della directory non si toccano
+CHUNK_NAME = re.compile(r"^(tickets|documents)-(\d{6,})\.npz$")
+
+
+def chunk_files(directory, table=None):
+    """Chunk colonnari di directory come (percorso, tabella, indice), in ordine di nome."""
+    if not os.path.isdir(directory):
+        return []
+    chunks = []
+    for name in sorted(os.listdir(directory)):
+        match = CHUNK_NAME.match(name)
+        if match and table in (None, match.group(1)):
+            chunks.append((os.path.join(directory, name), match.group(1), int(match.group(2))))
+    return chunks
+
+
+class ColumnarWriter:
+    """
+    Scrive i risultati in una directory di chunk .npz colonnari: per ogni
+    blocco un file tickets-NNNNNN.npz e un file documents-NNNNNN.npz,
+    collegati da ticket_id. Ogni chunk viene reso visibile solo a scrittura
+    completata, quindi un run interrotto lascia chunk tutti leggibili.
+    I chunk sono numerati da first_chunk (il primo blocco di uno shard), così
+    le directory di shard diversi si uniscono senza collisioni di nomi.
+    Con state (da checkpoint()) riprende la directory di un run interrotto,
+    scartando i chunk scritti dopo il checkpoint.
+    """
+
+    def __init__(self, directory, first_chunk=0, state=None):
+        self.directory = directory
+        self.first_chunk = first_chunk
+        self.n_written = 0
+        self.n_chunks = 0
+        os.makedirs(directory, exist_ok=True)
+        if state is None:
+            for path, _, _ in chunk_files(directory):
+                os.remove(path)
+            return
+        self.n_written = state["n_written"]
+        self.n_chunks = state["n_chunks"]
+        for path, _, chunk in chunk_files(directory):
+            if chunk >= first_chunk + self.n_chunks:
+                os.remove(path)
+
+    def write(self, tickets, documents):
+        for table, columns in (("tickets", tickets), ("documents", documents)):
+            path = os.path.join(self.directory, f"{table}-{self.first_chunk + self.n_chunks:06d}.npz")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, **columns)
+            os.replace(tmp_path, path)
+        self.n_written += len(tickets["ticket_id"])
+        self.n_chunks += 1
+
+    def checkpoint(self):
+        """Stato da cui riprendere: i chunk sono già tutti su disco."""
+        return {"n_written": self.n_written, "n_chunks": self.n_chunks}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_writer(path, chunk_size=1000, first_chunk=0, state=None):
+    """
+    Writer JSON Lines per i percorsi .jsonl, colonnare (directory) altrimenti.
+    state è lo stato salvato da checkpoint() per riprendere un run interrotto.
+    """
+    if output_format(path) == "jsonl":
+        return JsonlWriter(path, chunk_size, state)
+    return ColumnarWriter(path, first_chunk, state)
+
+
+def output_format(path):
+    """Formato scritto da open_writer per un percorso: "jsonl" o "columnar"."""
+    return "jsonl" if path.endswith(".jsonl") else "columnar"
+
+
+def read_columnar_chunks(directory, table):
+    """Itera i chunk di una tabella (tickets o documents) come dict di array."""
+    for path, _, _ in chunk_files(directory, table):
+        with np.load(path, allow_pickle=False) as chunk:
+            yield {k: chunk[k] for k in chunk.files}
+
+
+def chunk_indices(directory, table):
+    """Indici dei chunk già completi di una tabella, in ordine."""
+    return sorted(index for _, _, index in chunk_files(directory, table))
+
+
+def read_chunk(directory, table, index):
+    with np.load(os.path.join(directory, f"{table}-{index:06d}.npz"), allow_pickle=False) as chunk:
+        return {k: chunk[k] for k in chunk.files}
+
+
+def concat_columns(chunks):
+    chunks = list(chunks)
+    if not chunks:
+        return {}
+    return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+
+def load_tables(path):
+    """
+    Carica i risultati come tabelle (tickets, documents) di array NumPy.
+    Accetta la directory colonnare, un file JSON Lines o il vecchio array .json.
+    """
+    if os.path.isdir(path):
+        return (concat_columns(read_columnar_chunks(path, "tickets")),
+                concat_columns(read_columnar_chunks(path, "documents")))
+    return records_to_columns(load_results(path))
+
+
+def load_results(path):
+    """Carica i risultati da JSON Lines o, per i file .json, dal vecchio array JSON."""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return list(read_jsonl(path))
+
+
+def results_signature(*paths):
+    """
+    Firma del contenuto di uno o più output da nomi e dimensioni dei chunk
+    (o dimensione del file JSON Lines), senza date né directory: resta la
+    stessa per le copie della cache e per gli shard uniti, cambia quando un
+    altro run riscrive i risultati.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isdir(path):
+            entries = [[os.path.basename(name), os.path.getsize(name)] for name, _, _ in chunk_files(path)]
+        elif os.path.exists(path):
+            entries = [["", os.path.getsize(path)]]
+        else:
+            entries = []
+        digest.update(json.dumps(entries).encode("utf-8") + b";")
+    return digest.hexdigest()
+
+
+def results_fingerprint(*paths):
+    """
+    Impronta di uno o più output (directory di chunk o file) da nome,
+    dimensione e data di modifica dei file: cambia quando cambiano i dati,
+    senza leggerli.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        files = [name for name, _, _ in chunk_files(path)] if os.path.isdir(path) else [path]
+        for name in files:
+            if os.path.exists(name):
+                stat = os.stat(name)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()
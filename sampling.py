@@ -0,0 +1,48 @@
+import numpy as np
+
+
+# "random": estrazioni pseudo-casuali indipendenti (comportamento storico);
+# le altre stratificano le estrazioni a livello di ticket e di ambiente
+SAMPLERS = ("random", "lhs", "sobol", "halton")
+
+
+def latin_hypercube(rng, n, d):
+    """
+    Latin hypercube in [0, 1)^d: per ogni dimensione, uno e un solo punto
+    in ciascuno degli n strati [i/n, (i+1)/n), in ordine casuale.
+    """
+    strata = rng.permuted(np.tile(np.arange(n), (d, 1)), axis=1).T
+    return (strata + rng.random((n, d))) / n
+
+
+def _qmc_engine(name, d, rng):
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        raise ImportError(f"il sampler '{name}' richiede scipy (pip install scipy); 'lhs' funziona senza")
+    engine = qmc.Sobol if name == "sobol" else qmc.Halton
+    try:
+        return engine(d, scramble=True, rng=rng)
+    except TypeError:
+        # scipy < 1.15
+        return engine(d, scramble=True, seed=rng)
+
+
+def uniforms(sampler, rng, n, d):
+    """
+    Matrice (n, d) di uniformi in [0, 1) per n ticket e d grandezze, con il
+    sampler indicato. Sobol e Halton sono scramblati con rng, quindi ogni
+    blocco è una replica indipendente e le stime restano non distorte.
+    """
+    if sampler == "random":
+        return rng.random((n, d))
+    if sampler == "lhs":
+        return latin_hypercube(rng, n, d)
+    if sampler in ("sobol", "halton"):
+        engine = _qmc_engine(sampler, d, rng)
+        if sampler == "sobol":
+            # Sobol conserva le proprietà di bilanciamento su potenze di 2
+            m = int(np.ceil(np.log2(max(n, 2))))
+            return engine.random_base2(m)[:n]
+        return engine.random(n)
+    raise ValueError(f"sampler sconosciuto: {sampler} (validi: {', '.join(SAMPLERS)})")
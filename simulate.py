@@ -1,22 +1,50 @@
 import yaml
-import json
 import random
-import copy
+import argparse
+import hashlib
+import json
+import os
+import time
 import numpy as np
+from statistics import NormalDist
+from collections import deque
+from multiprocessing import Pool
 from cognitiveagent.agent import HumanSearchAgent
+from cognitiveagent import agent as human_batch
+from cognitiveagent.params import compile_config
 from aiagent.agentai import RAGHumanAgent 
+from aiagent import agentai as ai_batch
+from results_io import open_writer, output_format, records_to_columns, batch_to_columns, results_signature
+from stats import RunningMoments
+from aggregator import KpiAggregator
+from profiling import NULL_TIMER, StageTimer, ThroughputReporter, profiled
+from sampling import SAMPLERS, uniforms
+from result_cache import ResultCache, result_key
 from datetime import datetime
 
-def vary_config(base_config):
+# Ticket per blocco: ogni blocco ha il proprio generatore derivato dal seed,
+# quindi il risultato non dipende da quanti worker eseguono i blocchi.
+TICKETS_PER_BLOCK = 1000
+# blocchi in volo per worker: limita la memoria quando la scrittura è il collo di bottiglia
+MAX_PENDING_PER_WORKER = 2
+
+# directory degli output di --shard
+SHARDS_DIR = "shards"
+# se questo file compare durante un run, il run si ferma a fine blocco
+STOP_FILE = "simulation.stop"
+
+def vary_config(base_config, rng=random):
     """
     Restituisce una versione leggermente modificata di base_config
     per simulare piccoli cambiamenti nell'ambiente.
     Tutte le variazioni sono tra -5% e +5%.
+    Copia solo le sezioni che vengono modificate: il resto è condiviso
+    con base_config e non va modificato.
     """
-    new_config = copy.deepcopy(base_config)
+    new_config = dict(base_config)
 
     # es. variazione ±1-5% su parametri generali
-    gen = new_config['general_parameters']
+    gen = new_config['general_parameters'] = dict(base_config['general_parameters'])
     for key in [
         'avg_clicks_to_find_doc',
         'avg_nav_time_per_click_sec',
@@ -25,19 +53,23 @@ def vary_config(base_config):
         'avg_cognitive_processing_sec',
         'avg_writing_speed_words_per_sec'
     ]:
-        factor = random.uniform(0.95, 1.05)
+        factor = rng.uniform(0.95, 1.05)
         gen[key] *= factor
 
     # varia leggermente anche fatigue
     if 'fatigue' in new_config:
+        new_config['fatigue'] = dict(base_config['fatigue'])
         for k in new_config['fatigue']:
-            factor = random.uniform(0.95, 1.05)
+            factor = rng.uniform(0.95, 1.05)
             new_config['fatigue'][k] *= factor
 
     # varia leggermente probabilità delle sorgenti
+    new_config['document_sources'] = {
+        src: dict(conf) for src, conf in base_config['document_sources'].items()
+    }
     total_prob = 0.0
     for src in new_config['document_sources']:
-        variation = random.uniform(0.95, 1.05)
+        variation = rng.uniform(0.95, 1.05)
         new_config['document_sources'][src]['probability'] *= variation
         total_prob += new_config['document_sources'][src]['probability']
 
@@ -47,13 +79,13 @@ def vary_config(base_config):
 
     return new_config
 
-def sample_complexity(complexity_dist, n_docs, complexity_ranges):
+def sample_complexity(complexity_dist, n_docs, complexity_ranges, rng=np.random):
     levels = list(complexity_dist.keys())
     probs = np.array(list(complexity_dist.values()), dtype=float)
     probs = probs / probs.sum()
-    sampled_levels = np.random.choice(levels, size=n_docs, p=probs)
+    sampled_levels = rng.choice(levels, size=n_docs, p=probs)
     complexities = [
-        round(np.random.uniform(*complexity_ranges[level]), 2)
+        round(rng.uniform(*complexity_ranges[level]), 2)
         for level in sampled_levels
     ]
     return complexities
@@ -72,81 +104,660 @@ def choose_profile(avg_complexity, profile_assignment):
     else:
         return 'senior'
 
-def simulate_tickets(n_tickets, base_config_path, ai_config_path, output_file_human, output_file_ai):
-    # carica configurazione base
-    with open(base_config_path, "r", encoding="utf-8") as f:
-        base_config = yaml.safe_load(f)
-    with open(ai_config_path, "r", encoding="utf-8") as f:
-        ai_config = yaml.safe_load(f)
+def sample_avg_complexity_batch(cc, n_tickets, rng, u=None):
+    """
+    Versione vettoriale di sample_complexity + np.mean: complessità media
+    dei documenti di n_tickets ticket, a partire da una CompiledConfig.
+    u, se indicato, è una matrice (n_tickets, 1 + 2 * cc.max_docs) di
+    uniformi già estratte: numero di documenti e, per ogni posizione, livello
+    e valore della complessità.
+    """
+    if u is None:
+        n_docs = rng.integers(cc.min_docs, cc.max_docs + 1, n_tickets)
+        ticket_idx = np.repeat(np.arange(n_tickets), n_docs)
+        levels = rng.choice(len(cc.complexity_levels), size=len(ticket_idx), p=cc.complexity_probs)
+        low, high = cc.complexity_ranges[levels, 0], cc.complexity_ranges[levels, 1]
+        complexities = np.round(rng.uniform(low, high), 2)
+    else:
+        n_docs = human_batch.uniform_int(u[:, 0], cc.min_docs, cc.max_docs)
+        _, ticket_idx, doc_pos = human_batch.ragged_index(n_docs)
+        doc_u = u[:, 1:].reshape(n_tickets, 2, cc.max_docs)
+        levels = human_batch.choose_sources(doc_u[ticket_idx, 0, doc_pos], cc.complexity_probs, ticket_idx)
+        low, high = cc.complexity_ranges[levels, 0], cc.complexity_ranges[levels, 1]
+        complexities = np.round(low + (high - low) * doc_u[ticket_idx, 1, doc_pos], 2)
+    return np.bincount(ticket_idx, weights=complexities, minlength=n_tickets) / n_docs
+
+def choose_profile_batch(avg_complexity, cc):
+    """Versione vettoriale di choose_profile."""
+    avg_complexity = np.round(avg_complexity, 2)
+    return np.where(avg_complexity <= cc.junior_max, 'junior',
+                    np.where(avg_complexity <= cc.mid_max, 'mid', 'senior'))
+
+def block_rng(entropy, block):
+    """
+    Generatore del blocco `block`: figlio `block` della SeedSequence del run,
+    esposto con l'API di np.random (randint, choice, uniform, ...).
+    """
+    seed_seq = np.random.SeedSequence(entropy, spawn_key=(block,))
+    return np.random.RandomState(np.random.MT19937(seed_seq))
 
+def simulate_block(block, n_tickets, base_config, ai_config, entropy, block_size=TICKETS_PER_BLOCK,
+                   timer=NULL_TIMER):
+    """
+    Simula i ticket del blocco `block` (da block * block_size fino a
+    n_tickets escluso) e restituisce le tabelle colonnari
+    (tickets, documents) dei risultati Human e AI.
+    """
+    rng = block_rng(entropy, block)
     complexity_ranges = {k: tuple(v) for k, v in base_config['complexity_ranges'].items()}
     profile_assignment = base_config['profile_assignment']
 
-    all_results_human = []
-    all_results_ai = []
+    results_human = []
+    results_ai = []
 
-    for i in range(n_tickets):
+    start = block * block_size
+    for i in range(start, min(start + block_size, n_tickets)):
         # varia leggermente la config
-        config = vary_config(base_config)
-        ai_config_var = vary_config(ai_config)  # puoi variare anche la config AI se vuoi
+        with timer.stage("config_variation"):
+            config = vary_config(base_config, rng)
+            ai_config_var = vary_config(ai_config, rng)  # puoi variare anche la config AI se vuoi
 
         # --- Estrazione profilo pesata ---
-        if 'organizations' in config and 'profiles' in config['organizations']:
-            pop_dist = config['organizations']['profiles']
-            weighted_profiles = []
-            for prof, n in pop_dist.items():
-                weighted_profiles.extend([prof] * n)
-            profile = random.choice(weighted_profiles)
-        else:
-            profiles_list = list(config['profiles'].keys())
-            profile = random.choice(profiles_list)
+        with timer.stage("profile_choice"):
+            if 'organizations' in config and 'profiles' in config['organizations']:
+                pop_dist = config['organizations']['profiles']
+                weighted_profiles = []
+                for prof, n in pop_dist.items():
+                    weighted_profiles.extend([prof] * n)
+                profile = rng.choice(weighted_profiles)
+            else:
+                profiles_list = list(config['profiles'].keys())
+                profile = rng.choice(profiles_list)
         # ----------------------------------
 
-        is_late = random.random() < 0.3
-        current_stress = round(random.uniform(0.0, 1.0), 2)
-        response_words = random.randint(500, 1000)
+        is_late = rng.random_sample() < 0.3
+        current_stress = round(rng.uniform(0.0, 1.0), 2)
+        response_words = rng.randint(500, 1001)
 
         # 1. Genera i documenti e la loro complessità
-        n_docs = random.randint(config['general_parameters']['min_documents_per_operation'],
-                                config['general_parameters']['max_documents_per_operation'])
-        complexity_dist = config['task']['complexity_distribution']
-        complexities = sample_complexity(complexity_dist, n_docs, complexity_ranges)
-        avg_complexity = np.mean(complexities)
-        profile = choose_profile(avg_complexity, profile_assignment)
+        with timer.stage("complexity_sampling"):
+            n_docs = rng.randint(config['general_parameters']['min_documents_per_operation'],
+                                 config['general_parameters']['max_documents_per_operation'] + 1)
+            complexity_dist = config['task']['complexity_distribution']
+            complexities = sample_complexity(complexity_dist, n_docs, complexity_ranges, rng)
+            avg_complexity = np.mean(complexities)
+        with timer.stage("profile_choice"):
+            profile = choose_profile(avg_complexity, profile_assignment)
 
         # --- Simulazione Human ---
-        agent_human = HumanSearchAgent(profile, config, is_late, current_stress, avg_complexity)
-        result_human = agent_human.simulate_search(response_words)
+        with timer.stage("agent_construction"):
+            agent_human = HumanSearchAgent(profile, config, is_late, current_stress, avg_complexity, rng)
+        with timer.stage("simulate_search_human"):
+            result_human = agent_human.simulate_search(response_words)
         result_human["is_late"] = is_late
         result_human["current_stress"] = current_stress
         result_human["response_words"] = response_words
-        all_results_human.append(result_human)
+        results_human.append(result_human)
 
         # --- Simulazione AI (RAG) ---
-        agent_ai = RAGHumanAgent(profile, ai_config, is_late, current_stress, avg_complexity)
-        result_ai = agent_ai.simulate_search(response_words)
+        with timer.stage("agent_construction"):
+            agent_ai = RAGHumanAgent(profile, ai_config, is_late, current_stress, avg_complexity, rng)
+        with timer.stage("simulate_search_ai"):
+            result_ai = agent_ai.simulate_search(response_words)
         result_ai["is_late"] = is_late
         result_ai["current_stress"] = current_stress
         result_ai["response_words"] = response_words
-        all_results_ai.append(result_ai)
+        results_ai.append(result_ai)
+
+    with timer.stage("to_columns"):
+        return records_to_columns(results_human, start), records_to_columns(results_ai, start)
+
+def simulate_block_batch(block, n_tickets, base_cc, ai_cc, entropy, block_size=TICKETS_PER_BLOCK, paired=False,
+                         sampler="random", timer=NULL_TIMER):
+    """
+    Come simulate_block, ma con i motori vettoriali: tutte le estrazioni del
+    blocco (variazione ambientale, ticket, documenti) sono array NumPy.
+    base_cc e ai_cc sono CompiledConfig costruite una volta per run.
+    Con paired=True i due agenti consumano gli stessi numeri casuali per i
+    documenti (common random numbers), così la differenza Human - AI per
+    ticket ha varianza molto più bassa.
+    Con sampler diverso da "random" le uniformi del blocco sono estratte
+    insieme, stratificate (LHS, Sobol o Halton scramblati): numero e
+    sorgente, pagine, attesa ed errore dei documenti di ogni agente,
+    complessità, ritardo, stress, parole della risposta e variazione
+    ambientale di Human. Solo i click e le allucinazioni restano pseudo-casuali.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(block,)))
+    start = block * block_size
+    n = min(start + block_size, n_tickets) - start
+    max_docs = max(base_cc.max_docs, ai_cc.max_docs)
+
+    if sampler == "random":
+        is_late = rng.random(n) < 0.3
+        current_stress = np.round(rng.random(n), 2)
+        response_words = rng.integers(500, 1001, n)
+        u_docs = u_complexity = u_human = None
+    else:
+        # le colonne più importanti per la varianza vengono prima (Sobol e
+        # Halton sono più uniformi nelle prime dimensioni)
+        doc_width = 1 + 4 * max_docs
+        widths = [doc_width * (1 if paired else 2), 1 + 2 * base_cc.max_docs, 3, base_cc.n_perturbed]
+        with timer.stage("sampling"):
+            u = uniforms(sampler, rng, n, sum(widths))
+        u_docs, u_complexity, u_ticket, u_human = np.split(u, np.cumsum(widths)[:-1], axis=1)
+        is_late = u_ticket[:, 0] < 0.3
+        current_stress = np.round(u_ticket[:, 1], 2)
+        response_words = human_batch.uniform_int(u_ticket[:, 2], 500, 1000)
+    with timer.stage("complexity_sampling"):
+        avg_complexity = sample_avg_complexity_batch(base_cc, n, rng, u_complexity)
+    with timer.stage("profile_choice"):
+        profiles = choose_profile_batch(avg_complexity, base_cc)
+    extra = {"is_late": is_late, "current_stress": current_stress, "response_words": response_words}
+    if u_docs is not None:
+        draws_human = human_batch.common_draws(rng, n, max_docs, u_docs[:, :doc_width])
+        draws_ai = draws_human if paired else human_batch.common_draws(rng, n, max_docs, u_docs[:, doc_width:])
+    else:
+        draws_human = draws_ai = human_batch.common_draws(rng, n, max_docs) if paired else None
+
+    with timer.stage("config_variation"):
+        variation_human = base_cc.perturb(rng, n, u_human)
+    with timer.stage("agent_construction"):
+        params_human = human_batch.batch_params(
+            base_cc, profiles, is_late, current_stress, avg_complexity, response_words, variation_human
+        )
+    with timer.stage("simulate_search_human"):
+        out_human = human_batch.simulate_batch(params_human, n, rng, draws_human)
+
+    # come nel motore scalare, l'agente AI usa la config senza variazione ambientale
+    with timer.stage("agent_construction"):
+        params_ai = ai_batch.batch_params(ai_cc, is_late, current_stress, avg_complexity, response_words)
+    with timer.stage("simulate_search_ai"):
+        out_ai = ai_batch.simulate_batch(params_ai, n, rng, draws_ai)
+
+    with timer.stage("to_columns"):
+        return (batch_to_columns(out_human, start, profiles, extra),
+                batch_to_columns(out_ai, start, profiles, extra))
+
+ENGINES = {
+    "scalar": simulate_block,
+    "batch": simulate_block_batch,
+}
+
+def _simulate_block_task(task):
+    """
+    Esegue un blocco. Restituisce i risultati e, se richiesto, i tempi per
+    stage misurati nel processo che l'ha eseguito.
+    """
+    engine, args, kwargs, profile_stages = task
+    if not profile_stages:
+        return ENGINES[engine](*args, **kwargs), None
+    timer = StageTimer()
+    results = ENGINES[engine](*args, timer=timer, **kwargs)
+    return results, timer.to_dict()
+
+def update_deltas(deltas, tickets_human, tickets_ai):
+    """Aggiorna le statistiche della differenza Human - AI per ticket."""
+    deltas["total_cost_eur"].update(tickets_human["total_cost_eur"] - tickets_ai["total_cost_eur"])
+    deltas["total_time_min"].update(tickets_human["total_time_min"] - tickets_ai["total_time_min"])
+
+def load_configs(base_config_path, ai_config_path, engine="scalar"):
+    """Carica le due config YAML (compilate se engine="batch")."""
+    with open(base_config_path, "r", encoding="utf-8") as f:
+        base_config = yaml.safe_load(f)
+    with open(ai_config_path, "r", encoding="utf-8") as f:
+        ai_config = yaml.safe_load(f)
+    if engine == "batch":
+        base_config, ai_config = compile_config(base_config), compile_config(ai_config)
+    return base_config, ai_config
+
+def imap_ordered(pool, func, tasks, max_pending):
+    """
+    Come pool.imap, ma con al più max_pending task in volo: se la scrittura
+    dei risultati è più lenta della simulazione, i blocchi completati non si
+    accumulano in memoria. I risultati arrivano nell'ordine dei task.
+    """
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (task,)))
+    while pending:
+        yield pending.popleft().get()
 
-        print(f"Simulazione ticket {i+1} completata")
+def iter_blocks(tasks, workers=1):
+    """
+    Esegue i blocchi (in serie o su un pool di processi) e restituisce i
+    risultati nell'ordine dei blocchi, con al più MAX_PENDING_PER_WORKER
+    blocchi in volo per worker. Interrompere l'iterazione termina il pool.
+    """
+    if workers > 1:
+        with Pool(workers) as pool:
+            yield from imap_ordered(pool, _simulate_block_task, tasks, MAX_PENDING_PER_WORKER * workers)
+    else:
+        for task in tasks:
+            yield _simulate_block_task(task)
+
+def parse_shard(text):
+    """'2/8' -> (2, 8): shard 2 (da 0) di 8."""
+    index, _, count = text.partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"shard non valido: {text} (atteso i/N con 0 <= i < N)")
+    return index, count
+
+def shard_blocks(n_blocks, shard):
+    """Intervallo [inizio, fine) dei blocchi assegnati allo shard (i, N)."""
+    index, count = shard
+    return index * n_blocks // count, (index + 1) * n_blocks // count
+
+def config_hash(*paths):
+    """Hash dei file di configurazione, per riconoscere shard dello stesso run."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def save_json(data, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def save_checkpoint(path, run_info, next_block, writers, aggregator, deltas):
+    """
+    Stato di un run a fine blocco: i blocchi sono seminati da (entropy,
+    indice), quindi per riprendere bastano l'indice del prossimo blocco, lo
+    stato dei writer e gli aggregati parziali.
+    """
+    save_json({
+        "run": run_info,
+        "next_block": next_block,
+        "writers": {agent: writer.checkpoint() for agent, writer in writers.items()},
+        "aggregator": aggregator.to_dict(),
+        "deltas": {key: moments.to_dict() for key, moments in deltas.items()},
+        "updated": datetime.now().isoformat(timespec="seconds"),
+    }, path)
+
+def check_checkpoint(path, checkpoint, run_info):
+    """Verifica che il checkpoint sia dello stesso run (config, seed, parametri)."""
+    for field, value in run_info.items():
+        if checkpoint["run"][field] != value:
+            raise ValueError(f"il checkpoint {path} è di un altro run: {field} diverso "
+                             f"({checkpoint['run'][field]!r} invece di {value!r})")
 
-    # salva tutti i JSON in due file distinti
-    with open(output_file_human, "w", encoding="utf-8") as f:
-        json.dump(all_results_human, f, indent=2, ensure_ascii=False)
-    with open(output_file_ai, "w", encoding="utf-8") as f:
-        json.dump(all_results_ai, f, indent=2, ensure_ascii=False)
+def simulate_tickets(n_tickets, base_config_path, ai_config_path, output_file_human, output_file_ai,
+                     seed=None, workers=1, block_size=TICKETS_PER_BLOCK, engine="scalar", paired=False,
+                     summary_file=None, profile=False, profile_output=None, sampler="random",
+                     shard=None, manifest_file=None, checkpoint_file=None, checkpoint_interval=60.0,
+                     resume=False, cache=None, stop_file=None):
+    """
+    Simula n_tickets ticket Human e AI e salva i risultati un blocco alla
+    volta, man mano che viene completato: in una directory di chunk
+    colonnari oppure, se il percorso finisce in .jsonl, in JSON Lines.
+    I ticket sono divisi in blocchi da block_size, ognuno con un generatore
+    derivato da `seed` tramite SeedSequence: a parità di seed e block_size
+    il risultato è identico qualunque sia il numero di worker.
+    engine="batch" usa i motori vettoriali con le config compilate una volta
+    sola (stesse distribuzioni, stream casuali diversi dal motore "scalar");
+    paired=True (solo engine="batch") usa numeri casuali comuni per i due agenti.
+    sampler (solo engine="batch") sceglie come estrarre le grandezze a livello
+    di ticket e di ambiente: "random", "lhs", "sobol" o "halton".
+    Se summary_file è indicato, vi salva il KpiAggregator del run (momenti,
+    min/max, quantili, istogrammi) aggiornato blocco per blocco.
+    Con profile=True misura il tempo di ogni stage (nei worker e nel
+    processo principale) e ne stampa la tabella alla fine; con
+    profile_output salva anche il profilo cProfile (o pyinstrument, .html)
+    del run.
+    Con shard=(i, N) simula solo l'i-esima delle N parti contigue dei
+    blocchi (serve un seed esplicito, uguale per tutti gli shard): i ticket
+    hanno gli stessi id e gli stessi risultati del run completo.
+    manifest_file descrive il run (config, seed, blocchi e ticket coperti,
+    statistiche delle differenze) per merge_shards.py.
+    Con checkpoint_file salva lo stato del run al più ogni
+    checkpoint_interval secondi (a fine blocco) e lo cancella a run
+    completato; con resume=True un run interrotto riprende dall'ultimo
+    checkpoint e produce gli stessi file di un run senza interruzioni (senza
+    checkpoint è un errore: gli output esistenti non vengono toccati).
+    Con cache (ResultCache) un run con seed esplicito già eseguito con le
+    stesse config e lo stesso codice non viene ri-simulato: i risultati
+    vengono copiati dalla cache negli output.
+    Con stop_file il run si ferma a fine blocco appena il file esiste (lo
+    crea ad esempio la dashboard in modalità live): salva il checkpoint, da
+    cui si riprende con resume=True, e il riepilogo dei blocchi completati.
+    Restituisce media, varianza e intervallo di confidenza della differenza
+    Human - AI per ticket di costo e tempo.
+    """
+    if shard is not None and seed is None:
+        raise ValueError("la modalità shard richiede un seed esplicito, uguale per tutti gli shard")
+    if paired and engine != "batch":
+        raise ValueError("paired=True richiede engine='batch'")
+    if sampler != "random" and engine != "batch":
+        raise ValueError(f"sampler='{sampler}' richiede engine='batch'")
+    if resume and not (checkpoint_file and os.path.exists(checkpoint_file)):
+        # ripartire da zero cancellerebbe i risultati parziali che si volevano riprendere
+        raise FileNotFoundError(f"nessun checkpoint da riprendere ({checkpoint_file}): "
+                                "rilanciare senza resume per un nuovo run")
+
+    if stop_file and os.path.exists(stop_file):
+        # richiesta di stop rimasta da un run precedente
+        os.remove(stop_file)
+    cache_key = None
+    if cache is not None and seed is not None and shard is None and not profile:
+        cache_key = result_key(base_config_path, ai_config_path, seed, n_tickets, engine=engine,
+                               paired=paired, sampler=sampler, block_size=block_size,
+                               formats=[output_format(output_file_human), output_format(output_file_ai)])
+        entry = cache.get(cache_key, output_file_human, output_file_ai, summary_file)
+        if entry is not None:
+            print(f"Risultati di {n_tickets} simulazioni dalla cache {cache.directory} ({cache_key[:12]})")
+            summary = {key: RunningMoments.from_dict(data).summary() for key, data in entry["deltas"].items()}
+            print_delta_summary(summary)
+            return summary
+
+    # carica configurazione base
+    base_config, ai_config = load_configs(base_config_path, ai_config_path, engine)
+
+    checkpoint = None
+    if resume:
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        # senza seed esplicito si riprende con l'entropia del run interrotto
+        entropy = int(checkpoint["run"]["entropy"]) if seed is None else np.random.SeedSequence(seed).entropy
+    else:
+        entropy = np.random.SeedSequence(seed).entropy
+        if seed is None:
+            print(f"Seed generato: {entropy}")
+
+    n_blocks = (n_tickets + block_size - 1) // block_size
+    kwargs = {}
+    if paired:
+        kwargs["paired"] = True
+    if sampler != "random":
+        kwargs["sampler"] = sampler
+    first_block, end_block = shard_blocks(n_blocks, shard) if shard else (0, n_blocks)
+    first_ticket, end_ticket = first_block * block_size, min(end_block * block_size, n_tickets)
+    run_info = {
+        "seed": seed,
+        "entropy": str(entropy),
+        "config_hash": config_hash(base_config_path, ai_config_path),
+        "n_tickets": n_tickets,
+        "block_size": block_size,
+        "blocks": [first_block, end_block],
+        "engine": engine,
+        "paired": paired,
+        "sampler": sampler,
+    }
+    deltas = {"total_cost_eur": RunningMoments(), "total_time_min": RunningMoments()}
+    aggregator = KpiAggregator()
+    next_block = first_block
+    if checkpoint is not None:
+        check_checkpoint(checkpoint_file, checkpoint, run_info)
+        next_block = checkpoint["next_block"]
+        aggregator = KpiAggregator.from_dict(checkpoint["aggregator"])
+        deltas = {key: RunningMoments.from_dict(data) for key, data in checkpoint["deltas"].items()}
+        print(f"Ripresa dal checkpoint {checkpoint_file}: blocco {next_block} di {end_block}")
+
+    tasks = [
+        (engine, (block, n_tickets, base_config, ai_config, entropy, block_size), kwargs, profile)
+        for block in range(next_block, end_block)
+    ]
+    timer = StageTimer(enabled=profile)
+    progress = ThroughputReporter(end_ticket - min(next_block * block_size, end_ticket))
+    last_checkpoint = time.perf_counter()
 
-    print(f"\nSalvato output di {n_tickets} simulazioni in {output_file_human} e {output_file_ai}")
+    with profiled(profile_output), \
+            open_writer(output_file_human, block_size, first_block,
+                        checkpoint["writers"]["human"] if checkpoint else None) as writer_human, \
+            open_writer(output_file_ai, block_size, first_block,
+                        checkpoint["writers"]["ai"] if checkpoint else None) as writer_ai:
+        writers = {"human": writer_human, "ai": writer_ai}
+        for (results_human, results_ai), stages in iter_blocks(tasks, workers):
+            if stages:
+                timer.merge(stages)
+            with timer.stage("serialization"):
+                writer_human.write(*results_human)
+                writer_ai.write(*results_ai)
+            with timer.stage("aggregation"):
+                update_deltas(deltas, results_human[0], results_ai[0])
+                aggregator.update("human", *results_human)
+                aggregator.update("ai", *results_ai)
+            progress.update(len(results_human[0]["ticket_id"]))
+            # i blocchi arrivano in ordine (imap), quindi next_block li copre tutti
+            next_block += 1
+            if checkpoint_file and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                with timer.stage("checkpoint"):
+                    save_checkpoint(checkpoint_file, run_info, next_block, writers, aggregator, deltas)
+                last_checkpoint = time.perf_counter()
+            if stop_file and os.path.exists(stop_file) and next_block < end_block:
+                if checkpoint_file:
+                    save_checkpoint(checkpoint_file, run_info, next_block, writers, aggregator, deltas)
+                break
+    progress.finish()
+    stopped = next_block < end_block
+    if stopped:
+        os.remove(stop_file)
+        print(f"\nRun fermato ({stop_file}) dopo {aggregator.agents['human'].tickets} ticket"
+              + ("; per continuare rilanciare con resume" if checkpoint_file else ""))
+    elif checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    if summary_file:
+        aggregator.results = results_signature(output_file_human, output_file_ai)
+        aggregator.save(summary_file)
+    if manifest_file and not stopped:
+        save_json(dict(
+            run_info,
+            shard=list(shard) if shard else [0, 1],
+            tickets=[first_ticket, end_ticket],
+            outputs={"human": output_file_human, "ai": output_file_ai, "summary": summary_file},
+            deltas={key: moments.to_dict() for key, moments in deltas.items()},
+            created=datetime.now().isoformat(timespec="seconds"),
+        ), manifest_file)
+    if cache_key and not stopped:
+        cache.put(cache_key, output_file_human, output_file_ai, aggregator, {
+            "base_config": base_config_path,
+            "ai_config": ai_config_path,
+            "seed": seed,
+            "n_tickets": n_tickets,
+            "engine": engine,
+            "paired": paired,
+            "sampler": sampler,
+            "deltas": {key: moments.to_dict() for key, moments in deltas.items()},
+        })
+    if profile:
+        # con più worker i tempi degli stage si sommano su tutti i processi
+        print("\nTempo per stage:\n" + timer.report())
+
+    print(f"\nSalvato output di {aggregator.agents['human'].tickets} simulazioni in {output_file_human} e {output_file_ai}")
+
+    summary = {key: moments.summary() for key, moments in deltas.items()}
+    print_delta_summary(summary)
+    return summary
+
+def print_delta_summary(summary):
+    for key, delta in summary.items():
+        print(f"Differenza Human - AI {key}: {delta['mean']:.2f} "
+              f"(IC 95% {delta['ci_low']:.2f} / {delta['ci_high']:.2f}, varianza {delta['variance']:.2f})")
+
+PROFILES = ["junior", "mid", "senior"]
+ADAPTIVE_METRICS = ["total_time_min", "total_cost_eur", "total_errors"]
+
+def update_adaptive_moments(moments, tickets_human, tickets_ai):
+    """
+    Aggiorna, per ogni profilo, le statistiche di tempo, costo ed errori di
+    Human e AI e della differenza di costo Human - AI.
+    """
+    for profile in PROFILES:
+        mask = tickets_human["profile"] == profile
+        for agent, tickets in (("human", tickets_human), ("ai", tickets_ai)):
+            for metric in ADAPTIVE_METRICS:
+                moments[f"{agent}/{profile}/{metric}"].update(tickets[metric][mask])
+        moments[f"delta/{profile}/total_cost_eur"].update(
+            tickets_human["total_cost_eur"][mask] - tickets_ai["total_cost_eur"][mask]
+        )
+
+def is_converged(moments, rel_precision, z, abs_precision=0.01, min_count=30):
+    """
+    True se per ogni gruppo la semi-ampiezza dell'intervallo di confidenza è
+    entro rel_precision * |media| (o entro abs_precision, per medie vicine a
+    zero come gli errori dei profili senior) e il gruppo ha almeno
+    min_count ticket.
+    """
+    for m in moments.values():
+        if m.count < min_count:
+            return False
+        if m.half_width(z) > max(rel_precision * abs(m.mean), abs_precision):
+            return False
+    return True
+
+def simulate_adaptive(base_config_path, ai_config_path, rel_precision=0.01, confidence=0.95,
+                      max_tickets=1_000_000, max_seconds=None, seed=None, workers=1,
+                      block_size=TICKETS_PER_BLOCK, output_file_human=None, output_file_ai=None,
+                      summary_file=None):
+    """
+    Simulazione sequenziale (motore batch, numeri casuali comuni): simula un
+    blocco alla volta e si ferma quando, per ogni profilo, tempo medio,
+    costo medio, errori medi di Human e AI e differenza di costo Human - AI
+    hanno raggiunto la precisione relativa richiesta al livello di confidenza
+    dato, oppure quando finisce il budget (max_tickets o max_seconds).
+    I blocchi sono valutati in ordine, quindi a parità di seed il punto di
+    arresto non dipende dal numero di worker.
+    Con summary_file salva il riepilogo KPI dei ticket simulati, come simulate_tickets.
+    """
+    base_cc, ai_cc = load_configs(base_config_path, ai_config_path, "batch")
+    entropy = np.random.SeedSequence(seed).entropy
+    if seed is None:
+        print(f"Seed generato: {entropy}")
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    n_blocks = (max_tickets + block_size - 1) // block_size
+    tasks = (
+        ("batch", (block, max_tickets, base_cc, ai_cc, entropy, block_size), {"paired": True}, False)
+        for block in range(n_blocks)
+    )
+    moments = {
+        f"{agent}/{profile}/{metric}": RunningMoments()
+        for agent in ("human", "ai") for profile in PROFILES for metric in ADAPTIVE_METRICS
+    }
+    moments.update({f"delta/{profile}/total_cost_eur": RunningMoments() for profile in PROFILES})
+    aggregator = KpiAggregator()
+
+    writer_human = open_writer(output_file_human, block_size) if output_file_human else None
+    writer_ai = open_writer(output_file_ai, block_size) if output_file_ai else None
+    started = time.perf_counter()
+    n_done = 0
+    converged = False
+    try:
+        for (results_human, results_ai), _ in iter_blocks(tasks, workers):
+            if writer_human:
+                writer_human.write(*results_human)
+            if writer_ai:
+                writer_ai.write(*results_ai)
+            update_adaptive_moments(moments, results_human[0], results_ai[0])
+            if summary_file:
+                aggregator.update("human", *results_human)
+                aggregator.update("ai", *results_ai)
+            n_done += len(results_human[0]["ticket_id"])
+            converged = is_converged(moments, rel_precision, z)
+            if converged or (max_seconds is not None and time.perf_counter() - started > max_seconds):
+                break
+    finally:
+        for writer in (writer_human, writer_ai):
+            if writer:
+                writer.close()
+
+    if summary_file:
+        if output_file_human and output_file_ai:
+            aggregator.results = results_signature(output_file_human, output_file_ai)
+        aggregator.save(summary_file)
+
+    status = "precisione raggiunta" if converged else "budget esaurito"
+    print(f"Simulazione adattiva: {n_done} ticket, {status}")
+    return {
+        "n_tickets": n_done,
+        "converged": converged,
+        "groups": {key: m.summary(z) for key, m in moments.items()},
+    }
 
 if __name__ == "__main__":
-    n_tickets = 10000
+    parser = argparse.ArgumentParser(description="Simulazione ticket Human vs AI")
+    parser.add_argument("--n-tickets", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None, help="seed del run (default: casuale)")
+    parser.add_argument("--workers", type=int, default=1, help="processi in parallelo")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=None,
+                        help="scalar (predefinito): loop per ticket (riferimento); batch: motori vettoriali")
+    parser.add_argument("--paired", action="store_true",
+                        help="numeri casuali comuni tra Human e AI (richiede --engine batch)")
+    parser.add_argument("--sampler", choices=SAMPLERS, default="random",
+                        help="campionamento di ritardo, stress, parole e variazione ambientale "
+                             "(lhs/sobol/halton stratificati; richiede --engine batch)")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="I/N",
+                        help="simula solo lo shard I di N (richiede --seed); unire con merge_shards.py")
+    parser.add_argument("--checkpoint-interval", type=float, default=60.0,
+                        help="secondi tra due checkpoint del run (0: a ogni blocco)")
+    parser.add_argument("--resume", action="store_true",
+                        help="riprende un run interrotto dall'ultimo checkpoint")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="non usa la cache dei risultati (.result_cache) nemmeno con --seed")
+    parser.add_argument("--cache-max-gb", type=float, default=10.0, help="dimensione massima della cache dei risultati")
+    parser.add_argument("--precision", type=float, default=None,
+                        help="modalità adattiva: precisione relativa degli IC 95%% (es. 0.01); "
+                             "--n-tickets diventa il budget massimo")
+    parser.add_argument("--max-seconds", type=float, default=None, help="budget di tempo della modalità adattiva")
+    parser.add_argument("--profile", action="store_true",
+                        help="misura e stampa il tempo di ogni stage della simulazione")
+    parser.add_argument("--profile-output", default=None,
+                        help="salva il profilo cProfile del run (.prof) o di pyinstrument (.html)")
+    args = parser.parse_args()
+    if args.precision is not None:
+        # la modalità adattiva usa sempre il motore batch con numeri casuali comuni e non
+        # supporta le altre opzioni di simulate_tickets: meglio un errore che opzioni ignorate
+        unsupported = [flag for flag, used in (
+            ("--engine scalar", args.engine == "scalar"),
+            ("--sampler", args.sampler != "random"),
+            ("--shard", args.shard is not None),
+            ("--resume", args.resume),
+            ("--checkpoint-interval", args.checkpoint_interval != parser.get_default("checkpoint_interval")),
+            ("--no-cache", args.no_cache),
+            ("--cache-max-gb", args.cache_max_gb != parser.get_default("cache_max_gb")),
+            ("--profile", args.profile),
+            ("--profile-output", args.profile_output is not None),
+        ) if used]
+        if unsupported:
+            parser.error(f"--precision non supporta {', '.join(unsupported)}")
+    elif args.max_seconds is not None:
+        parser.error("--max-seconds richiede --precision")
+
     base_config_path = "config.yaml"
     ai_config_path = "config-ai.yaml"
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    output_file_human = f"simulation_results-human.json"
-    output_file_ai = f"simulation_results-ai.json"
+    output_file_human = f"simulation_results-human"
+    output_file_ai = f"simulation_results-ai"
+    summary_file = "simulation_summary.json"
+    manifest_file = None
+    checkpoint_file = "simulation_checkpoint.json"
+    if args.shard:
+        shard_dir = os.path.join(SHARDS_DIR, "shard-{:03d}-of-{:03d}".format(*args.shard))
+        os.makedirs(shard_dir, exist_ok=True)
+        output_file_human = os.path.join(shard_dir, "human")
+        output_file_ai = os.path.join(shard_dir, "ai")
+        summary_file = os.path.join(shard_dir, "summary.json")
+        manifest_file = os.path.join(shard_dir, "manifest.json")
+        checkpoint_file = os.path.join(shard_dir, "checkpoint.json")
+    if args.resume and not os.path.exists(checkpoint_file):
+        parser.error(f"--resume: nessun checkpoint da riprendere in {checkpoint_file}")
 
-    simulate_tickets(n_tickets, base_config_path, ai_config_path, output_file_human, output_file_ai)
\ No newline at end of file
+    if args.precision is not None:
+        simulate_adaptive(base_config_path, ai_config_path, rel_precision=args.precision,
+                          max_tickets=args.n_tickets, max_seconds=args.max_seconds, seed=args.seed,
+                          workers=args.workers, output_file_human=output_file_human,
+                          output_file_ai=output_file_ai, summary_file=summary_file)
+    else:
+        simulate_tickets(args.n_tickets, base_config_path, ai_config_path, output_file_human, output_file_ai,
+                         seed=args.seed, workers=args.workers, engine=args.engine or "scalar",
+                         paired=args.paired, summary_file=summary_file, profile=args.profile,
+                         profile_output=args.profile_output, sampler=args.sampler, shard=args.shard,
+                         manifest_file=manifest_file, checkpoint_file=checkpoint_file,
+                         checkpoint_interval=args.checkpoint_interval, resume=args.resume, stop_file=STOP_FILE,
+                         cache=None if args.no_cache else ResultCache(max_bytes=int(args.cache_max_gb * 1024 ** 3)))
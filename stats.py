@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Media e varianza in streaming (Welford) di una grandezza, aggiornabili a
+    blocchi di valori e unibili tra loro (formula di Chan et al.): due istanze
+    calcolate su shard diversi si combinano come se i dati fossero uno solo.
+    """
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values):
+            mean = float(values.mean())
+            self._combine(len(values), mean, float(((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std_error(self):
+        return math.sqrt(self.variance / self.count) if self.count > 1 else float("inf")
+
+    def half_width(self, z=1.96):
+        """Semi-ampiezza dell'intervallo di confidenza della media."""
+        return z * self.std_error
+
+    def summary(self, z=1.96):
+        return {
+            "n": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "std_error": self.std_error,
+            "ci_low": self.mean - self.half_width(z),
+            "ci_high": self.mean + self.half_width(z),
+        }
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["count"], data["mean"], data["m2"])
@@ -0,0 +1,281 @@
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+import yaml
+
+from aggregator import KpiAggregator
+from cognitiveagent.params import compile_config
+from simulate import TICKETS_PER_BLOCK, iter_blocks
+
+
+CACHE_DIR = ".sweep_cache"
+# da incrementare quando cambia il modello: invalida gli scenari in cache
+CACHE_VERSION = 1
+
+OUTPUT_METRICS = ["total_cost_eur", "total_time_min"]
+
+
+def parse_value(text):
+    """Valore di un override scritto da riga di comando (sintassi YAML)."""
+    return yaml.safe_load(text)
+
+
+def apply_overrides(base_config, ai_config, overrides):
+    """
+    Copie di base_config e ai_config con gli override applicati. Le chiavi
+    sono percorsi puntati preceduti dalla config da modificare, es.
+    'base.profiles.junior.error_rate' o 'ai.ai_agent.retrieval_latency_sec'.
+    Il percorso deve esistere, così un errore di battitura non passa
+    inosservato.
+    """
+    configs = {"base": copy.deepcopy(base_config), "ai": copy.deepcopy(ai_config)}
+    for key, value in overrides.items():
+        target, *path = key.split(".")
+        if target not in configs or not path:
+            raise KeyError(f"override {key}: la chiave deve iniziare con 'base.' o 'ai.'")
+        node = configs[target]
+        for part in path[:-1]:
+            node = node[part]
+        if path[-1] not in node:
+            raise KeyError(f"override {key}: chiave inesistente")
+        node[path[-1]] = value
+    return configs["base"], configs["ai"]
+
+
+def get_value(base_config, ai_config, key):
+    target, *path = key.split(".")
+    node = {"base": base_config, "ai": ai_config}[target]
+    for part in path:
+        node = node[part]
+    return node
+
+
+def normalized_numbers(value):
+    """
+    Copia di una config con i numeri come float: 1 e 1.0 danno la stessa
+    simulazione, quindi devono dare la stessa chiave (i bool restano bool).
+    """
+    if isinstance(value, dict):
+        return {k: normalized_numbers(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalized_numbers(v) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def scenario_key(base_config, ai_config, seed, n_tickets, engine="batch", block_size=TICKETS_PER_BLOCK):
+    """Hash delle config risolte (numeri normalizzati), del seed e del numero di ticket."""
+    payload = json.dumps({
+        "version": CACHE_VERSION,
+        "base": normalized_numbers(base_config),
+        "ai": normalized_numbers(ai_config),
+        "seed": seed,
+        "n_tickets": n_tickets,
+        "engine": engine,
+        "block_size": block_size,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def run_scenario(base_config, ai_config, n_tickets, seed, workers=1, engine="batch", block_size=TICKETS_PER_BLOCK):
+    """Simula uno scenario e restituisce il KpiAggregator dei risultati."""
+    if engine == "batch":
+        base_config, ai_config = compile_config(base_config), compile_config(ai_config)
+    entropy = np.random.SeedSequence(seed).entropy
+    n_blocks = (n_tickets + block_size - 1) // block_size
+    tasks = [
+        (engine, (block, n_tickets, base_config, ai_config, entropy, block_size), {}, False)
+        for block in range(n_blocks)
+    ]
+    aggregator = KpiAggregator()
+    for (results_human, results_ai), _ in iter_blocks(tasks, workers):
+        aggregator.update("human", *results_human)
+        aggregator.update("ai", *results_ai)
+    return aggregator
+
+
+def scenario_metrics(aggregator):
+    """Medie per ticket di costo e tempo di Human e AI e loro differenza."""
+    metrics = {}
+    for metric in OUTPUT_METRICS:
+        human = aggregator.agents["human"].moments[metric].mean
+        ai = aggregator.agents["ai"].moments[metric].mean
+        metrics[f"human/{metric}"] = human
+        metrics[f"ai/{metric}"] = ai
+        metrics[f"delta/{metric}"] = human - ai
+    return metrics
+
+
+class ScenarioCache:
+    """
+    Cache su disco degli scenari già simulati: un file JSON per scenario,
+    con nome l'hash di (config, seed, n_tickets), che contiene gli override,
+    le metriche e lo stato del KpiAggregator.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key, entry):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+
+class Sweep:
+    """
+    Esegue scenari (insiemi di override sulle config) riusando la cache:
+    uno scenario già calcolato con le stesse config, seed e numero di ticket
+    non viene mai ri-simulato, nemmeno se compare più volte nello stesso
+    sweep. A parità di seed gli scenari usano gli stessi stream casuali,
+    quindi le differenze tra scenari hanno poco rumore.
+    """
+
+    def __init__(self, base_config_path="config.yaml", ai_config_path="config-ai.yaml", n_tickets=10000,
+                 seed=0, workers=1, engine="batch", cache_dir=CACHE_DIR):
+        with open(base_config_path, "r", encoding="utf-8") as f:
+            self.base_config = yaml.safe_load(f)
+        with open(ai_config_path, "r", encoding="utf-8") as f:
+            self.ai_config = yaml.safe_load(f)
+        self.n_tickets = n_tickets
+        self.seed = seed
+        self.workers = workers
+        self.engine = engine
+        self.cache = ScenarioCache(cache_dir)
+        self.simulated = 0
+
+    def run(self, overrides):
+        """Metriche dello scenario definito da overrides (dal disco se già calcolato)."""
+        base_config, ai_config = apply_overrides(self.base_config, self.ai_config, overrides)
+        key = scenario_key(base_config, ai_config, self.seed, self.n_tickets, self.engine)
+        entry = self.cache.get(key)
+        if entry is None:
+            aggregator = run_scenario(base_config, ai_config, self.n_tickets, self.seed, self.workers, self.engine)
+            entry = {
+                "overrides": overrides,
+                "seed": self.seed,
+                "n_tickets": self.n_tickets,
+                "engine": self.engine,
+                "metrics": scenario_metrics(aggregator),
+                "aggregator": aggregator.to_dict(),
+            }
+            self.cache.put(key, entry)
+            self.simulated += 1
+        return entry["metrics"]
+
+    def grid(self, values):
+        """
+        Prodotto cartesiano degli override: values è {chiave: [valori]}.
+        Restituisce una lista di (override, metriche).
+        """
+        keys = list(values)
+        scenarios = [dict(zip(keys, combo)) for combo in itertools.product(*(values[k] for k in keys))]
+        return [(overrides, self.run(overrides)) for overrides in scenarios]
+
+    def tornado(self, ranges):
+        """
+        Sensibilità one-at-a-time: ranges è {chiave: (basso, alto)}. Ogni
+        parametro è portato al valore basso e alto tenendo gli altri al
+        valore di base. Restituisce le metriche di base e, per chiave, le
+        metriche ai due estremi, ordinate per ampiezza dell'effetto sul
+        costo per ticket della differenza Human - AI.
+        """
+        baseline = self.run({})
+        rows = []
+        for key, (low, high) in ranges.items():
+            rows.append({
+                "key": key,
+                "low_value": low,
+                "high_value": high,
+                "low": self.run({key: low}),
+                "high": self.run({key: high}),
+            })
+        rows.sort(key=lambda r: -abs(r["high"]["delta/total_cost_eur"] - r["low"]["delta/total_cost_eur"]))
+        return baseline, rows
+
+    def relative_ranges(self, keys, low_factor=0.8, high_factor=1.2):
+        """Estremi del tornado come multipli del valore di base di ogni chiave."""
+        return {
+            key: (get_value(self.base_config, self.ai_config, key) * low_factor,
+                  get_value(self.base_config, self.ai_config, key) * high_factor)
+            for key in keys
+        }
+
+
+def format_grid(results):
+    keys = list(results[0][0]) if results else []
+    metrics = list(results[0][1]) if results else []
+    lines = ["".join(f"{k:>36}" for k in keys) + "".join(f"{m:>24}" for m in metrics)]
+    for overrides, values in results:
+        lines.append("".join(f"{str(overrides[k]):>36}" for k in keys)
+                     + "".join(f"{values[m]:>24.2f}" for m in metrics))
+    return "\n".join(lines)
+
+
+def format_tornado(baseline, rows):
+    width = max([len(r["key"]) for r in rows] + [10]) + 2
+    lines = []
+    for metric in OUTPUT_METRICS:
+        for agent in ("human", "ai", "delta"):
+            name = f"{agent}/{metric}"
+            lines.append(f"\n{name} (base {baseline[name]:.2f})")
+            lines.append(f"{'parametro':<{width}}{'basso':>12}{'alto':>12}{'effetto basso':>16}{'effetto alto':>16}")
+            for r in sorted(rows, key=lambda r: -abs(r["high"][name] - r["low"][name])):
+                lines.append(
+                    f"{r['key']:<{width}}{r['low_value']:>12.4g}{r['high_value']:>12.4g}"
+                    f"{r['low'][name] - baseline[name]:>+16.2f}{r['high'][name] - baseline[name]:>+16.2f}"
+                )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep di parametri e analisi di sensibilità")
+    parser.add_argument("--grid", nargs="+", metavar="CHIAVE=V1,V2",
+                        help="griglia di override, es. ai.ai_agent.retrieval_latency_sec=1,2,4")
+    parser.add_argument("--tornado", nargs="+", metavar="CHIAVE[=BASSO,ALTO]",
+                        help="parametri del tornado; senza valori usa --low/--high per il valore di base")
+    parser.add_argument("--low", type=float, default=0.8)
+    parser.add_argument("--high", type=float, default=1.2)
+    parser.add_argument("--n-tickets", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--engine", choices=["scalar", "batch"], default="batch")
+    args = parser.parse_args()
+
+    sweep = Sweep(n_tickets=args.n_tickets, seed=args.seed, workers=args.workers, engine=args.engine)
+    if args.grid:
+        values = {}
+        for item in args.grid:
+            key, _, text = item.partition("=")
+            values[key] = [parse_value(v) for v in text.split(",")]
+        print(format_grid(sweep.grid(values)))
+    if args.tornado:
+        ranges = {}
+        for item in args.tornado:
+            key, sep, text = item.partition("=")
+            if sep:
+                low, high = (parse_value(v) for v in text.split(","))
+                ranges[key] = (low, high)
+            else:
+                ranges.update(sweep.relative_ranges([key], args.low, args.high))
+        print(format_tornado(*sweep.tornado(ranges)))
+    print(f"\nScenari simulati: {sweep.simulated} (gli altri dalla cache {CACHE_DIR})")
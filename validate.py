@@ -0,0 +1,193 @@
+import argparse
+import math
+import sys
+
+import numpy as np
+
+from results_io import concat_columns
+from simulate import PROFILES, iter_blocks, load_configs, TICKETS_PER_BLOCK
+
+
+METRICS = ["total_time_min", "total_cost_eur", "total_errors", "total_hallucinations", "memory_overload"]
+
+# motori confrontabili con il riferimento "scalar": nome -> (engine, kwargs)
+CANDIDATES = {
+    "scalar": ("scalar", {}),
+    "batch": ("batch", {}),
+    "batch-paired": ("batch", {"paired": True}),
+    "batch-lhs": ("batch", {"sampler": "lhs"}),
+    "batch-sobol": ("batch", {"sampler": "sobol"}),
+    "batch-halton": ("batch", {"sampler": "halton"}),
+}
+
+# tolleranze predefinite: differenze sotto queste soglie passano anche se
+# statisticamente significative (con molti ticket qualunque scarto lo è)
+KS_TOLERANCE = 0.02
+MEAN_TOLERANCE = 0.01
+STD_TOLERANCE = 0.03
+
+
+def run_engine(name, n_tickets, base_config_path, ai_config_path, seed, workers=1, block_size=TICKETS_PER_BLOCK):
+    """
+    Simula n_tickets con il motore `name` e restituisce le tabelle dei ticket
+    di Human e AI, con in più il numero di documenti in memory overload per
+    ticket (colonna memory_overload).
+    """
+    engine, kwargs = CANDIDATES[name]
+    base_config, ai_config = load_configs(base_config_path, ai_config_path, engine)
+    entropy = np.random.SeedSequence(seed).entropy
+    n_blocks = (n_tickets + block_size - 1) // block_size
+    tasks = [
+        (engine, (block, n_tickets, base_config, ai_config, entropy, block_size), kwargs, False)
+        for block in range(n_blocks)
+    ]
+    blocks = {"human": [], "ai": []}
+    for results, _ in iter_blocks(tasks, workers):
+        for agent, (tickets, documents) in zip(("human", "ai"), results):
+            first = tickets["ticket_id"][0]
+            tickets["memory_overload"] = np.bincount(
+                documents["ticket_id"] - first, weights=documents["memory_overload"],
+                minlength=len(tickets["ticket_id"]),
+            )
+            blocks[agent].append(tickets)
+    return {agent: concat_columns(tables) for agent, tables in blocks.items()}
+
+
+def ks_2samp(a, b):
+    """
+    Test di Kolmogorov-Smirnov a due campioni: statistica D e p-value
+    asintotico (distribuzione di Kolmogorov).
+    """
+    a = np.sort(np.asarray(a, dtype=float))
+    b = np.sort(np.asarray(b, dtype=float))
+    values = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, values, side="right") / len(a)
+    cdf_b = np.searchsorted(b, values, side="right") / len(b)
+    d = float(np.max(np.abs(cdf_a - cdf_b)))
+    n_eff = len(a) * len(b) / (len(a) + len(b))
+    lam = (math.sqrt(n_eff) + 0.12 + 0.11 / math.sqrt(n_eff)) * d
+    if lam < 1e-3:
+        return d, 1.0
+    k = np.arange(1, 101)
+    p = float(2 * np.sum((-1) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2)))
+    return d, min(max(p, 0.0), 1.0)
+
+
+def _two_sided_p(z):
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def _moments(x):
+    x = np.asarray(x, dtype=float)
+    mean = float(x.mean())
+    var = float(x.var(ddof=1))
+    m4 = float(np.mean((x - mean) ** 4))
+    return mean, var, m4
+
+
+def compare_samples(reference, candidate, alpha, ks_tolerance=KS_TOLERANCE,
+                    mean_tolerance=MEAN_TOLERANCE, std_tolerance=STD_TOLERANCE):
+    """
+    Confronta due campioni con il test KS e con test asintotici su media e
+    varianza. Ogni test fallisce solo se la differenza è significativa al
+    livello alpha e più grande della tolleranza (D per il KS, relativa per
+    media e deviazione standard).
+    """
+    n_ref, n_cand = len(reference), len(candidate)
+    d, p_ks = ks_2samp(reference, candidate)
+    mean_ref, var_ref, m4_ref = _moments(reference)
+    mean_cand, var_cand, m4_cand = _moments(candidate)
+
+    se_mean = math.sqrt(var_ref / n_ref + var_cand / n_cand)
+    p_mean = _two_sided_p((mean_cand - mean_ref) / se_mean) if se_mean > 0 else float(mean_cand == mean_ref)
+    # varianza asintotica della varianza campionaria: (m4 - s^4) / n
+    se_var = math.sqrt(max(m4_ref - var_ref ** 2, 0) / n_ref + max(m4_cand - var_cand ** 2, 0) / n_cand)
+    p_var = _two_sided_p((var_cand - var_ref) / se_var) if se_var > 0 else float(var_cand == var_ref)
+
+    std_ref, std_cand = math.sqrt(var_ref), math.sqrt(var_cand)
+    scale = max(abs(mean_ref), 1e-9)
+    return {
+        "n_reference": n_ref,
+        "n_candidate": n_cand,
+        "ks_statistic": d,
+        "ks_pvalue": p_ks,
+        "ks_pass": p_ks >= alpha or d <= ks_tolerance,
+        "mean_reference": mean_ref,
+        "mean_candidate": mean_cand,
+        "mean_pvalue": p_mean,
+        "mean_pass": p_mean >= alpha or abs(mean_cand - mean_ref) <= mean_tolerance * scale,
+        "std_reference": std_ref,
+        "std_candidate": std_cand,
+        "std_pvalue": p_var,
+        "std_pass": p_var >= alpha or abs(std_cand - std_ref) <= std_tolerance * max(std_ref, 1e-9),
+    }
+
+
+def validate(candidate, base_config_path="config.yaml", ai_config_path="config-ai.yaml", n_tickets=20000,
+             seed=0, workers=1, alpha=0.01, ks_tolerance=KS_TOLERANCE, mean_tolerance=MEAN_TOLERANCE,
+             std_tolerance=STD_TOLERANCE):
+    """
+    Esegue il motore di riferimento ("scalar") e il motore candidato sulle
+    stesse config e confronta, per agente, profilo e metrica, le
+    distribuzioni di tempo, costo, errori, allucinazioni e memory overload.
+    I due run usano seed diversi, così i campioni sono indipendenti.
+    alpha è corretto con Bonferroni sul numero di confronti.
+    Restituisce la lista dei confronti e True se tutti passano.
+    """
+    reference = run_engine("scalar", n_tickets, base_config_path, ai_config_path, seed, workers)
+    candidate_run = run_engine(candidate, n_tickets, base_config_path, ai_config_path, seed + 1, workers)
+
+    groups = [
+        (agent, profile, metric)
+        for agent in ("human", "ai") for profile in PROFILES for metric in METRICS
+        if metric in reference[agent] and metric in candidate_run[agent]
+    ]
+    corrected_alpha = alpha / (3 * len(groups))
+    comparisons = []
+    for agent, profile, metric in groups:
+        ref = reference[agent][metric][reference[agent]["profile"] == profile]
+        cand = candidate_run[agent][metric][candidate_run[agent]["profile"] == profile]
+        if len(ref) < 2 or len(cand) < 2:
+            continue
+        result = compare_samples(ref, cand, corrected_alpha, ks_tolerance, mean_tolerance, std_tolerance)
+        result.update({"agent": agent, "profile": profile, "metric": metric})
+        result["passed"] = result["ks_pass"] and result["mean_pass"] and result["std_pass"]
+        comparisons.append(result)
+    return comparisons, all(c["passed"] for c in comparisons)
+
+
+def format_report(comparisons):
+    def flag(ok):
+        return "ok" if ok else "FAIL"
+
+    lines = [f"{'agente':<7}{'profilo':<8}{'metrica':<22}{'KS D':>8}{'p':>9}{'':>6}"
+             f"{'media rif/cand':>24}{'':>6}{'std rif/cand':>22}{'':>6}"]
+    for c in comparisons:
+        lines.append(
+            f"{c['agent']:<7}{c['profile']:<8}{c['metric']:<22}{c['ks_statistic']:>8.4f}{c['ks_pvalue']:>9.3g}"
+            f"{flag(c['ks_pass']):>6}{c['mean_reference']:>12.3f}{c['mean_candidate']:>12.3f}{flag(c['mean_pass']):>6}"
+            f"{c['std_reference']:>11.3f}{c['std_candidate']:>11.3f}{flag(c['std_pass']):>6}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equivalenza statistica di un motore rispetto al riferimento scalar")
+    parser.add_argument("--candidate", choices=sorted(CANDIDATES), default="batch")
+    parser.add_argument("--n-tickets", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--alpha", type=float, default=0.01, help="livello complessivo (corretto con Bonferroni)")
+    parser.add_argument("--ks-tolerance", type=float, default=KS_TOLERANCE)
+    parser.add_argument("--mean-tolerance", type=float, default=MEAN_TOLERANCE, help="tolleranza relativa sulla media")
+    parser.add_argument("--std-tolerance", type=float, default=STD_TOLERANCE,
+                        help="tolleranza relativa sulla deviazione standard")
+    args = parser.parse_args()
+
+    comparisons, passed = validate(args.candidate, n_tickets=args.n_tickets, seed=args.seed, workers=args.workers,
+                                   alpha=args.alpha, ks_tolerance=args.ks_tolerance,
+                                   mean_tolerance=args.mean_tolerance, std_tolerance=args.std_tolerance)
+    print(format_report(comparisons))
+    failed = sum(not c["passed"] for c in comparisons)
+    print(f"\n{args.candidate}: {'PASS' if passed else 'FAIL'} ({len(comparisons) - failed}/{len(comparisons)} confronti)")
+    sys.exit(0 if passed else 1)